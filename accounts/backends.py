@@ -0,0 +1,19 @@
+from allauth.account.auth_backends import AuthenticationBackend
+from django.contrib.auth.backends import ModelBackend
+
+from . import user_cache
+
+
+class CachedUserMixin:
+    # ログイン中のリクエストごとのユーザーの読み込みをキャッシュから行う
+    def get_user(self, user_id):
+        user = user_cache.get_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+class CachedModelBackend(CachedUserMixin, ModelBackend):
+    pass
+
+
+class CachedAuthenticationBackend(CachedUserMixin, AuthenticationBackend):
+    pass
@@ -0,0 +1,21 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+
+# キャッシュを使うバックエンドに切り替える前のセッションに入っているパス
+LEGACY_BACKENDS = {
+    "django.contrib.auth.backends.ModelBackend": "accounts.backends.CachedModelBackend",
+    "allauth.account.auth_backends.AuthenticationBackend": "accounts.backends.CachedAuthenticationBackend",
+}
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware と同じく request.user を遅延して読み込む。
+
+    切り替え前のセッションはバックエンドのパスを書き換えて、ログインを維持したままキャッシュを使う。
+    """
+
+    def process_request(self, request):
+        backend_path = request.session.get(BACKEND_SESSION_KEY)
+        if backend_path in LEGACY_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = LEGACY_BACKENDS[backend_path]
+        super().process_request(request)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('main', '0006_point_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='point',
+        ),
+    ]
@@ -2,16 +2,27 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.templatetags.static import static
 
+from . import user_cache
+
 
 class User(AbstractUser):
     icon = models.ImageField(
         upload_to="user_icon/",
         blank=True,
     )
-    point = models.IntegerField(default=0)
     profile = models.TextField(max_length=500, blank=True)
 
     def icon_url(self):
         if self.icon:
             return self.icon.url
-        return static("main/img/default-user_icon.png")
\ No newline at end of file
+        return static("main/img/default-user_icon.png")
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        user_cache.changed(self.pk)
+
+    def delete(self, *args, **kwargs):
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        user_cache.changed(user_id)
+        return result
\ No newline at end of file
@@ -1,3 +1,150 @@
+from pathlib import Path
+
+from allauth.account.models import EmailAddress
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.test import TestCase
+from django.urls import reverse
+
+from main import account_deletion
+from main.testing import PERFORMANCE_SETTINGS, Case, ViewPerformanceMixin
+
+from . import user_cache
+
+User = get_user_model()
+
+BASELINE_FILE = Path(__file__).resolve().parent / "perf_baselines.json"
+
+
+def add_users(size, start=0):
+    users = User.objects.bulk_create(
+        User(username=f"user{i}", email=f"user{i}@example.com")
+        for i in range(start, start + size)
+    )
+    EmailAddress.objects.bulk_create(
+        EmailAddress(user=user, email=user.email, primary=True, verified=True)
+        for user in users
+    )
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pw-xyz-123")
+        EmailAddress.objects.create(
+            user=self.user, email=self.user.email, primary=True, verified=True
+        )
+        self.client.force_login(self.user)
+
+    def version(self):
+        return user_cache._version(user_cache._cache(), self.user.pk)
+
+    def test_version_is_bumped_after_commit(self):
+        changes = [
+            ("profile", lambda user: setattr(user, "profile", "よろしく")),
+            ("email", lambda user: setattr(user, "email", "new@example.com")),
+            ("password", lambda user: user.set_password("pw-abc-456")),
+            ("is_active", lambda user: setattr(user, "is_active", False)),
+        ]
+        for field, change in changes:
+            with self.subTest(field=field):
+                user = user_cache.get_user(self.user.pk)
+                before = self.version()
+                with self.captureOnCommitCallbacks() as callbacks:
+                    change(user)
+                    user.save()
+                    # コミットされるまでは古い版のまま
+                    self.assertEqual(self.version(), before)
+                for callback in callbacks:
+                    callback()
+                self.assertGreater(self.version(), before)
+                self.assertEqual(
+                    getattr(user_cache.get_user(self.user.pk), field),
+                    getattr(user, field),
+                )
+
+    def test_email_change_is_shown_on_the_next_request(self):
+        url = reverse("account_email_change")
+        self.assertContains(self.client.get(url), "buyer@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"email": "new@example.com"})
+        self.assertContains(self.client.get(url), "new@example.com")
+
+    def test_password_change_logs_out_other_sessions(self):
+        other = self.client_class()
+        other.force_login(self.user)
+        url = reverse("main:notification")
+        self.assertEqual(other.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("change_password"),
+                {
+                    "oldpassword": "pw-xyz-123",
+                    "password1": "pw-abc-456",
+                    "password2": "pw-abc-456",
+                },
+            )
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(other.get(url).status_code, 302)
+
+    def test_deactivated_user_is_logged_out(self):
+        url = reverse("main:notification")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            account_deletion.request_deletion(User.objects.get(pk=self.user.pk))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(user_cache.get_user(self.user.pk).is_active)
+
+
+@PERFORMANCE_SETTINGS
+class AccountViewPerformanceTests(ViewPerformanceMixin, TestCase):
+    baseline_file = BASELINE_FILE
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("buyer", "buyer@example.com", "pw-xyz-123")
+        EmailAddress.objects.create(
+            user=cls.user, email=cls.user.email, primary=True, verified=True
+        )
+        add_users(20)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def grow(self):
+        add_users(100, start=20)
+
+    def cases(self):
+        return [
+            Case("account_email_change", reverse("account_email_change"), 1),
+            Case(
+                "account_email_change:post",
+                reverse("account_email_change"),
+                3,
+                method="POST",
+                data={"email": "new@example.com"},
+                status=302,
+            ),
+            Case("account_email_change_done", reverse("account_email_change_done"), 1),
+            Case("change_password", reverse("change_password"), 1),
+        ]
+
+
+@PERFORMANCE_SETTINGS
+class AnonymousAccountViewPerformanceTests(ViewPerformanceMixin, TestCase):
+    baseline_file = BASELINE_FILE
+
+    @classmethod
+    def setUpTestData(cls):
+        add_users(20)
+
+    def grow(self):
+        add_users(100, start=20)
 
-# Create your tests here.
+    def cases(self):
+        return [
+            Case("signup", reverse("signup"), 0),
+        ]
@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+
+# ヘッダーなどでは使わず、読み込むと重いフィールド
+DEFERRED_FIELDS = ["profile"]
+
+
+def _cache():
+    return caches[settings.USER_CACHE]
+
+
+def _version_key(user_id):
+    return f"user:version:{user_id}"
+
+
+def _version(cache, user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # キャッシュから消えたときに古い版番号と重ならないよう、時刻から始める
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def get_user(user_id):
+    """ユーザーを読み込む。profile を除いたものを版番号つきでキャッシュする。
+
+    存在しないユーザーは None を返す。
+    """
+    cache = _cache()
+    # 読み込みより先に版番号を取るので、途中で変更されても古い内容は新しい版に残らない
+    key = f"user:{user_id}:{_version(cache, user_id)}"
+    user = cache.get(key)
+    if user is None:
+        User = get_user_model()
+        try:
+            user = User._default_manager.defer(*DEFERRED_FIELDS).get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        cache.set(key, user, settings.USER_CACHE_TTL)
+    return user
+
+
+def changed(user_id):
+    # コミット前に版を上げると、他のリクエストが古い行を新しい版でキャッシュしてしまう
+    def bump():
+        cache = _cache()
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), time.time_ns(), None)
+
+    transaction.on_commit(bump)
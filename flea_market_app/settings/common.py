@@ -56,18 +56,22 @@ INSTALLED_APPS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    "django.contrib.auth.backends.ModelBackend",
-    "allauth.account.auth_backends.AuthenticationBackend",
+    # ログイン中のユーザーをキャッシュから読み込む ModelBackend と allauth のバックエンド
+    "accounts.backends.CachedModelBackend",
+    "accounts.backends.CachedAuthenticationBackend",
 ]
 
 SITE_ID = 1 # django.contrib.sites を使用するために必要
 
 MIDDLEWARE = [
+    "main.profiling.SamplingProfilerMiddleware", # 一部のリクエストをサンプリングで計測する
     'django.middleware.security.SecurityMiddleware',
+    "main.load_shedding.LoadSheddingMiddleware", # 混雑時に優先度の低い URL を 503 で断る
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "accounts.middleware.CachedAuthenticationMiddleware", # AuthenticationMiddleware の代わり
+    "main.ratelimit.RateLimitMiddleware", # URL ごとのリクエスト数制限
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
@@ -105,6 +109,8 @@ DATABASES = {
     }
 }
 
+SQLITE_PRAGMAS = {} # 接続ごとに実行する PRAGMA (production.py で設定する)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -158,6 +164,12 @@ ACCOUNT_FORMS = {
 }
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend" # ターミナル上にメールを表示するための設定
+SPOOLED_EMAIL_BACKEND = os.getenv(
+    "SPOOLED_EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend"
+) # send_spooled_mail が実際の送信に使うバックエンド
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "25"))
+EMAIL_SPOOL_MAX_ATTEMPTS = 8 # この回数送信に失敗したメールは送らずに残す
 
 ACCOUNT_AUTHENTICATION_METHOD = "username" # username ログイン
 ACCOUNT_USERNAME_REQUIRED = True
@@ -169,4 +181,106 @@ MEDIA_URL = "/media/"
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE") # fake_stripe などに向けるときに指定する
+STRIPE_TIMEOUT = (3.05, 10) # (接続, 読み込み) のタイムアウト秒数
+STRIPE_MAX_RETRIES = 2 # 通信の失敗と 5xx のときの再試行回数
+STRIPE_POOL_SIZE = 10 # プロセスごとに保持する接続の数
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET") # Webhook の署名シークレット (whsec_...)
+STRIPE_WEBHOOK_TOLERANCE = 300 # 署名の時刻のずれをこの秒数まで許す
+STRIPE_WEBHOOK_RETRY_DELAY = 60 # 対応する Payment がまだ無いイベントは、この秒数おいて処理し直す
+STRIPE_WEBHOOK_RETRY_MAX_AGE = 60 * 60 * 24 # 受信からこの秒数たっても Payment が無いイベントは捨てる
 LOGOUT_REDIRECT_URL = "/accounts/login/" # ログアウト後の遷移先を設定
+
+ACCOUNT_DELETION_BATCH_SIZE = 500 # アカウント削除ワーカーが1トランザクションで削除する行数
+
+NOTIFICATION_RETENTION_DAYS = 180 # これより古い通知は prune_notifications で削除する
+
+RESERVATION_TTL = 600 # 購入手続き中の商品を仮押さえしておく秒数
+
+BULK_IMPORT_BATCH_SIZE = 500 # 一括出品で1回の bulk_create に含める商品の数
+BULK_IMPORT_MAX_IMAGE_SIZE = 10 * 1024 * 1024 # 一括出品の ZIP に入れられる画像1枚の大きさ（展開後）
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# いいねの書き込みバッファ (PendingLike)。flush_like_buffer --loop で定期的に Like へ反映する
+LIKE_BUFFER_BATCH_SIZE = 500 # 1トランザクションで反映する切り替えの数
+
+# 商品の閲覧数。プロセス内で数えて、この秒数ごとに ProductViewStats へまとめて書き込む (None なら書き込まない)
+VIEW_TRACKING_FLUSH_INTERVAL = 30
+VIEW_TRACKING_PRECISION = 10 # HyperLogLog のレジスタは 2**10 バイト。ユニーク数の誤差は 3% 程度
+
+# ログイン中のユーザーのキャッシュ。保存時に版番号を上げるので、複数プロセスでは共有できるキャッシュを指定する
+USER_CACHE = "default"
+USER_CACHE_TTL = 60 * 5 # 共有しないキャッシュでは他のプロセスの変更がこの秒数まで反映されない
+
+# プロセスごとの過負荷対策。None にすると無効になる
+LOAD_SHEDDING = {
+    "max_in_flight": 64, # 処理中のリクエストがこの数以上なら、決済とログイン以外を断る
+    "low_priority_max_in_flight": 16, # 処理中のリクエストがこの数以上なら、優先度の低い URL を断る
+    "latency_threshold": 1.0, # 直近の応答時間の p95 がこの秒数を超えたら、優先度の低い URL を断る
+    "latency_window": 10, # p95 の計算に使う直近の秒数
+    "samples": 500, # URL 名ごとに保持する応答時間の数
+    "retry_after": 5, # 断ったときの Retry-After の秒数
+}
+# 混雑していても常に受ける URL 名
+LOAD_SHEDDING_CRITICAL = [
+    "main:purchase_confirmation",
+    "main:address",
+    "main:postal_code_lookup",
+    "main:payment",
+    "main:final_confirmation",
+    "main:stripe_webhook",
+    "main:load_status",
+    "account_login",
+    "account_logout",
+]
+# 重いので混雑し始めたら先に断る URL 名
+LOAD_SHEDDING_LOW_PRIORITY = [
+    "main:product_list",
+    "main:async_product_list",
+    "main:search_suggestions",
+    "main:account_detail",
+    "main:sales_dashboard",
+]
+LOAD_STATUS_TOKEN = os.getenv("LOAD_STATUS_TOKEN") # X-Status-Token にこの値を付けると、スタッフでなくても状態を見られる
+
+# URL 名ごとのリクエスト数制限（ログイン中はユーザー、未ログインは IP ごとに適用）
+RATE_LIMIT_CACHE = "default" # 複数プロセスで動かすときは共有できるキャッシュを指定する。incr がアトミックな Redis や Memcached を使う (DatabaseCache では同時のリクエストを数え損ねる)
+RATE_LIMIT_PROXY_COUNT = int(os.getenv("RATE_LIMIT_PROXY_COUNT", "0")) # 前にあるリバースプロキシの数。1以上なら転送ヘッダーから IP を取る
+RATE_LIMIT_FORWARDED_HEADER = "HTTP_X_FORWARDED_FOR"
+RATE_LIMITS = {
+    "main:like": {"rate": "30/m", "methods": ["POST"]},
+    "main:unlike": {"rate": "30/m", "methods": ["POST"]},
+    "main:like_toggle": {"rate": "60/m", "methods": ["POST"]},
+    "main:home": {"rate": "60/m", "param": "keyword"},
+    "main:product_list": {"rate": "60/m"},
+    "main:async_home": {"rate": "60/m", "param": "keyword"},
+    "main:async_product_list": {"rate": "60/m"},
+    "main:purchase_confirmation": {"rate": "20/m", "methods": ["POST"]},
+    "main:final_confirmation": {"rate": "10/m", "methods": ["POST"]},
+}
+
+# リクエストのサンプリングプロファイラー。どちらも未設定ならミドルウェアは外れる
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0")) # 計測するリクエストの割合 (0〜1)
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "") # このトークンをヘッダーに付けたリクエストは必ず計測する
+PROFILER_HEADER = "X-Profile-Token"
+PROFILER_INTERVAL = 0.005 # スタックを記録する間隔（秒）
+PROFILER_DIR = BASE_DIR / "profiles" # collapsed 形式のファイルの保存先
+
+POSTAL_CODE_FILE = BASE_DIR / "postal_codes.bin" # compile_postal_codes で作る郵便番号ファイル。なければ存在確認をしない
+
+
+# 検索候補
+SUGGESTION_LIMIT = 8 # 返す候補の数
+SUGGESTION_GENRE_WEIGHT = 10 # ジャンル名を商品名より上に出すための重み
+SUGGESTION_MIN_QUERY_COUNT = 3 # この回数以上検索されたキーワードを候補にする
+SUGGESTION_QUERY_LIMIT = 5000
+SUGGESTION_REBUILD_INTERVAL = 300 # 他のプロセスでの変更を取り込むために索引を作り直す間隔（秒）
+SUGGESTION_BUILD_IN_BACKGROUND = True # False なら索引をリクエストの中で作る（テスト用）
+SUGGESTION_QUERY_FLUSH_INTERVAL = 30 # 検索されたキーワードの回数をこの秒数ごとにまとめて書き込む (None なら書き込まない)
+SUGGESTION_MEMO_SIZE = 10000 # 覚えておく接頭辞の数
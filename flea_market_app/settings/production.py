@@ -0,0 +1,61 @@
+from .common import *
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv("ALLOWED_HOSTS", "").split(",") if host]
+
+# リクエストごとに接続を張り直さない
+DATABASES["default"]["CONN_MAX_AGE"] = 600
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+DATABASES["default"]["OPTIONS"] = {"timeout": 20} # 書き込みのロック待ちの秒数
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL", # 書き込み中も読み込みを止めない
+    "synchronous": "NORMAL", # WAL ではコミットごとの fsync を省いても壊れない
+    "cache_size": -20000, # 接続ごとのページキャッシュ (約 20MB)
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+CACHES = {
+    # プロセスの中だけで使うもの
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # 複数のプロセスで同じ内容を見る必要があるもの (セッション、ログイン中のユーザー、レート制限)
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv("CACHE_DIR", str(BASE_DIR / "var" / "cache")),
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+}
+
+# セッションはキャッシュから読み、書き込みだけ DB にも行う
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_CACHE_ALIAS = "shared"
+
+# メールはスプールに入れ、send_spooled_mail でまとめて SMTP で送る
+EMAIL_BACKEND = "main.mail.SpooledEmailBackend"
+
+USER_CACHE = "shared"
+# プロセスごとに数えると、制限がワーカーの数だけ緩くなる
+RATE_LIMIT_CACHE = "shared"
+
+# テンプレートを読み込んだら、プロセスが終わるまで使い回す
+TEMPLATES[0]["APP_DIRS"] = False
+TEMPLATES[0]["OPTIONS"]["loaders"] = [
+    (
+        "django.template.loaders.cached.Loader",
+        [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ],
+    ),
+]
+TEMPLATES[0]["OPTIONS"]["context_processors"].remove(
+    "django.template.context_processors.debug"
+)
+
+STATIC_ROOT = BASE_DIR / "staticfiles"
\ No newline at end of file
@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import counters
+from .models import (
+    AccountDeletion,
+    Address,
+    Like,
+    Notification,
+    Order,
+    Payment,
+    PointTransaction,
+    Product,
+    ProductImage,
+)
+
+User = get_user_model()
+
+
+def request_deletion(user):
+    # アカウントを即座に無効化し、実際の削除はワーカーに任せる
+    user.is_active = False
+    user.save(update_fields=["is_active"])
+    deletion, _ = AccountDeletion.objects.get_or_create(user_id=user.pk)
+    return deletion
+
+
+def _stage_querysets(user_id):
+    # 依存関係の末端から順に削除する
+    return [
+        (
+            "notifications",
+            Notification.objects.filter(
+                Q(user_id=user_id)
+                | Q(order__purchaser_id=user_id)
+                | Q(order__product__exhibitor_id=user_id)
+            ),
+        ),
+        (
+            "likes",
+            Like.objects.filter(Q(user_id=user_id) | Q(product__exhibitor_id=user_id)),
+        ),
+        (
+            "orders",
+            Order.objects.filter(
+                Q(purchaser_id=user_id) | Q(product__exhibitor_id=user_id)
+            ),
+        ),
+        (
+            "product_images",
+            ProductImage.objects.filter(product__exhibitor_id=user_id),
+        ),
+        ("products", Product.objects.filter(exhibitor_id=user_id)),
+        ("payments", Payment.objects.filter(user_id=user_id)),
+        (
+            "point_transactions",
+            PointTransaction.objects.filter(user_id=user_id),
+        ),
+    ]
+
+
+def _delete_files(names):
+    # 他の行から参照されているファイルは残す
+    names = {name for name in names if name}
+    if not names:
+        return 0
+    still_referenced = set(
+        ProductImage.objects.filter(image__in=names).values_list("image", flat=True)
+    )
+    deleted = 0
+    for name in names - still_referenced:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+            deleted += 1
+    return deleted
+
+
+def _delete_batch(stage, queryset, batch_size):
+    pks = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+    if not pks:
+        return 0, []
+    file_names = []
+    with transaction.atomic():
+        if stage == "orders":
+            # 注文に紐づく配送先も一緒に削除する
+            address_ids = list(
+                Order.objects.filter(pk__in=pks).values_list("address_id", flat=True)
+            )
+            Order.objects.filter(pk__in=pks).delete()
+            Address.objects.filter(pk__in=address_ids).delete()
+        elif stage == "notifications":
+            unread_counts = counters.unread_counts(
+                Notification.objects.filter(pk__in=pks)
+            )
+            Notification.objects.filter(pk__in=pks).delete()
+            counters.notifications_read(unread_counts)
+        elif stage == "likes":
+            like_counts = counters.like_counts(Like.objects.filter(pk__in=pks))
+            Like.objects.filter(pk__in=pks).delete()
+            counters.likes_removed(like_counts)
+        elif stage == "product_images":
+            file_names = list(
+                ProductImage.objects.filter(pk__in=pks).values_list("image", flat=True)
+            )
+            ProductImage.objects.filter(pk__in=pks).delete()
+        else:
+            queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks), file_names
+
+
+def process_deletion(deletion, batch_size=None, max_batches=None):
+    """1件の削除依頼を進捗に沿って進める。
+
+    各バッチは個別のトランザクションで削除し、進捗を保存するので、
+    途中で落ちても次回の実行で続きから再開できる。
+    処理したバッチ数を返す。
+    """
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    stage_names = [name for name, _ in AccountDeletion.STAGE_CHOICES]
+    batches = 0
+    for stage, queryset in _stage_querysets(deletion.user_id):
+        if stage_names.index(stage) < stage_names.index(deletion.stage):
+            continue
+        deletion.stage = stage
+        deletion.save(update_fields=["stage", "updated_at"])
+        while max_batches is None or batches < max_batches:
+            deleted, file_names = _delete_batch(stage, queryset, batch_size)
+            if not deleted:
+                break
+            batches += 1
+            deletion.rows_deleted += deleted
+            deletion.files_deleted += _delete_files(file_names)
+            deletion.save(update_fields=["rows_deleted", "files_deleted", "updated_at"])
+        else:
+            return batches
+
+    # 最後にユーザー本体とアイコンを削除する
+    deletion.stage = "user"
+    deletion.save(update_fields=["stage", "updated_at"])
+    user = User.objects.filter(pk=deletion.user_id).first()
+    if user is not None:
+        icon_name = user.icon.name
+        user.delete()
+        deletion.rows_deleted += 1
+        if (
+            icon_name
+            and not User.objects.filter(icon=icon_name).exists()
+            and default_storage.exists(icon_name)
+        ):
+            default_storage.delete(icon_name)
+            deletion.files_deleted += 1
+    deletion.stage = "done"
+    deletion.completed_at = timezone.now()
+    deletion.save()
+    return batches
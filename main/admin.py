@@ -1,21 +1,45 @@
 from django.contrib import admin
 from .models import (
+    AccountDeletion,
     Address,
+    DailySalesRollup,
     Genre,
     Like,
     Notification,
     Order,
+    OutgoingEmail,
     Payment,
+    PendingLike,
+    PointSnapshot,
+    PointTransaction,
     Product,
     ProductImage,
+    ProductViewStats,
+    Reservation,
+    SearchQuery,
+    SellerStats,
+    UserCounter,
+    WebhookEvent,
 )
 
 # Register your models here.
+admin.site.register(AccountDeletion)
 admin.site.register(Address)
+admin.site.register(DailySalesRollup)
 admin.site.register(Genre)
 admin.site.register(Like)
 admin.site.register(Notification)
 admin.site.register(Order)
+admin.site.register(OutgoingEmail)
 admin.site.register(Payment)
+admin.site.register(PendingLike)
+admin.site.register(PointSnapshot)
+admin.site.register(PointTransaction)
 admin.site.register(Product)
-admin.site.register(ProductImage)
\ No newline at end of file
+admin.site.register(ProductImage)
+admin.site.register(ProductViewStats)
+admin.site.register(Reservation)
+admin.site.register(SearchQuery)
+admin.site.register(SellerStats)
+admin.site.register(UserCounter)
+admin.site.register(WebhookEvent)
\ No newline at end of file
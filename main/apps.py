@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        if settings.SQLITE_PRAGMAS:
+            from .db import apply_sqlite_pragmas
+
+            connection_created.connect(apply_sqlite_pragmas)
@@ -0,0 +1,139 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import Paginator
+from django.db.models import Count, Exists, OuterRef, prefetch_related_objects
+from django.http import Http404
+from django.shortcuts import render
+
+from . import like_buffer, suggestions, view_tracking
+from .forms import ProductSearchForm
+from .models import Genre, Like, Notification, Product
+
+# ASGI で動かすときに、スレッドプールを経由せずに ORM を呼ぶ非同期版のビュー。
+# テンプレートの描画とprefetch_related は同期 API しかないので sync_to_async で呼ぶ。
+# 検索回数や閲覧数の記録もロックをとり、バックグラウンドのスレッドを起こすので同様にする。
+
+
+@sync_to_async
+def _get_user(request):
+    # request.user はセッションとユーザーの読み込みを伴うので同期側で評価する
+    return request.user if request.user.is_authenticated else None
+
+
+_render = sync_to_async(render)
+_prefetch = sync_to_async(prefetch_related_objects)
+_query_searched = sync_to_async(suggestions.query_searched)
+_record_view = sync_to_async(view_tracking.record)
+
+
+def login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await _get_user(request)
+        if user is None:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, user, *args, **kwargs)
+
+    return wrapper
+
+
+@login_required
+async def home(request, user):
+    queryset = Product.objects.exclude(exhibitor=user).filter(
+        sales_status="on_display", exhibitor__is_active=True
+    )
+    genre = request.GET.get("genre")
+    if genre:
+        queryset = queryset.filter(genre__name=genre)
+    search_form = ProductSearchForm(request.GET)
+    if search_form.is_valid():
+        keyword = search_form.cleaned_data["keyword"]
+        if keyword:
+            await _query_searched(keyword)
+            for k in keyword.split():
+                queryset = queryset.filter(name__icontains=k)
+    items = [item async for item in queryset.order_by("-uploaded_at")[:6]]
+    await _prefetch(items, "product_images")
+    genres = [genre async for genre in Genre.objects.all()]
+    return await _render(
+        request, "main/home.html", {"items": items, "genres": genres}
+    )
+
+
+@login_required
+async def product_list(request, user):
+    queryset = Product.objects.filter(exhibitor__is_active=True).order_by(
+        "-uploaded_at"
+    )
+    genre = request.GET.get("genre")
+    if genre:
+        queryset = queryset.filter(genre__name=genre)
+    search_form = ProductSearchForm(request.GET)
+    if search_form.is_valid():
+        keyword = search_form.cleaned_data["keyword"]
+        if keyword:
+            await _query_searched(keyword)
+            for k in keyword.split():
+                queryset = queryset.filter(name__icontains=k)
+    items = [item async for item in queryset]
+    await _prefetch(items, "product_images")
+    return await _render(request, "main/product_list.html", {"items": items})
+
+
+@login_required
+async def product_detail(request, user, pk):
+    try:
+        item = await (
+            Product.objects.select_related(
+                "exhibitor", "genre", "orders_received", "view_stats"
+            )
+            .filter(exhibitor__is_active=True)
+            .defer("view_stats__sketch")
+            .annotate(
+                likes_count=Count("likes_received"),
+                is_liked=Exists(Like.objects.filter(user=user, product=OuterRef("pk"))),
+                pending_like=like_buffer.pending_state(user),
+            )
+            .aget(pk=pk)
+        )
+    except Product.DoesNotExist:
+        raise Http404
+    await _prefetch([item], "product_images")
+    item.likes_count = like_buffer.likes_count(
+        item.is_liked, item.likes_count, item.pending_like
+    )
+    item.is_liked = like_buffer.is_liked(item.is_liked, item.pending_like)
+    await _record_view(item, user.pk)
+    return await _render(request, "main/product_detail.html", {"item": item})
+
+
+@login_required
+async def notification(request, user):
+    is_action = request.GET.get("isAction", "true")
+    if is_action not in ("true", "false"):
+        raise Http404
+    queryset = (
+        Notification.objects.filter(user=user, is_action=is_action == "true")
+        .select_related("order__product")
+        .order_by("-created_at")
+    )
+    count = await queryset.acount()
+    paginator = Paginator(queryset, 30)
+    paginator.count = count
+    page_obj = paginator.get_page(request.GET.get("page"))
+    notifications = [n async for n in page_obj.object_list]
+    await _prefetch(notifications, "order__product__product_images")
+    page_obj.object_list = notifications
+    return await _render(
+        request,
+        "main/notification.html",
+        {
+            "notifications": notifications,
+            "is_action": is_action,
+            "page_obj": page_obj,
+            "paginator": paginator,
+            "is_paginated": page_obj.has_other_pages(),
+        },
+    )
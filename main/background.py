@@ -0,0 +1,52 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class Periodic:
+    """func を interval 秒ごとにデーモンスレッドで呼ぶ。
+
+    スレッドは start を最初に呼んだプロセスごとに1本だけ起こし、終了時にも1回呼ぶ。
+    interval は設定の名前で渡し、値が None ならスレッドを起こさない。
+    """
+
+    def __init__(self, name, func, interval_setting):
+        self.name = name
+        self.func = func
+        self.interval_setting = interval_setting
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        interval = getattr(settings, self.interval_setting)
+        if interval is None or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+        atexit.register(self.call)
+        threading.Thread(
+            target=self._run, args=(interval,), name=self.name, daemon=True
+        ).start()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.call()
+
+    def call(self):
+        try:
+            self.func()
+        except Exception:
+            logger.exception("%s の処理に失敗しました", self.name)
+        finally:
+            # スレッドごとの接続を開いたままにしない
+            connection.close()
@@ -0,0 +1,156 @@
+import csv
+import io
+import posixpath
+import zipfile
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from . import seller_stats, suggestions
+from .forms import ProductImageFormSet, ProductImportForm
+from .models import Genre, Product, ProductImage
+
+# CSV の列。images には ZIP の中のファイル名を ";" で区切って書く
+COLUMNS = ["name", "explanation", "genre", "product_status", "value", "images"]
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)  # (行番号, [メッセージ])。ファイル全体のエラーは行番号が None
+
+
+class RowError(Exception):
+    pass
+
+
+def _open_images(archive, names):
+    """ZIP の中の画像を確認し、ZipInfo のリストを返す。"""
+    if not names:
+        raise RowError("画像を1枚以上指定してください。")
+    if len(names) > ProductImageFormSet.extra:
+        raise RowError(f"画像は {ProductImageFormSet.extra} 枚までです。")
+    if archive is None:
+        raise RowError("画像の ZIP がありません。")
+    infos = []
+    for name in names:
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            raise RowError(f"{name} が ZIP の中にありません。")
+        if info.file_size > settings.BULK_IMPORT_MAX_IMAGE_SIZE:
+            raise RowError(f"{name} のサイズが大きすぎます。")
+        try:
+            with archive.open(info) as entry, Image.open(entry) as image:
+                image.verify()
+        except Exception:
+            raise RowError(f"{name} は画像として読み込めません。")
+        infos.append(info)
+    return infos
+
+
+def _save_images(archive, infos):
+    # ZIP から展開しながらストレージに書き込む (ファイル全体をメモリに載せない)
+    image_field = ProductImage._meta.get_field("image")
+    saved = []
+    try:
+        for info in infos:
+            with archive.open(info) as entry:
+                name = image_field.generate_filename(None, posixpath.basename(info.filename))
+                saved.append(default_storage.save(name, File(entry, name=name)))
+    except Exception:
+        _delete_images(saved)
+        raise
+    return saved
+
+
+def _delete_images(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def _flush(user, batch, result):
+    """検証済みの行を bulk_create でまとめて登録する。batch は (商品, [画像のパス])。"""
+    if not batch:
+        return
+    try:
+        with transaction.atomic():
+            products = Product.objects.bulk_create([product for product, _ in batch])
+            ProductImage.objects.bulk_create(
+                [
+                    ProductImage(product=product, image=name)
+                    for product, names in batch
+                    for name in names
+                ]
+            )
+            seller_stats.product_listed(user.pk, count=len(products))
+    except Exception:
+        _delete_images([name for _, names in batch for name in names])
+        raise
+    for product in products:
+        suggestions.product_added(product)
+    result.created += len(products)
+    batch.clear()
+
+
+def import_listings(user, csv_file, image_zip=None, encoding="utf-8-sig", batch_size=None):
+    """CSV の各行を出品する。
+
+    行ごとに出品フォームと同じ規則で検証し、エラーのある行は飛ばして ImportResult に記録する。
+    商品と画像は batch_size 件ずつ bulk_create で登録する。
+    """
+    batch_size = batch_size or settings.BULK_IMPORT_BATCH_SIZE
+    result = ImportResult()
+    try:
+        archive = zipfile.ZipFile(image_zip) if image_zip is not None else None
+    except zipfile.BadZipFile:
+        result.errors.append((None, ["画像の ZIP を読み込めません。"]))
+        return result
+    genres = {genre.name: genre for genre in Genre.objects.all()}
+    reader = csv.DictReader(io.TextIOWrapper(csv_file, encoding=encoding, newline=""))
+    batch = []
+    try:
+        missing = set(COLUMNS) - set(reader.fieldnames or [])
+        if missing:
+            result.errors.append((None, [f"列がありません: {', '.join(sorted(missing))}"]))
+            return result
+        for row in reader:
+            line = reader.line_num
+            form = ProductImportForm(row, genres=genres)
+            if not form.is_valid():
+                result.errors.append(
+                    (
+                        line,
+                        [
+                            f"{name}: {message}"
+                            for name, messages in form.errors.items()
+                            for message in messages
+                        ],
+                    )
+                )
+                continue
+            names = [name.strip() for name in row["images"].split(";") if name.strip()]
+            try:
+                infos = _open_images(archive, names)
+            except RowError as e:
+                result.errors.append((line, [str(e)]))
+                continue
+            product = form.save(commit=False)
+            product.exhibitor = user
+            product.sales_status = "on_display"
+            batch.append((product, _save_images(archive, infos)))
+            if len(batch) >= batch_size:
+                _flush(user, batch, result)
+        _flush(user, batch, result)
+    except UnicodeDecodeError:
+        # それまでに登録した行はそのまま残す
+        _delete_images([name for _, names in batch for name in names])
+        result.errors.append((None, ["CSV の文字コードが正しくありません。"]))
+    finally:
+        if archive is not None:
+            archive.close()
+    return result
@@ -1,3 +1,6 @@
+from django.utils.functional import SimpleLazyObject
+
+from .counters import get_counter
 from .forms import ProductSearchForm
 
 def common_context(request):
@@ -8,4 +11,9 @@ def common_context(request):
     context = {
         "search_form": search_form,
     }
+    if request.user.is_authenticated:
+        # フッターで使われたときだけカウンターを読む
+        context["unread_notification_count"] = SimpleLazyObject(
+            lambda: get_counter(request.user).unread_notification_count
+        )
     return context
\ No newline at end of file
@@ -0,0 +1,85 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Like, Notification, UserCounter
+
+
+def add(model, key, **deltas):
+    # 行を読まずに F 式で加算し、行がなければ作成する
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        model.objects.filter(**key).update(**updates)
+
+
+def get_counter(user):
+    try:
+        return user.counter
+    except UserCounter.DoesNotExist:
+        return UserCounter(user=user)
+
+
+def like_added(user_id, count=1):
+    add(UserCounter, {"user_id": user_id}, liked_count=count)
+
+
+def like_counts(like_queryset):
+    # 削除前に呼び出し、ユーザーごとの件数を控えておく
+    return list(
+        like_queryset.values_list("user_id").annotate(count=Count("pk")).order_by()
+    )
+
+
+def likes_removed(counts):
+    for user_id, count in counts:
+        add(UserCounter, {"user_id": user_id}, liked_count=-count)
+
+
+def notification_added(user_id, count=1):
+    add(UserCounter, {"user_id": user_id}, unread_notification_count=count)
+
+
+def unread_counts(notification_queryset):
+    # 削除や既読にする前に呼び出し、ユーザーごとの未読件数を控えておく
+    return list(
+        notification_queryset.filter(is_read=False)
+        .values_list("user_id")
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+
+
+def notifications_read(counts):
+    for user_id, count in counts:
+        add(UserCounter, {"user_id": user_id}, unread_notification_count=-count)
+
+
+def rebuild(user_ids=None):
+    likes = Like.objects.all()
+    notifications = Notification.objects.all()
+    if user_ids is not None:
+        likes = likes.filter(user_id__in=user_ids)
+        notifications = notifications.filter(user_id__in=user_ids)
+    counters = {}
+    for user_id, count in like_counts(likes):
+        counters.setdefault(user_id, UserCounter(user_id=user_id)).liked_count = count
+    for user_id, count in unread_counts(notifications):
+        counter = counters.setdefault(user_id, UserCounter(user_id=user_id))
+        counter.unread_notification_count = count
+    with transaction.atomic():
+        stale = UserCounter.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.update(liked_count=0, unread_notification_count=0)
+        UserCounter.objects.bulk_create(
+            counters.values(),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["liked_count", "unread_notification_count"],
+        )
+    return len(counters)
@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    # 接続ごとに設定が必要な PRAGMA を、接続を開いた直後に実行する
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
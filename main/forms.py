@@ -1,7 +1,8 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Product, ProductImage, Address
+from .models import Genre, Product, ProductImage, Address
+from . import postal_codes
 import re
 
 User = get_user_model()
@@ -11,7 +12,13 @@ class ProductSearchForm(forms.Form):
     keyword = forms.CharField(
         label="検索",
         required=False,
-        widget=forms.TextInput(attrs={"placeholder": "商品を検索"}),
+        widget=forms.TextInput(
+            attrs={
+                "placeholder": "商品を検索",
+                "list": "search-suggestions",
+                "autocomplete": "off",
+            }
+        ),
     )
 
 class ProductImageForm(forms.ModelForm):
@@ -56,6 +63,48 @@ class ProductSellForm(forms.ModelForm):
             ),
         }
 
+class GenreNameField(forms.ModelChoiceField):
+    """カテゴリーを名前で受け取る。genres (名前 -> Genre) から探すのでクエリを発行しない。"""
+
+    def __init__(self, genres, **kwargs):
+        super().__init__(queryset=Genre.objects.all(), to_field_name="name", **kwargs)
+        self.genres = genres
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.genres[value]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages["invalid_choice"], code="invalid_choice"
+            )
+
+
+class ProductImportForm(ProductSellForm):
+    # 一括出品の CSV の1行を、出品フォームと同じ規則で検証する
+    def __init__(self, *args, genres, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["genre"] = GenreNameField(genres)
+
+    def _get_validation_exclusions(self):
+        # カテゴリーは GenreNameField で確認済みなので、モデルの検証で1行ずつ問い合わせない
+        exclude = super()._get_validation_exclusions()
+        exclude.add("genre")
+        return exclude
+
+
+class ProductBulkImportForm(forms.Form):
+    ENCODING_CHOICES = [
+        ("utf-8-sig", "UTF-8"),
+        ("cp932", "Shift_JIS (Excel)"),
+    ]
+    csv_file = forms.FileField(label="商品の CSV")
+    image_zip = forms.FileField(label="画像の ZIP", required=False)
+    encoding = forms.ChoiceField(
+        label="CSV の文字コード", choices=ENCODING_CHOICES, initial="utf-8-sig"
+    )
+
 class CustomProductImageFormSet(ProductImageFormSet):
     def clean(self):
         super().clean()
@@ -68,14 +117,21 @@ class CustomProductImageFormSet(ProductImageFormSet):
             raise ValidationError("1枚以上の画像を選択してください。")
         
 class PaymentForm(forms.Form):
-    def __init__(self, price=None, *args, **kwargs):
+    def __init__(self, price=None, point_balance=0, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.price = price
+        self.point_balance = point_balance
         self.fields["total_amount"].initial = self.price
 
     point = forms.IntegerField(widget=forms.HiddenInput(attrs={"value": "0"}))
     total_amount = forms.IntegerField(widget=forms.HiddenInput())
 
+    def clean_point(self):
+        point = self.cleaned_data["point"]
+        if point < 0 or point > self.point_balance:
+            raise ValidationError("保有ポイントを超えて利用することはできません。")
+        return point
+
 class AddressForm(forms.ModelForm):
     class Meta:
         model = Address
@@ -114,8 +170,10 @@ class AddressForm(forms.ModelForm):
 
     def clean_postal_code(self):
         postal_code = self.cleaned_data["postal_code"]
-        if len(postal_code) != 7 or not postal_code.isdigit():
+        if not postal_codes.is_valid(postal_code):
             raise ValidationError("郵便番号には7桁の数字を入力してください。")
+        if postal_codes.available() and postal_codes.lookup(postal_code) is None:
+            raise ValidationError("存在しない郵便番号です。")
         return postal_code
 
     def clean_tel(self):
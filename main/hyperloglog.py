@@ -0,0 +1,55 @@
+import hashlib
+import math
+
+
+class HyperLogLog:
+    """ユニーク数を数えるための HyperLogLog。
+
+    2**precision バイトのレジスタだけで、誤差およそ 1.04 / sqrt(2**precision) で数える。
+    precision=10 なら 1KB で誤差 3% 程度。
+    """
+
+    def __init__(self, precision=10, registers=None):
+        if registers is not None:
+            precision = len(registers).bit_length() - 1
+        if not 4 <= precision <= 16:
+            raise ValueError("precision は 4 から 16 の範囲で指定してください")
+        self.precision = precision
+        self.registers = bytearray(registers or 1 << precision)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(registers=data)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add(self, value):
+        """値を加える。レジスタが変わったら True を返す。"""
+        x = int.from_bytes(
+            hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big"
+        )
+        bits = 64 - self.precision
+        index = x >> bits
+        # 残りのビットで先頭から続く 0 の数 + 1
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        # レジスタごとの最大値をとれば、両方に加えた値の集合を数えたのと同じになる
+        if other.precision != self.precision:
+            raise ValueError("precision が異なるスケッチはまとめられません")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # 少ないうちは空のレジスタの数から数える (linear counting)
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
@@ -0,0 +1,117 @@
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from . import counters
+from .models import Like, PendingLike, Product
+
+User = get_user_model()
+
+
+def set_state(user_id, product_id, liked):
+    """いいねの状態をバッファ (PendingLike) に追記する。
+
+    リクエストごとに PendingLike への INSERT が1回あるので、書き込みの回数は減らない。
+    減るのは Like と件数のテーブルへの書き込みで、同じユーザーと商品の組は反映のときに
+    最後の状態だけがまとめて書き込まれ、人気の商品の件数の行をリクエストごとに
+    ロックしなくてよくなる。
+    """
+    PendingLike.objects.create(user_id=user_id, product_id=product_id, liked=liked)
+
+
+def pending_state(user):
+    # 商品のクエリセットに annotate して、まだ反映されていない最後の状態を取り出す。なければ None
+    return Subquery(
+        PendingLike.objects.filter(user=user, product=OuterRef("pk"))
+        .order_by("-pk")
+        .values("liked")[:1]
+    )
+
+
+def is_liked(stored, pending):
+    # stored はデータベース上の状態
+    return stored if pending is None else pending
+
+
+def likes_count(stored_liked, stored_count, pending):
+    # 自分の未反映のいいねだけを件数に足し引きする
+    if pending is None or pending == stored_liked:
+        return stored_count
+    return stored_count + (1 if pending else -1)
+
+
+def flush(max_entries=None):
+    """バッファの切り替えを古い順にまとめて Like テーブルに反映する。反映した組の数を返す。
+
+    LIKE_BUFFER_BATCH_SIZE 行ずつ別のトランザクションで反映し、反映した行だけを削除する。
+    反映の途中で追記された行は次の flush で反映される。
+    """
+    flushed = 0
+    remaining = max_entries
+    while remaining is None or remaining > 0:
+        batch_size = settings.LIKE_BUFFER_BATCH_SIZE
+        if remaining is not None:
+            batch_size = min(batch_size, remaining)
+        with transaction.atomic():
+            rows = list(
+                # 複数のワーカーで動かしても同じ行を取り合わない
+                PendingLike.objects.select_for_update(skip_locked=True)
+                .order_by("pk")
+                .values_list("pk", "user_id", "product_id", "liked")[:batch_size]
+            )
+            if not rows:
+                break
+            wanted = {}
+            for _, user_id, product_id, liked in rows:
+                wanted[(user_id, product_id)] = liked
+            _apply(wanted)
+            PendingLike.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        flushed += len(wanted)
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < batch_size:
+            break
+    return flushed
+
+
+def _apply(wanted):
+    if not wanted:
+        return
+    user_ids = {user_id for user_id, _ in wanted}
+    product_ids = {product_id for _, product_id in wanted}
+    # 反映までに削除されたユーザーや商品は無視する
+    live_users = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+    live_products = set(
+        Product.objects.filter(pk__in=product_ids).values_list("pk", flat=True)
+    )
+    existing = {
+        (user_id, product_id): pk
+        for pk, user_id, product_id in Like.objects.filter(
+            user_id__in=user_ids, product_id__in=product_ids
+        ).values_list("pk", "user_id", "product_id")
+    }
+    to_create = [
+        Like(user_id=user_id, product_id=product_id)
+        for (user_id, product_id), liked in wanted.items()
+        if liked
+        and (user_id, product_id) not in existing
+        and user_id in live_users
+        and product_id in live_products
+    ]
+    to_delete = [
+        existing[pair] for pair, liked in wanted.items() if not liked and pair in existing
+    ]
+    deltas = Counter(like.user_id for like in to_create)
+    for (user_id, product_id), liked in wanted.items():
+        if not liked and (user_id, product_id) in existing:
+            deltas[user_id] -= 1
+    with transaction.atomic():
+        Like.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+        if to_delete:
+            Like.objects.filter(pk__in=to_delete).delete()
+        for user_id, delta in deltas.items():
+            if delta:
+                counters.like_added(user_id, delta)
@@ -0,0 +1,200 @@
+import hmac
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+# ミドルウェアが作った LoadShedder。状態の確認用のビューから読む
+_shedder = None
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(q * len(values)) - 1)]
+
+
+class RouteStats:
+    def __init__(self, samples):
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=samples)  # (終了時刻, 秒数)
+
+
+class LoadShedder:
+    """同時に処理中のリクエスト数と直近の応答時間から、リクエストを受けるかどうかを決める。
+
+    状態はプロセスごとに持つので、ワーカーのプロセスはそれぞれ独立に判断する。
+    """
+
+    def __init__(self, config, critical, low_priority):
+        self.max_in_flight = config["max_in_flight"]
+        self.low_priority_max_in_flight = config["low_priority_max_in_flight"]
+        self.latency_threshold = config["latency_threshold"]
+        self.latency_window = config["latency_window"]
+        self.samples = config["samples"]
+        self.retry_after = config["retry_after"]
+        self.critical = set(critical)
+        self.low_priority = set(low_priority)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latencies = deque(maxlen=self.samples)
+        self.routes = {}
+        # p95 は並べ替えが要るので、計算し直すのは 0.5 秒に1回まで
+        self._p95 = 0.0
+        self._p95_at = 0.0
+
+    def priority(self, url_name):
+        if url_name in self.critical:
+            return "critical"
+        if url_name in self.low_priority:
+            return "low"
+        return "normal"
+
+    def _recent(self, latencies, now):
+        return [
+            seconds
+            for finished_at, seconds in latencies
+            if now - finished_at <= self.latency_window
+        ]
+
+    def _p95_latency(self, now):
+        if now - self._p95_at >= 0.5:
+            recent = self._recent(self.latencies, now)
+            self._p95 = _percentile(recent, 0.95) if recent else 0.0
+            self._p95_at = now
+        return self._p95
+
+    def _reason(self, priority, now):
+        if priority == "critical":
+            return None
+        if self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if priority == "low":
+            if self.in_flight >= self.low_priority_max_in_flight:
+                return "in_flight"
+            if self._p95_latency(now) > self.latency_threshold:
+                return "latency"
+        return None
+
+    def admit(self, url_name):
+        """受けるなら処理中の数を増やして None を、断るなら理由を返す。"""
+        now = time.monotonic()
+        with self.lock:
+            route = self.routes.get(url_name)
+            if route is None:
+                route = self.routes[url_name] = RouteStats(self.samples)
+            reason = self._reason(self.priority(url_name), now)
+            if reason:
+                route.rejected += 1
+                return reason
+            route.admitted += 1
+            route.in_flight += 1
+            self.in_flight += 1
+            return None
+
+    def finish(self, url_name, seconds):
+        now = time.monotonic()
+        with self.lock:
+            route = self.routes[url_name]
+            route.in_flight -= 1
+            self.in_flight -= 1
+            route.latencies.append((now, seconds))
+            self.latencies.append((now, seconds))
+
+    def status(self):
+        now = time.monotonic()
+        with self.lock:
+            routes = {}
+            for url_name, route in sorted(self.routes.items()):
+                recent = self._recent(route.latencies, now)
+                routes[url_name] = {
+                    "priority": self.priority(url_name),
+                    "in_flight": route.in_flight,
+                    "admitted": route.admitted,
+                    "rejected": route.rejected,
+                    "p50": _percentile(recent, 0.5) if recent else None,
+                    "p95": _percentile(recent, 0.95) if recent else None,
+                }
+            return {
+                "in_flight": self.in_flight,
+                "p95": self._p95_latency(now),
+                "shedding": {
+                    priority: self._reason(priority, now)
+                    for priority in ("low", "normal")
+                },
+                "limits": {
+                    "max_in_flight": self.max_in_flight,
+                    "low_priority_max_in_flight": self.low_priority_max_in_flight,
+                    "latency_threshold": self.latency_threshold,
+                },
+                "routes": routes,
+            }
+
+
+def status():
+    if _shedder is None:
+        return {"enabled": False}
+    return {"enabled": True, **_shedder.status()}
+
+
+def can_view_status(request):
+    token = settings.LOAD_STATUS_TOKEN
+    if token:
+        given = request.META.get("HTTP_X_STATUS_TOKEN", "")
+        if given and hmac.compare_digest(given, token):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def service_unavailable(retry_after):
+    response = HttpResponse(
+        "ただいま混み合っています。しばらくしてから再度お試しください。",
+        status=503,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+class LoadSheddingMiddleware:
+    """混雑しているときに、優先度の低い URL を早めに 503 で断る。
+
+    LOAD_SHEDDING_CRITICAL の URL 名 (決済やログイン) は常に受ける。
+    LOAD_SHEDDING_LOW_PRIORITY の URL 名は、処理中のリクエストが low_priority_max_in_flight 以上か、
+    直近の応答時間の p95 が latency_threshold 秒を超えると断る。
+    それ以外の URL 名は処理中のリクエストが max_in_flight 以上のときだけ断る。
+    """
+
+    def __init__(self, get_response):
+        global _shedder
+        if not settings.LOAD_SHEDDING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.shedder = _shedder = LoadShedder(
+            settings.LOAD_SHEDDING,
+            settings.LOAD_SHEDDING_CRITICAL,
+            settings.LOAD_SHEDDING_LOW_PRIORITY,
+        )
+
+    def __call__(self, request):
+        started = time.monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            url_name = getattr(request, "_load_shedding_admitted", None)
+            if url_name is not None:
+                self.shedder.finish(url_name, time.monotonic() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        url_name = match.view_name if match and match.view_name else "unresolved"
+        reason = self.shedder.admit(url_name)
+        if reason:
+            return service_unavailable(self.shedder.retry_after)
+        request._load_shedding_admitted = url_name
+        return None
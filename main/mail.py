@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+def serialize(message):
+    attachments = []
+    for attachment in message.attachments:
+        # MIMEBase を直接添付したものはスプールに入れられない
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        attachments.append(
+            [filename, base64.b64encode(content).decode("ascii"), mimetype]
+        )
+    return json.dumps(
+        {
+            "subject": message.subject,
+            "body": message.body,
+            "from_email": message.from_email,
+            "to": message.to,
+            "cc": message.cc,
+            "bcc": message.bcc,
+            "reply_to": message.reply_to,
+            "headers": message.extra_headers,
+            "content_subtype": message.content_subtype,
+            "alternatives": getattr(message, "alternatives", []),
+            "attachments": attachments,
+        },
+        ensure_ascii=False,
+    )
+
+
+def deserialize(data, connection=None):
+    data = json.loads(data)
+    message = EmailMultiAlternatives(
+        subject=data["subject"],
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+        alternatives=[tuple(alternative) for alternative in data["alternatives"]],
+        connection=connection,
+    )
+    message.content_subtype = data["content_subtype"]
+    for filename, content, mimetype in data["attachments"]:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class SpooledEmailBackend(BaseEmailBackend):
+    """メールを送らずに OutgoingEmail に追加するだけのバックエンド。
+
+    リクエストの中で SMTP サーバーとやりとりしないので、登録などの応答が速くなる。
+    実際の送信は send_spooled_mail が SPOOLED_EMAIL_BACKEND で行う。
+    """
+
+    def send_messages(self, email_messages):
+        now = timezone.now()
+        spooled = [
+            OutgoingEmail(message=serialize(message), next_attempt_at=now)
+            for message in email_messages
+            if message.recipients()
+        ]
+        OutgoingEmail.objects.bulk_create(spooled)
+        return len(spooled)
+
+
+def retry_delay(attempts):
+    # 1分, 2分, 4分 ... と間隔を空け、最大で1時間
+    return timedelta(seconds=min(60 * 2 ** (attempts - 1), 3600))
+
+
+class Sender:
+    """SMTP の接続を開いたままにして、スプールのメールを順に送る。"""
+
+    def __init__(self, backend=None):
+        self.connection = get_connection(
+            backend or settings.SPOOLED_EMAIL_BACKEND, fail_silently=False
+        )
+        self.is_open = False
+
+    def close(self):
+        if self.is_open:
+            try:
+                self.connection.close()
+            finally:
+                self.is_open = False
+
+    def send_batch(self, batch_size=100):
+        """送信時刻になったメールを batch_size 通まで送り、処理した件数を返す。
+
+        SMTP サーバーに接続できないときは、試行回数を増やさずに例外を送出する。
+        send_spooled_mail は1プロセスで動かす前提で、行のロックはとらない。
+        """
+        now = timezone.now()
+        rows = list(
+            OutgoingEmail.objects.filter(next_attempt_at__lte=now).order_by(
+                "next_attempt_at", "pk"
+            )[:batch_size]
+        )
+        sent = []
+        failed = []
+        try:
+            for row in rows:
+                if not self.is_open:
+                    self.connection.open()
+                    self.is_open = True
+                try:
+                    self.connection.send_messages(
+                        [deserialize(row.message, self.connection)]
+                    )
+                except Exception as e:
+                    # 接続が切れた可能性があるので、次のメールの前に開き直す
+                    self.close()
+                    row.attempts += 1
+                    row.last_error = f"{type(e).__name__}: {e}"
+                    row.next_attempt_at = (
+                        now + retry_delay(row.attempts)
+                        if row.attempts < settings.EMAIL_SPOOL_MAX_ATTEMPTS
+                        else None
+                    )
+                    failed.append(row)
+                else:
+                    sent.append(row.pk)
+        finally:
+            if sent:
+                OutgoingEmail.objects.filter(pk__in=sent).delete()
+            if failed:
+                OutgoingEmail.objects.bulk_update(
+                    failed, ["attempts", "last_error", "next_attempt_at"]
+                )
+        return len(rows)
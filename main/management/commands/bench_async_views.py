@@ -0,0 +1,212 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.client import HTTPConnection
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+    get_user_model,
+)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from main.models import Product
+
+User = get_user_model()
+
+# 計測用のサーバーは別プロセスで起動する。
+# WSGI は runserver と同じスレッド型のサーバー、ASGI は uvicorn で動かす。
+# 計測中にレート制限で 429 が返らないように、制限は外しておく
+SERVER_SCRIPT = """
+import logging
+import django
+from django.conf import settings
+django.setup()
+settings.RATE_LIMITS = {{}}
+settings.ALLOWED_HOSTS = ["127.0.0.1"]
+if "{interface}" == "wsgi":
+    from django.core.servers.basehttp import run
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    # アクセスログを出さない (get_wsgi_application でログ設定が読み直されるので後で設定する)
+    logging.getLogger("django.server").setLevel(logging.WARNING)
+    run("127.0.0.1", {port}, application, threading=True)
+else:
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+    uvicorn.run(
+        get_asgi_application(),
+        host="127.0.0.1",
+        port={port},
+        log_level="warning",
+        access_log=False,
+    )
+"""
+
+# (名前, サーバーのインターフェース, 非同期版の URL を使うか)
+VARIANTS = [
+    ("sync-wsgi", "wsgi", False),
+    ("sync-asgi", "asgi", False),
+    ("async-asgi", "asgi", True),
+]
+
+VIEWS = ["home", "product_list", "product_detail", "notification"]
+
+
+class Command(BaseCommand):
+    help = "読み込みの多いビューについて、同期版(WSGI/ASGI)と非同期版(ASGI)のスループットと遅延を比べる"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="ビューごとのリクエスト数")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument(
+            "--views",
+            default=",".join(VIEWS),
+            help=f"計測するビューをカンマ区切りで指定する ({','.join(VIEWS)})",
+        )
+        parser.add_argument(
+            "--username",
+            default="bench",
+            help="計測に使うユーザー。いなければ作成する",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("uvicorn が必要です: pip install uvicorn")
+        views = [name for name in options["views"].split(",") if name]
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise CommandError(f"不明なビュー: {', '.join(sorted(unknown))}")
+
+        product = Product.objects.order_by("-uploaded_at").first()
+        if "product_detail" in views and product is None:
+            raise CommandError("product_detail の計測には商品が1件以上必要です")
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.login(options['username'])}"
+
+        self.stdout.write(
+            f"{'variant':<12} {'view':<16} {'req/s':>8} {'p50 [ms]':>9} "
+            f"{'p95 [ms]':>9} {'p99 [ms]':>9} {'errors':>7}"
+        )
+        for variant, interface, is_async in VARIANTS:
+            port = self.free_port()
+            server = self.start_server(interface, port)
+            try:
+                for view in views:
+                    prefix = "main:async_" if is_async else "main:"
+                    args = [product.pk] if view == "product_detail" else []
+                    path = reverse(prefix + view, args=args)
+                    self.run_load(port, path, cookie, options["warmup"], 1)
+                    elapsed, latencies, errors = self.run_load(
+                        port, path, cookie, options["requests"], options["concurrency"]
+                    )
+                    self.report(variant, view, elapsed, latencies, errors)
+            finally:
+                server.terminate()
+                server.wait()
+
+    def login(self, username):
+        user, created = User.objects.get_or_create(
+            username=username, defaults={"email": f"{username}@example.com"}
+        )
+        if created:
+            user.set_unusable_password()
+            user.save()
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def start_server(self, interface, port, settings_module=None):
+        env = dict(os.environ)
+        env["DJANGO_SETTINGS_MODULE"] = settings_module or settings.SETTINGS_MODULE
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                SERVER_SCRIPT.format(interface=interface, port=port),
+            ],
+            env=env,
+            cwd=str(settings.BASE_DIR),
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("計測用のサーバーが起動できませんでした")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError("計測用のサーバーが 30 秒以内に起動しませんでした")
+
+    def run_load(self, port, path, cookie, total, concurrency):
+        latencies = []
+        errors = [0]
+        remaining = [total]
+        lock = threading.Lock()
+
+        def worker():
+            # 接続は使い回す (keep-alive)
+            conn = HTTPConnection("127.0.0.1", port, timeout=30)
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    started = time.perf_counter()
+                    try:
+                        conn.request("GET", path, headers={"Cookie": cookie})
+                        response = conn.getresponse()
+                        response.read()
+                        ok = response.status == 200
+                    except OSError:
+                        conn.close()
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if ok:
+                            latencies.append(elapsed)
+                        else:
+                            errors[0] += 1
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies, errors[0]
+
+    def report(self, variant, view, elapsed, latencies, errors):
+        if len(latencies) >= 2:
+            q = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = q[49] * 1000, q[94] * 1000, q[98] * 1000
+        else:
+            p50 = p95 = p99 = float("nan")
+        rps = len(latencies) / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"{variant:<12} {view:<16} {rps:>8.1f} {p50:>9.1f} "
+            f"{p95:>9.1f} {p99:>9.1f} {errors:>7}"
+        )
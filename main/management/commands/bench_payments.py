@@ -0,0 +1,63 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from main import payments
+
+
+class Command(BaseCommand):
+    help = (
+        "payments.charge を並列に呼んで決済のスループットと遅延を計測する。"
+        "fake_stripe に向けて (STRIPE_API_BASE) オフラインで使う"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--amount", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        latencies = []
+        failures = []
+        remaining = [options["requests"]]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    payments.charge(
+                        options["amount"], "tok_visa", payments.idempotency_key(uuid.uuid4())
+                    )
+                except payments.PaymentError as e:
+                    with lock:
+                        failures.append(e.message)
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+
+        # 接続を張る時間を計測に含めないよう、先にクライアントを作っておく
+        payments.get_client()
+        threads = [threading.Thread(target=worker) for _ in range(options["concurrency"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"成功 {len(latencies)} 件, 失敗 {len(failures)} 件, {elapsed:.2f} 秒")
+        if len(latencies) >= 2:
+            q = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{len(latencies) / elapsed:.1f} req/s, p50 {q[49] * 1000:.1f} ms, "
+                f"p95 {q[94] * 1000:.1f} ms, p99 {q[98] * 1000:.1f} ms"
+            )
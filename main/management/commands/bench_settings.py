@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.urls import reverse
+
+from main.models import Product
+
+from .bench_async_views import VIEWS, Command as BenchAsyncViewsCommand
+
+SETTINGS_MODULES = [
+    ("dev", "flea_market_app.settings.dev"),
+    ("production", "flea_market_app.settings.production"),
+]
+
+
+class Command(BenchAsyncViewsCommand):
+    help = "主要なビューについて、dev と production の設定でのスループットと遅延を比べる (WSGI)"
+
+    def handle(self, *args, **options):
+        views = [name for name in options["views"].split(",") if name]
+        unknown = set(views) - set(VIEWS)
+        if unknown:
+            raise CommandError(f"不明なビュー: {', '.join(sorted(unknown))}")
+
+        product = Product.objects.order_by("-uploaded_at").first()
+        if "product_detail" in views and product is None:
+            raise CommandError("product_detail の計測には商品が1件以上必要です")
+        # セッションは DB に保存するので、どちらの設定のサーバーでも読める
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.login(options['username'])}"
+
+        self.stdout.write(
+            f"{'settings':<12} {'view':<16} {'req/s':>8} {'p50 [ms]':>9} "
+            f"{'p95 [ms]':>9} {'p99 [ms]':>9} {'errors':>7}"
+        )
+        for name, settings_module in SETTINGS_MODULES:
+            port = self.free_port()
+            server = self.start_server("wsgi", port, settings_module)
+            try:
+                for view in views:
+                    args = [product.pk] if view == "product_detail" else []
+                    path = reverse("main:" + view, args=args)
+                    self.run_load(port, path, cookie, options["warmup"], 1)
+                    elapsed, latencies, errors = self.run_load(
+                        port, path, cookie, options["requests"], options["concurrency"]
+                    )
+                    self.report(name, view, elapsed, latencies, errors)
+            finally:
+                server.terminate()
+                server.wait()
@@ -0,0 +1,64 @@
+import csv
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import postal_codes
+
+# 町域として扱わない表記
+NO_TOWN = ("以下に掲載がない場合", "の次に番地がくる場合", "一円")
+
+
+def clean_town(town):
+    # "（１〜３丁目）" のような括弧書きは住所の入力には使わない
+    town = re.sub(r"（.*", "", town)
+    if any(town.endswith(suffix) for suffix in NO_TOWN):
+        return ""
+    return town
+
+
+class Command(BaseCommand):
+    help = "日本郵便の郵便番号 CSV (KEN_ALL.CSV 形式) から検索用のファイルを作る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path")
+        parser.add_argument("--encoding", default="cp932")
+        parser.add_argument("--output", default=str(settings.POSTAL_CODE_FILE))
+
+    def handle(self, *args, **options):
+        prefectures = set(postal_codes.PREFECTURES)
+        entries = []
+        towns = {}
+        skipped = 0
+        try:
+            with open(options["csv_path"], encoding=options["encoding"], newline="") as f:
+                # 列: 0 全国地方公共団体コード, 2 郵便番号, 6 都道府県, 7 市区町村, 8 町域
+                for row in csv.reader(f):
+                    if len(row) < 9 or row[6] not in prefectures:
+                        skipped += 1
+                        continue
+                    code, prefecture, city, town = row[2], row[6], row[7], row[8]
+                    if not postal_codes.is_valid(code):
+                        skipped += 1
+                        continue
+                    towns.setdefault(code, set()).add(clean_town(town))
+                    entries.append((code, prefecture, city, town))
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"CSV を読み込めませんでした: {e}")
+
+        # 1つの郵便番号に町域が複数あるときは、市区町村までを返す
+        entries = [
+            (
+                code,
+                prefecture,
+                city,
+                clean_town(town) if len(towns[code]) == 1 else "",
+            )
+            for code, prefecture, city, town in entries
+        ]
+        count = postal_codes.write(options["output"], entries)
+        self.stdout.write(
+            f"{count} 件の郵便番号を {options['output']} に書き出しました"
+            f" (読み飛ばした行: {skipped})"
+        )
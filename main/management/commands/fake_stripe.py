@@ -0,0 +1,112 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.core.management.base import BaseCommand
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    # keep-alive で接続を使い回せるようにする
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に送るので、Nagle で応答が遅れないようにする
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {
+            key: values[0]
+            for key, values in parse_qs(self.rfile.read(length).decode()).items()
+        }
+        if self.path != "/v1/charges":
+            return self.send_json(404, error("invalid_request_error", "Unrecognized request URL"))
+
+        key = self.headers.get("Idempotency-Key")
+        with server.lock:
+            server.request_count += 1
+            if key and key in server.responses:
+                return self.send_json(*server.responses[key])
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        time.sleep(delay)
+        if random.random() < server.error_rate:
+            # 5xx は冪等キーで再試行される
+            return self.send_json(500, error("api_error", "Fake server error"))
+        if random.random() < server.decline_rate:
+            status, body = 402, error("card_error", "Your card was declined.", "card_declined")
+        else:
+            status, body = 200, {
+                "id": f"ch_{uuid.uuid4().hex[:24]}",
+                "object": "charge",
+                "amount": int(params.get("amount", 0)),
+                "currency": params.get("currency", "jpy"),
+                "description": params.get("description"),
+                "paid": True,
+                "status": "succeeded",
+                "created": int(time.time()),
+            }
+        if key:
+            with server.lock:
+                server.responses[key] = (status, body)
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def error(type, message, code=None):
+    body = {"type": type, "message": message}
+    if code:
+        body["code"] = code
+    return {"error": body}
+
+
+class Command(BaseCommand):
+    help = (
+        "負荷試験用に Stripe の Charge API を真似るサーバーを起動する。"
+        "STRIPE_API_BASE=http://127.0.0.1:<port> を設定すると決済がこのサーバーに向く"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--port", type=int, default=12111)
+        parser.add_argument("--latency", type=float, default=0.3, help="応答までの秒数")
+        parser.add_argument("--jitter", type=float, default=0.0, help="latency に足すばらつきの上限（秒）")
+        parser.add_argument("--decline-rate", type=float, default=0.0, help="カードを拒否する割合")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="500 を返す割合")
+        parser.add_argument("--verbose", action="store_true")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", options["port"]), FakeStripeHandler)
+        server.daemon_threads = True
+        server.latency = options["latency"]
+        server.jitter = options["jitter"]
+        server.decline_rate = options["decline_rate"]
+        server.error_rate = options["error_rate"]
+        server.verbose = options["verbose"]
+        server.lock = threading.Lock()
+        server.responses = {}  # 冪等キー -> (ステータス, 本文)
+        server.request_count = 0
+        self.stdout.write(
+            f"http://127.0.0.1:{options['port']} で待ち受けています (Ctrl-C で終了)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"{server.request_count} 件のリクエストを受けました")
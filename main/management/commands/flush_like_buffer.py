@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import like_buffer
+
+
+class Command(BaseCommand):
+    help = "バッファ (PendingLike) に溜まったいいねの切り替えを Like テーブルに反映する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-entries", type=int, default=None)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="終了せずに一定間隔で反映し続ける",
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            count = like_buffer.flush(max_entries=options["max_entries"])
+            self.stdout.write(f"{count} 件のいいねを反映しました")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,149 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from main.models import Genre, ProductImage
+
+User = get_user_model()
+
+MEDIA_DIRECTORIES = ["product_image", "user_icon", "genre_image"]
+QUARANTINE_DIRECTORY = ".quarantine"
+# 一時ファイルの SQLite に IN (...) で渡す数。古い SQLite の変数の上限 (999) に収める
+MAX_CHUNK_SIZE = 900
+
+
+class Command(BaseCommand):
+    help = "どのレコードからも参照されていないメディアファイルを削除または隔離する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="削除せずに対象のファイルを表示する",
+        )
+        parser.add_argument(
+            "--quarantine",
+            action="store_true",
+            help=f"削除せずに {QUARANTINE_DIRECTORY}/ へ移動する",
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24.0,
+            help="最終更新からこの時間が経っていないファイルは対象にしない",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help=f"まとめて照合するファイルの数 (最大 {MAX_CHUNK_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.chunk_size = max(1, min(options["chunk_size"], MAX_CHUNK_SIZE))
+        media_root = str(settings.MEDIA_ROOT)
+        cutoff = time.time() - options["grace_hours"] * 3600
+
+        # 参照中のパスはメモリに載せず一時ファイルの SQLite に入れる
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db = sqlite3.connect(os.path.join(tmpdir, "referenced.sqlite3"))
+            db.execute("CREATE TABLE referenced (name TEXT PRIMARY KEY) WITHOUT ROWID")
+            referenced = self.load_referenced(db)
+
+            scanned = orphaned = orphaned_bytes = 0
+            for chunk in self.chunked(self.scan(media_root)):
+                names = [name for name, _ in chunk]
+                placeholders = ",".join("?" * len(names))
+                known = {
+                    row[0]
+                    for row in db.execute(
+                        f"SELECT name FROM referenced WHERE name IN ({placeholders})",
+                        names,
+                    )
+                }
+                for name, entry in chunk:
+                    scanned += 1
+                    if name in known:
+                        continue
+                    stat = entry.stat()
+                    if stat.st_mtime > cutoff:
+                        continue
+                    orphaned += 1
+                    orphaned_bytes += stat.st_size
+                    self.remove(media_root, name, entry.path, options)
+            db.close()
+
+        elapsed = time.monotonic() - started
+        action = (
+            "対象"
+            if options["dry_run"]
+            else "隔離"
+            if options["quarantine"]
+            else "削除"
+        )
+        self.stdout.write(
+            f"参照中 {referenced} 件, 走査 {scanned} 件, "
+            f"{action} {orphaned} 件 ({orphaned_bytes} bytes), "
+            f"{elapsed:.2f} 秒 ({scanned / elapsed if elapsed else 0:.0f} files/s)"
+        )
+
+    def load_referenced(self, db):
+        querysets = [
+            ProductImage.objects.exclude(image="").values_list("image", flat=True),
+            Genre.objects.exclude(image="").values_list("image", flat=True),
+            User.objects.exclude(icon="").values_list("icon", flat=True),
+        ]
+        count = 0
+        for queryset in querysets:
+            names = queryset.iterator(chunk_size=self.chunk_size)
+            for chunk in self.chunked(names):
+                db.executemany(
+                    "INSERT OR IGNORE INTO referenced (name) VALUES (?)",
+                    ((name,) for name in chunk),
+                )
+                count += len(chunk)
+        db.commit()
+        return count
+
+    def scan(self, media_root):
+        for directory in MEDIA_DIRECTORIES:
+            stack = [directory]
+            while stack:
+                relative = stack.pop()
+                path = os.path.join(media_root, relative)
+                if not os.path.isdir(path):
+                    continue
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        name = f"{relative}/{entry.name}"
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(name)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield name, entry
+
+    def chunked(self, iterable):
+        chunk = []
+        for item in iterable:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def remove(self, media_root, name, path, options):
+        if options["dry_run"]:
+            self.stdout.write(name)
+        elif options["quarantine"]:
+            destination = os.path.join(media_root, QUARANTINE_DIRECTORY, name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.move(path, destination)
+        else:
+            os.remove(path)
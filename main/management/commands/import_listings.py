@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from main import bulk_import
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "CSV と画像の ZIP から商品をまとめて出品する (画面からのアップロードに収まらない件数向け)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("csv_file")
+        parser.add_argument("image_zip", nargs="?")
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--batch-size", type=int)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"ユーザーが見つかりません: {options['username']}")
+        image_zip = open(options["image_zip"], "rb") if options["image_zip"] else None
+        try:
+            with open(options["csv_file"], "rb") as csv_file:
+                result = bulk_import.import_listings(
+                    user,
+                    csv_file,
+                    image_zip,
+                    options["encoding"],
+                    options["batch_size"],
+                )
+        finally:
+            if image_zip is not None:
+                image_zip.close()
+        for line, messages in result.errors:
+            self.stderr.write(f"{line or '-'}: {' / '.join(messages)}")
+        self.stdout.write(
+            f"{result.created} 件を出品しました ({len(result.errors)} 件のエラー)"
+        )
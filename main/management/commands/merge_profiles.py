@@ -0,0 +1,91 @@
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "プロファイラーが書き出した collapsed 形式のファイルを集計し、時間のかかっている関数を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=str(settings.PROFILER_DIR))
+        parser.add_argument(
+            "--url-name",
+            action="append",
+            default=[],
+            help="集計する URL 名 (例: main:product_detail)。複数指定できる",
+        )
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="URL 名を根にしてまとめた collapsed 形式のファイル。flamegraph.pl や speedscope で開ける",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="集計したファイルを削除する",
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} がありません")
+        wanted = set(options["url_name"])
+
+        stacks = defaultdict(Counter)  # URL 名 -> スタック -> サンプル数
+        paths = []
+        for path in sorted(directory.glob("*.collapsed")):
+            # ファイル名は "<URL 名の : を . にしたもの>.<pid>.collapsed"
+            # URL 名そのものに含まれる "." は残し、名前空間の区切りだけを戻す
+            url_name = path.name.rsplit(".", 2)[0].replace(".", ":", 1)
+            if wanted and url_name not in wanted:
+                continue
+            paths.append(path)
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack and count.isdigit():
+                        stacks[url_name][stack] += int(count)
+        if not stacks:
+            self.stdout.write("集計するサンプルがありません")
+            return
+
+        self.stdout.write(f"{'samples':>8}  URL 名")
+        for url_name, counter in sorted(
+            stacks.items(), key=lambda item: sum(item[1].values()), reverse=True
+        ):
+            self.stdout.write(f"{sum(counter.values()):>8}  {url_name}")
+
+        self.report_hot_functions(stacks, options["top"])
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                for url_name, counter in sorted(stacks.items()):
+                    for stack, count in sorted(counter.items()):
+                        f.write(f"{url_name};{stack} {count}\n")
+            self.stdout.write(f"{options['output']} に書き出しました")
+
+        if options["delete"]:
+            for path in paths:
+                path.unlink()
+
+    def report_hot_functions(self, stacks, top):
+        # self: スタックの先頭にいた回数, total: スタックのどこかにいた回数
+        own = Counter()
+        total = Counter()
+        samples = 0
+        for counter in stacks.values():
+            for stack, count in counter.items():
+                frames = stack.split(";")
+                own[frames[-1]] += count
+                for frame in set(frames):
+                    total[frame] += count
+                samples += count
+        self.stdout.write("")
+        self.stdout.write(f"{'self %':>7} {'total %':>8}  関数")
+        for frame, count in own.most_common(top):
+            self.stdout.write(
+                f"{count / samples * 100:>7.1f} {total[frame] / samples * 100:>8.1f}  {frame}"
+            )
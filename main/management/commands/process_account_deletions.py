@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.account_deletion import process_deletion
+from main.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    help = "削除依頼されたアカウントの関連データをバッチ単位で削除する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="1回の実行で処理するバッチ数の上限",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="終了せずに新しい削除依頼を待ち続ける",
+        )
+        parser.add_argument("--interval", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        while True:
+            self.process_pending(options["batch_size"], options["max_batches"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def process_pending(self, batch_size, max_batches):
+        pending = AccountDeletion.objects.filter(completed_at__isnull=True).order_by(
+            "requested_at"
+        )
+        for deletion in pending:
+            batches = process_deletion(
+                deletion, batch_size=batch_size, max_batches=max_batches
+            )
+            self.stdout.write(
+                f"user_id={deletion.user_id} stage={deletion.stage} "
+                f"batches={batches} rows={deletion.rows_deleted} "
+                f"files={deletion.files_deleted}"
+            )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import webhooks
+
+
+class Command(BaseCommand):
+    help = "受信した Stripe の Webhook イベントをバッチ単位で Payment と Order に反映する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="終了せずに新しいイベントを待ち続ける",
+        )
+        parser.add_argument("--interval", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                processed = webhooks.process_batch(options["batch_size"])
+                if not processed:
+                    break
+                total += processed
+            if total:
+                self.stdout.write(f"{total} 件のイベントを処理しました")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
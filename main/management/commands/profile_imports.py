@@ -0,0 +1,115 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# 新しいプロセスで django.setup() と URL の解決までを行う
+STARTUP_SCRIPT = """
+import time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+class Command(BaseCommand):
+    help = "起動時のモジュールごとの import 時間と起動時間を計測する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=25)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="起動時間を計測する回数（中央値を表示する）",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["cumulative", "self"],
+            default="cumulative",
+        )
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="計測結果を JSON Lines で追記するファイル。リリースごとの比較に使う",
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env["DJANGO_SETTINGS_MODULE"] = os.environ.get(
+            "DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE
+        )
+        cwd = str(settings.BASE_DIR)
+
+        startup_ms = [
+            self.measure_startup(env, cwd) for _ in range(max(options["repeat"], 1))
+        ]
+        modules = self.import_times(env, cwd)
+        key = 1 if options["sort"] == "cumulative" else 0
+        modules.sort(key=lambda row: row[key], reverse=True)
+
+        self.stdout.write(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+        for self_us, cumulative_us, name in modules[: options["top"]]:
+            self.stdout.write(
+                f"{self_us / 1000:>10.2f} {cumulative_us / 1000:>16.2f}  {name}"
+            )
+        total_ms = sum(self_us for self_us, _, _ in modules) / 1000
+        median_ms = statistics.median(startup_ms)
+        self.stdout.write(
+            f"import 合計 {total_ms:.1f} ms, モジュール数 {len(modules)}, "
+            f"起動時間の中央値 {median_ms:.1f} ms ({len(startup_ms)} 回)"
+        )
+
+        if options["output"]:
+            record = {
+                "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "settings": env["DJANGO_SETTINGS_MODULE"],
+                "python": sys.version.split()[0],
+                "startup_ms_median": round(median_ms, 2),
+                "startup_ms": [round(ms, 2) for ms in startup_ms],
+                "import_ms_total": round(total_ms, 2),
+                "module_count": len(modules),
+                "top_modules": [
+                    {"module": name, "cumulative_ms": round(cumulative_us / 1000, 2)}
+                    for _, cumulative_us, name in modules[: options["top"]]
+                ],
+            }
+            with open(options["output"], "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def measure_startup(self, env, cwd):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT],
+            env=env,
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return float(result.stdout.strip().splitlines()[-1])
+
+    def import_times(self, env, cwd):
+        # -X importtime の出力は "import time: self [us] | cumulative | package"
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+            env=env,
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            modules.append((int(self_us), int(cumulative_us), name.strip()))
+        return modules
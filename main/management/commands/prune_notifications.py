@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import notifications
+
+
+class Command(BaseCommand):
+    help = "保存期間を過ぎた通知をバッチ単位で削除する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help="この日数より古い通知を削除する",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--archive",
+            default=None,
+            help="削除する通知を JSON Lines で追記するファイル",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="バッチの間に待つ秒数",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        archive = (
+            open(options["archive"], "a", encoding="utf-8")
+            if options["archive"]
+            else None
+        )
+        total = 0
+        try:
+            for deleted in notifications.prune(
+                before,
+                batch_size=options["batch_size"],
+                archive=archive,
+                pause=options["pause"],
+            ):
+                total += deleted
+        finally:
+            if archive is not None:
+                archive.close()
+        self.stdout.write(f"{total} 件の通知を削除しました")
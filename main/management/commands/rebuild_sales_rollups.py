@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from main import sales_rollups
+
+
+class Command(BaseCommand):
+    help = "注文テーブルから日次の売上集計を作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            default=None,
+            help="この日付 (YYYY-MM-DD) 以降だけを作り直す",
+        )
+
+    def handle(self, *args, **options):
+        count = sales_rollups.rebuild(options["since"])
+        self.stdout.write(f"{count} 件の集計行を作り直しました")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import seller_stats
+
+
+class Command(BaseCommand):
+    help = "商品テーブルから出品者の集計値を作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids")
+
+    def handle(self, *args, **options):
+        count = seller_stats.rebuild(options["user_ids"])
+        self.stdout.write(f"{count} 件の出品者の集計を作り直しました")
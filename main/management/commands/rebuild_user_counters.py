@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import counters
+
+
+class Command(BaseCommand):
+    help = "いいねと通知のテーブルからユーザーごとのカウンターを作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="user_ids")
+
+    def handle(self, *args, **options):
+        count = counters.rebuild(options["user_ids"])
+        self.stdout.write(f"{count} 件のユーザーのカウンターを作り直しました")
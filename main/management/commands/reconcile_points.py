@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from main import points
+from main.models import PointSnapshot
+
+
+class Command(BaseCommand):
+    help = "ポイントの残高スナップショットを台帳と突き合わせる"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="食い違ったスナップショットを台帳の値で上書きする",
+        )
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for snapshot in points.mismatched_snapshots().iterator():
+            mismatched += 1
+            self.stdout.write(
+                f"user_id={snapshot.user_id} snapshot={snapshot.balance} "
+                f"ledger={snapshot.ledger_balance}"
+            )
+            if options["fix"]:
+                PointSnapshot.objects.filter(user_id=snapshot.user_id).update(
+                    balance=snapshot.ledger_balance
+                )
+        negative = 0
+        for user_id, total in points.negative_balances().iterator():
+            negative += 1
+            self.stdout.write(f"user_id={user_id} 残高がマイナスです: {total}")
+        self.stdout.write(f"不一致 {mismatched} 件, マイナス残高 {negative} 件")
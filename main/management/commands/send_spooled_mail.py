@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.mail import Sender
+
+
+class Command(BaseCommand):
+    help = "スプールに溜まったメールを1つの SMTP 接続でまとめて送る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="終了せずに新しいメールを待ち続ける",
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        sender = Sender()
+        try:
+            while True:
+                total = 0
+                try:
+                    while True:
+                        processed = sender.send_batch(options["batch_size"])
+                        total += processed
+                        if processed < options["batch_size"]:
+                            break
+                except OSError as e:
+                    if not options["loop"]:
+                        raise
+                    self.stderr.write(f"SMTP サーバーに接続できません: {e}")
+                if total:
+                    self.stdout.write(f"{total} 通のメールを処理しました")
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        finally:
+            sender.close()
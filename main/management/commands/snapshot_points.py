@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main import points
+
+
+class Command(BaseCommand):
+    help = "ポイント台帳の新しい取引を残高スナップショットに反映する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--settle-seconds", type=int, default=60)
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = points.take_snapshots(
+            settle_seconds=options["settle_seconds"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(f"{count} 件のユーザーの残高を更新しました")
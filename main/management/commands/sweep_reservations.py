@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main import reservations
+
+
+class Command(BaseCommand):
+    help = "期限切れの商品の仮押さえをまとめて削除する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = reservations.sweep(batch_size=options["batch_size"])
+        self.stdout.write(f"{deleted} 件の仮押さえを削除しました")
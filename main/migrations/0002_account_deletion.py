@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.BigIntegerField(unique=True)),
+                ('stage', models.CharField(choices=[('notifications', '通知'), ('likes', 'いいね'), ('orders', '注文'), ('product_images', '商品画像'), ('products', '商品'), ('payments', '支払い'), ('user', 'ユーザー'), ('done', '完了')], default='notifications', max_length=20)),
+                ('rows_deleted', models.IntegerField(default=0)),
+                ('files_deleted', models.IntegerField(default=0)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
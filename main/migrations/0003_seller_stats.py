@@ -0,0 +1,56 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+
+
+def backfill_seller_stats(apps, schema_editor):
+    Product = apps.get_model("main", "Product")
+    SellerStats = apps.get_model("main", "SellerStats")
+    rows = (
+        Product.objects.values("exhibitor_id")
+        .annotate(
+            listing_count=Count("pk"),
+            on_display_count=Count("pk", filter=Q(sales_status="on_display")),
+            sold_count=Count("pk", filter=Q(sales_status="sold")),
+            total_sales=Sum("value", filter=Q(sales_status="sold"), default=0),
+        )
+        .order_by()
+    )
+    SellerStats.objects.bulk_create(
+        [
+            SellerStats(
+                user_id=row["exhibitor_id"],
+                listing_count=row["listing_count"],
+                on_display_count=row["on_display_count"],
+                sold_count=row["sold_count"],
+                total_sales=row["total_sales"],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('main', '0002_account_deletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seller_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('listing_count', models.IntegerField(default=0)),
+                ('on_display_count', models.IntegerField(default=0)),
+                ('sold_count', models.IntegerField(default=0)),
+                ('total_sales', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_seller_stats, migrations.RunPython.noop),
+    ]
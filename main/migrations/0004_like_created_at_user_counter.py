@@ -0,0 +1,56 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+
+
+def backfill_likes(apps, schema_editor):
+    Like = apps.get_model("main", "Like")
+    Product = apps.get_model("main", "Product")
+    UserCounter = apps.get_model("main", "UserCounter")
+    # いいねの日時は分からないので、商品の出品日時で埋める
+    Like.objects.filter(created_at__isnull=True).update(
+        created_at=Subquery(
+            Product.objects.filter(pk=OuterRef("product_id")).values("uploaded_at")[:1]
+        )
+    )
+    rows = Like.objects.values_list("user_id").annotate(count=Count("pk")).order_by()
+    UserCounter.objects.bulk_create(
+        [UserCounter(user_id=user_id, liked_count=count) for user_id, count in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('main', '0003_seller_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('liked_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_likes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['user', '-created_at'], name='like_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_points_to_ledger(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    PointTransaction = apps.get_model("main", "PointTransaction")
+    # 現在の保有ポイントを台帳の初期残高として移す
+    users = User.objects.exclude(point=0).values_list("pk", "point")
+    PointTransaction.objects.bulk_create(
+        [
+            PointTransaction(user_id=user_id, amount=point, reason="opening")
+            for user_id, point in users.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0005_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointSnapshot',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='point_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('balance', models.IntegerField(default=0)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='accountdeletion',
+            name='stage',
+            field=models.CharField(choices=[('notifications', '通知'), ('likes', 'いいね'), ('orders', '注文'), ('product_images', '商品画像'), ('products', '商品'), ('payments', '支払い'), ('point_transactions', 'ポイント履歴'), ('user', 'ユーザー'), ('done', '完了')], default='notifications', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='PointTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', '移行時の残高'), ('purchase', '購入での利用'), ('sale', '販売での獲得'), ('adjustment', '調整')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='point_transactions', to='main.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='point_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-id'], name='point_tx_user_id_idx')],
+            },
+        ),
+        migrations.RunPython(move_points_to_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+def mark_existing_read(apps, schema_editor):
+    # 既読の概念がなかった頃の通知はすべて既読として扱う
+    Notification = apps.get_model("main", "Notification")
+    Notification.objects.update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_point_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usercounter',
+            name='unread_notification_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_action', '-created_at'], name='notification_user_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at'], name='notification_created_idx'),
+        ),
+        migrations.RunPython(mark_existing_read, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:32
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    Like = apps.get_model("main", "Like")
+    UserCounter = apps.get_model("main", "UserCounter")
+    duplicates = (
+        Like.objects.values("user_id", "product_id")
+        .annotate(first_pk=Min("pk"), count=Count("pk"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        # 最初のいいねだけを残す
+        deleted, _ = (
+            Like.objects.filter(user_id=row["user_id"], product_id=row["product_id"])
+            .exclude(pk=row["first_pk"])
+            .delete()
+        )
+        UserCounter.objects.filter(user_id=row["user_id"]).update(
+            liked_count=F("liked_count") - deleted
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_notification_read_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='like_unique'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_like_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('query', models.CharField(max_length=100, unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-count'], name='search_query_count_idx')],
+            },
+        ),
+    ]
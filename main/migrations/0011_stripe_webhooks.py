@@ -0,0 +1,52 @@
+# Generated by Django 4.2.5 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='canceled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='amount_refunded',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='last_event_at',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('succeeded', '決済済み'), ('partially_refunded', '一部返金'), ('refunded', '返金済み'), ('disputed', 'チャージバック対応中'), ('dispute_lost', 'チャージバック')], default='succeeded', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_charge_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(db_index=True, max_length=255)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.TextField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='webhook_event_unprocessed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_outgoing_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductViewStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='view_stats', serialize=False, to='main.product')),
+                ('hits', models.BigIntegerField(default=0)),
+                ('unique_viewers', models.IntegerField(default=0)),
+                ('sketch', models.BinaryField(default=b'')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
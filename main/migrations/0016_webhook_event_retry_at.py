@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_pending_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    DailySalesRollup = apps.get_model("main", "DailySalesRollup")
+    duplicates = (
+        DailySalesRollup.objects.filter(genre__isnull=True)
+        .values("seller_id", "day", "prefecture")
+        .annotate(
+            first_pk=Min("pk"),
+            count=Count("pk"),
+            order_count_sum=Sum("order_count"),
+            revenue_sum=Sum("revenue"),
+            shipped_count_sum=Sum("shipped_count"),
+            delivered_count_sum=Sum("delivered_count"),
+        )
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        # 最初の行に合計をまとめ、残りは削除する
+        DailySalesRollup.objects.filter(pk=row["first_pk"]).update(
+            order_count=row["order_count_sum"],
+            revenue=row["revenue_sum"],
+            shipped_count=row["shipped_count_sum"],
+            delivered_count=row["delivered_count_sum"],
+        )
+        DailySalesRollup.objects.filter(
+            genre__isnull=True,
+            seller_id=row["seller_id"],
+            day=row["day"],
+            prefecture=row["prefecture"],
+        ).exclude(pk=row["first_pk"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_webhook_event_retry_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailysalesrollup',
+            name='genre',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.genre'),
+        ),
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('genre__isnull', True)), fields=('seller', 'day', 'prefecture'), name='daily_sales_rollup_unique_no_genre'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.5 on 2026-10-19 17:25
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_daily_sales_rollup_unique_no_genre'),
+    ]
+
+    # モデルにもとからあるバリデーターを状態に反映するだけで、スキーマは変わらない
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='value',
+            field=models.IntegerField(validators=[django.core.validators.MinValueValidator(300), django.core.validators.MaxValueValidator(999999)]),
+        ),
+    ]
@@ -119,8 +119,21 @@ class Address(models.Model):
 
 
 class Payment(models.Model):
+    STATUS_CHOICES = [
+        ("succeeded", "決済済み"),
+        ("partially_refunded", "一部返金"),
+        ("refunded", "返金済み"),
+        ("disputed", "チャージバック対応中"),
+        ("dispute_lost", "チャージバック"),
+    ]
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="payments")
-    stripe_charge_id = models.CharField(max_length=100)
+    stripe_charge_id = models.CharField(max_length=100, db_index=True)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="succeeded"
+    )
+    amount_refunded = models.IntegerField(default=0)
+    # 最後に反映した Webhook イベントの作成時刻。これより古いイベントは無視する
+    last_event_at = models.BigIntegerField(default=0)
 
     def __str__(self):
         return f"{self.stripe_charge_id}"
@@ -131,11 +144,40 @@ class Like(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="likes_received"
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="like_user_created_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "product"], name="like_unique"),
+        ]
 
     def __str__(self):
         return f"いいねしたユーザー:{self.user},いいねの対象:{self.product.name}"
 
 
+class PendingLike(models.Model):
+    # まだ Like に反映していないいいねの切り替え。like_buffer が追記し、flush_like_buffer がまとめて反映する
+    # 削除されたユーザーや商品の行は反映のときに捨てるので、削除の連鎖には加えない
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    liked = models.BooleanField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "product"], name="pending_like_user_product_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.product_id}:{self.liked}"
+
+
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
         ("before_shipping", "発送待ち"),
@@ -157,6 +199,8 @@ class Order(models.Model):
     payment = models.OneToOneField(
         Payment, on_delete=models.CASCADE, related_name="orders_paid_with"
     )
+    # 全額返金やチャージバックで取り消された日時
+    canceled_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"購入者:{self.product.name},配達状況{self.delivery_status}"
@@ -170,7 +214,236 @@ class Notification(models.Model):
         Order, on_delete=models.CASCADE, related_name="notifications_given"
     )
     is_action = models.BooleanField()
+    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "is_action", "-created_at"],
+                name="notification_user_list_idx",
+            ),
+            models.Index(fields=["created_at"], name="notification_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user}への{'アクション' if self.is_action == True else 'お知らせ'}"
+
+
+class AccountDeletion(models.Model):
+    STAGE_CHOICES = [
+        ("notifications", "通知"),
+        ("likes", "いいね"),
+        ("orders", "注文"),
+        ("product_images", "商品画像"),
+        ("products", "商品"),
+        ("payments", "支払い"),
+        ("point_transactions", "ポイント履歴"),
+        ("user", "ユーザー"),
+        ("done", "完了"),
+    ]
+    # ユーザー削除後も進捗を残すため外部キーにはしない
+    user_id = models.BigIntegerField(unique=True)
+    stage = models.CharField(
+        max_length=20, choices=STAGE_CHOICES, default="notifications"
+    )
+    rows_deleted = models.IntegerField(default=0)
+    files_deleted = models.IntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"ユーザーID:{self.user_id},進捗:{self.get_stage_display()}"
+
+
+class SellerStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="seller_stats"
+    )
+    listing_count = models.IntegerField(default=0)
+    on_display_count = models.IntegerField(default=0)
+    sold_count = models.IntegerField(default=0)
+    total_sales = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"出品者:{self.user},出品数:{self.listing_count},売上:{self.total_sales}"
+
+
+class UserCounter(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="counter"
+    )
+    liked_count = models.IntegerField(default=0)
+    unread_notification_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"ユーザー:{self.user},いいね数:{self.liked_count},未読通知:{self.unread_notification_count}"
+
+
+class DailySalesRollup(models.Model):
+    seller = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="daily_sales_rollups"
+    )
+    day = models.DateField()
+    # ジャンルが削除されても行は元のジャンル ID のまま残す (NULL にすると、ジャンルなしの行と重なる)
+    genre = models.ForeignKey(
+        Genre,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        related_name="+",
+    )
+    prefecture = models.CharField(max_length=4, choices=Address.PREFECTURES)
+    order_count = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    shipped_count = models.IntegerField(default=0)
+    delivered_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["seller", "day", "genre", "prefecture"],
+                name="daily_sales_rollup_unique",
+            ),
+            # NULL どうしは重複とみなされないので、ジャンルなしの行は別に一意にする
+            models.UniqueConstraint(
+                fields=["seller", "day", "prefecture"],
+                condition=models.Q(genre__isnull=True),
+                name="daily_sales_rollup_unique_no_genre",
+            ),
+        ]
+
+    def __str__(self):
+        return f"出品者:{self.seller},日付:{self.day},売上:{self.revenue}"
+
+
+class PointTransaction(models.Model):
+    REASON_CHOICES = [
+        ("opening", "移行時の残高"),
+        ("purchase", "購入での利用"),
+        ("sale", "販売での獲得"),
+        ("adjustment", "調整"),
+    ]
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="point_transactions"
+    )
+    # 獲得は正、利用は負の値
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="point_transactions",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-id"], name="point_tx_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"ユーザー:{self.user},{self.get_reason_display()}:{self.amount}"
+
+
+class PointSnapshot(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="point_snapshot"
+    )
+    balance = models.IntegerField(default=0)
+    # この ID までの取引が balance に含まれている
+    last_transaction_id = models.BigIntegerField(default=0)
+    taken_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ユーザー:{self.user},残高:{self.balance}"
+
+
+class SearchQuery(models.Model):
+    # 検索候補に使う、過去に検索されたキーワードと回数
+    query = models.CharField(max_length=100, unique=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-count"], name="search_query_count_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.query}:{self.count}"
+
+
+class Reservation(models.Model):
+    # 購入手続き中の商品の仮押さえ。期限が切れたものは他のユーザーが取り直せる
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="reservation"
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="reservations"
+    )
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"商品:{self.product_id},ユーザー:{self.user_id},期限:{self.expires_at}"
+
+
+class WebhookEvent(models.Model):
+    # 受け取った Stripe の Webhook イベント。受信時は検証して追記するだけで、処理は process_webhooks で行う
+    event_id = models.CharField(max_length=255, db_index=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # 対応する Payment がまだ無いイベントは、この時刻まで処理を見送る
+    retry_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="webhook_event_unprocessed_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type}:{self.event_id}"
+
+
+class OutgoingEmail(models.Model):
+    # 送信待ちのメール。SpooledEmailBackend が追加し、send_spooled_mail が送る
+    message = models.TextField()  # JSON
+    attempts = models.IntegerField(default=0)
+    # 次に送信を試みる日時。再試行の上限に達したものは None にして送らない
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(next_attempt_at__isnull=False),
+                name="outgoing_email_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"送信待ちのメール:{self.pk},試行回数:{self.attempts}"
+
+
+class ProductViewStats(models.Model):
+    # 商品の閲覧数。view_tracking がプロセス内で数えたものを定期的にまとめて書き込む
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="view_stats"
+    )
+    hits = models.BigIntegerField(default=0)
+    unique_viewers = models.IntegerField(default=0)
+    sketch = models.BinaryField(default=b"")  # 閲覧したユーザーの HyperLogLog のレジスタ
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.user}への{'アクション' if self.is_action == True else 'お知らせ'}"
\ No newline at end of file
+        return f"{self.product_id}:閲覧{self.hits}回,{self.unique_viewers}人"
@@ -0,0 +1,72 @@
+import json
+import time
+from collections import Counter
+
+from django.db import transaction
+
+from . import counters
+from .models import Notification
+
+
+def notify(user_id, order, is_action):
+    notification = Notification.objects.create(
+        user_id=user_id, order=order, is_action=is_action
+    )
+    counters.notification_added(user_id)
+    return notification
+
+
+def notify_many(notifications):
+    created = Notification.objects.bulk_create(notifications, batch_size=500)
+    for user_id, count in Counter(n.user_id for n in notifications).items():
+        counters.notification_added(user_id, count)
+    return created
+
+
+def mark_read(user_id, pk):
+    updated = Notification.objects.filter(
+        pk=pk, user_id=user_id, is_read=False
+    ).update(is_read=True)
+    if updated:
+        counters.notifications_read([(user_id, updated)])
+    return updated
+
+
+def mark_all_read(user_id):
+    # 1回の UPDATE でまとめて既読にし、その件数だけカウンターを減らす
+    updated = Notification.objects.filter(user_id=user_id, is_read=False).update(
+        is_read=True
+    )
+    if updated:
+        counters.notifications_read([(user_id, updated)])
+    return updated
+
+
+def prune(before, batch_size=1000, archive=None, pause=0.0):
+    """before より古い通知をバッチごとに削除する。
+
+    1バッチずつ別のトランザクションでコミットするので、長い書き込みロックを持たない。
+    archive にファイルを渡すと、削除する行を JSON Lines で書き出してから削除する。
+    削除した件数をバッチごとに yield する。
+    """
+    while True:
+        rows = list(
+            Notification.objects.filter(created_at__lt=before)
+            .order_by("pk")
+            .values("pk", "user_id", "order_id", "is_action", "is_read", "created_at")[
+                :batch_size
+            ]
+        )
+        if not rows:
+            return
+        if archive is not None:
+            for row in rows:
+                archive.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+            archive.flush()
+        unread = Counter(row["user_id"] for row in rows if not row["is_read"])
+        with transaction.atomic():
+            Notification.objects.filter(pk__in=[row["pk"] for row in rows]).delete()
+            counters.notifications_read(unread.items())
+        yield len(rows)
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+
+# stripe は読み込みが重いので、最初の決済のときに import する
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+class PaymentError(Exception):
+    """決済できなかったときの例外。message は利用者に表示できる文言。"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.message = message
+        # 通信の失敗など、同じ内容で再度試してよいもの
+        self.retryable = retryable
+
+
+def get_client():
+    """プロセスごとに1つの StripeClient を返す。
+
+    HTTP のセッションを使い回すので、決済のたびに TCP と TLS の接続をし直さない。
+    fork された子プロセスでは接続を共有しないよう作り直す。
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                import requests
+                import stripe
+
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                options = {}
+                if settings.STRIPE_API_BASE:
+                    options["base_addresses"] = {"api": settings.STRIPE_API_BASE}
+                _client = stripe.StripeClient(
+                    settings.STRIPE_API_KEY,
+                    http_client=stripe.RequestsClient(
+                        timeout=settings.STRIPE_TIMEOUT, session=session
+                    ),
+                    max_network_retries=settings.STRIPE_MAX_RETRIES,
+                    **options,
+                )
+                _client_pid = pid
+    return _client
+
+
+def idempotency_key(*parts):
+    # 同じ購入手続きの再送では同じキーになり、Stripe 側で二重に決済されない
+    return hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def charge(amount, source, idempotency_key, description="FreeMa"):
+    """カードに課金して Stripe の Charge を返す。
+
+    通信の失敗と 5xx は STRIPE_MAX_RETRIES 回まで同じ冪等キーで再試行される。
+    """
+    import stripe
+
+    try:
+        return get_client().v1.charges.create(
+            params={
+                "amount": int(amount),
+                "currency": "jpy",
+                "source": source,
+                "description": description,
+            },
+            options={"idempotency_key": idempotency_key},
+        )
+    except stripe.CardError:
+        raise PaymentError("決済に失敗しました。")
+    except (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError):
+        raise PaymentError(
+            "決済サービスに接続できませんでした。時間をおいて再度お試しください。",
+            retryable=True,
+        )
+    except stripe.StripeError:
+        raise PaymentError("決済に失敗しました。")
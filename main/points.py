@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PointSnapshot, PointTransaction
+
+
+def balance(user_id):
+    # スナップショットとそれ以降の取引だけを足すので、履歴の長さに依存しない
+    snapshot = (
+        PointSnapshot.objects.filter(user_id=user_id)
+        .values_list("balance", "last_transaction_id")
+        .first()
+    )
+    snapshot_balance, last_transaction_id = snapshot or (0, 0)
+    delta = PointTransaction.objects.filter(
+        user_id=user_id, pk__gt=last_transaction_id
+    ).aggregate(delta=Sum("amount", default=0))["delta"]
+    return snapshot_balance + delta
+
+
+def spend(user_id, amount, reason="purchase"):
+    """残高が足りるときだけ利用を追記して、その取引を返す。足りなければ None を返す。
+
+    スナップショットの行をロックしてから残高を読むので、同じユーザーの利用が
+    同時に来ても二重には使えない。
+    """
+    with transaction.atomic():
+        # SQLite では最初の書き込みでデータベースのロックをとるので、先に行を作っておく
+        PointSnapshot.objects.bulk_create(
+            [PointSnapshot(user_id=user_id)], ignore_conflicts=True
+        )
+        list(PointSnapshot.objects.select_for_update().filter(user_id=user_id))
+        if balance(user_id) < amount:
+            return None
+        return PointTransaction.objects.create(
+            user_id=user_id, amount=-amount, reason=reason
+        )
+
+
+def cancel(spent):
+    # spend で使ったポイントを戻す。台帳は書き換えずに、戻した分を追記する
+    if spent is not None:
+        record((spent.user_id, -spent.amount, "adjustment", None))
+
+
+def record(*entries):
+    # entries は (user_id, amount, reason, order) のタプル。行の更新はせず追記するだけ
+    return PointTransaction.objects.bulk_create(
+        [
+            PointTransaction(user_id=user_id, amount=amount, reason=reason, order=order)
+            for user_id, amount, reason, order in entries
+            if amount
+        ]
+    )
+
+
+def history(user_id, before=None, limit=30):
+    # ID によるキーセットページング。次のページがなければ next_before は None
+    queryset = PointTransaction.objects.filter(user_id=user_id)
+    if before is not None:
+        queryset = queryset.filter(pk__lt=before)
+    rows = list(queryset.select_related("order__product").order_by("-pk")[: limit + 1])
+    next_before = rows[limit - 1].pk if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+def take_snapshots(settle_seconds=60, batch_size=500):
+    """前回のスナップショット以降の取引を残高に畳み込み、更新したスナップショットの数を返す。
+
+    取引を ID 順に batch_size 件ずつ区切り、区切りごとに1つのトランザクションで
+    その範囲に取引のあるユーザーを更新する。途中で止まっても次は続きから始める。
+    書き込み中の取引を取りこぼさないよう、settle_seconds より古い取引だけを対象にする。
+    """
+    settled = PointTransaction.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=settle_seconds)
+    ).aggregate(high_water=Max("pk"))["high_water"]
+    if settled is None:
+        return 0
+    updated = 0
+    while True:
+        with transaction.atomic():
+            previous = PointSnapshot.objects.aggregate(
+                high_water=Max("last_transaction_id", default=0)
+            )["high_water"]
+            rows = list(
+                PointTransaction.objects.filter(pk__gt=previous, pk__lte=settled)
+                .order_by("pk")
+                .values_list("pk", "user_id")[:batch_size]
+            )
+            if not rows:
+                break
+            updated += _save_snapshots({user_id for _, user_id in rows}, rows[-1][0])
+        if len(rows) < batch_size:
+            break
+    return updated
+
+
+def _save_snapshots(user_ids, high_water):
+    # 呼び出し側のトランザクションの中で使う
+    PointSnapshot.objects.bulk_create(
+        [PointSnapshot(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    locked = list(
+        PointSnapshot.objects.select_for_update()
+        .filter(user_id__in=user_ids, last_transaction_id__lt=high_water)
+        .values_list("pk", flat=True)
+    )
+    # スナップショットごとの last_transaction_id より後の取引だけを足すので、
+    # 重なって動いても同じ取引を二重に足さない
+    delta = (
+        PointTransaction.objects.filter(
+            user_id=OuterRef("user_id"),
+            pk__gt=OuterRef("last_transaction_id"),
+            pk__lte=high_water,
+        )
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    return PointSnapshot.objects.filter(pk__in=locked).update(
+        balance=F("balance") + Coalesce(Subquery(delta), 0),
+        last_transaction_id=high_water,
+        taken_at=timezone.now(),
+    )
+
+
+def mismatched_snapshots():
+    # 台帳から計算し直した値とスナップショットの残高が食い違うもの
+    ledger_sum = (
+        PointTransaction.objects.filter(
+            user_id=OuterRef("user_id"), pk__lte=OuterRef("last_transaction_id")
+        )
+        .values("user_id")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    return (
+        PointSnapshot.objects.annotate(ledger_balance=Coalesce(Subquery(ledger_sum), 0))
+        .exclude(balance=F("ledger_balance"))
+        .order_by("user_id")
+    )
+
+
+def negative_balances():
+    return (
+        PointTransaction.objects.values_list("user_id")
+        .annotate(total=Sum("amount"))
+        .filter(total__lt=0)
+        .order_by("user_id")
+    )
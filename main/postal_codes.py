@@ -0,0 +1,147 @@
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .models import Address
+
+# 郵便番号ファイルの形式
+#   ヘッダー   : MAGIC, 件数 (uint32), BYTE_ORDER_MARK (uint32)
+#   郵便番号   : 件数 x uint32 (昇順。二分探索する)
+#   レコード   : 件数 x (都道府県の番号 uint8, 市区町村の位置 uint32, 町域の位置 uint32)
+#   文字列     : 長さ (uint16) + UTF-8。同じ文字列は1回だけ書く
+# 数値はこのマシンのバイト順で書くので、別のアーキテクチャで作ったファイルは使えない
+MAGIC = b"JPC1"
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("=4sII")
+RECORD = struct.Struct("=BII")
+STRING_LENGTH = struct.Struct("=H")
+PREFECTURES = [name for name, _ in Address.PREFECTURES]
+RELOAD_INTERVAL = 60  # ファイルが置き換えられていないかを確かめる間隔（秒）
+
+
+class PostalCodeTable:
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            # mmap はページキャッシュを共有するので、ワーカーが増えてもメモリは増えない
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, mark = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or mark != BYTE_ORDER_MARK:
+            raise ValueError(f"{self.path} は郵便番号ファイルではありません")
+        codes_end = HEADER.size + self.count * 4
+        self.codes = memoryview(self.mmap)[HEADER.size : codes_end].cast("I")
+        self.records_offset = codes_end
+        self.strings_offset = codes_end + self.count * RECORD.size
+        self.checked_at = time.monotonic()
+
+    def lookup(self, code):
+        code = int(code)
+        index = bisect_left(self.codes, code)
+        if index == self.count or self.codes[index] != code:
+            return None
+        prefecture, city, town = RECORD.unpack_from(
+            self.mmap, self.records_offset + index * RECORD.size
+        )
+        return {
+            "postal_code": f"{code:07d}",
+            "prefecture": PREFECTURES[prefecture],
+            "city": self._string(city),
+            "town": self._string(town),
+        }
+
+    def _string(self, offset):
+        start = self.strings_offset + offset
+        (length,) = STRING_LENGTH.unpack_from(self.mmap, start)
+        start += STRING_LENGTH.size
+        return self.mmap[start : start + length].decode("utf-8")
+
+    def is_stale(self):
+        # compile_postal_codes はファイルを丸ごと置き換えるので inode で判断できる
+        now = time.monotonic()
+        if now - self.checked_at < RELOAD_INTERVAL:
+            return False
+        self.checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != (self.stat.st_ino, self.stat.st_mtime_ns)
+
+
+_table = None
+_lock = threading.Lock()
+
+
+def _get_table():
+    global _table
+    table = _table
+    path = str(settings.POSTAL_CODE_FILE)
+    if table is not None and table.path == path and not table.is_stale():
+        return table
+    with _lock:
+        if _table is None or _table is table:
+            _table = PostalCodeTable(path) if os.path.exists(path) else None
+        return _table
+
+
+def is_valid(code):
+    # isdigit は "²" のような ASCII 以外の数字も通すので、半角数字に限る
+    return re.fullmatch(r"[0-9]{7}", code) is not None
+
+
+def available():
+    return _get_table() is not None
+
+
+def lookup(code):
+    """郵便番号 (7桁の数字) から都道府県・市区町村・町域を返す。見つからなければ None。"""
+    if not is_valid(code):
+        return None
+    table = _get_table()
+    if table is None:
+        return None
+    return table.lookup(code)
+
+
+def write(path, entries):
+    """(郵便番号, 都道府県, 市区町村, 町域) の並びから郵便番号ファイルを作る。
+
+    同じ郵便番号が複数あるときは最初のものを使う。書き終わってから置き換えるので、
+    読んでいるワーカーが壊れたファイルを見ることはない。
+    """
+    rows = {}
+    for code, prefecture, city, town in entries:
+        rows.setdefault(int(code), (PREFECTURES.index(prefecture), city, town))
+    codes = array("I", sorted(rows))
+    strings = bytearray()
+    positions = {}
+
+    def intern(value):
+        if value not in positions:
+            encoded = value.encode("utf-8")
+            positions[value] = len(strings)
+            strings.extend(STRING_LENGTH.pack(len(encoded)))
+            strings.extend(encoded)
+        return positions[value]
+
+    records = bytearray()
+    for code in codes:
+        prefecture, city, town = rows[code]
+        records.extend(RECORD.pack(prefecture, intern(city), intern(town)))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(codes), BYTE_ORDER_MARK))
+        f.write(codes.tobytes())
+        f.write(records)
+        f.write(strings)
+    os.replace(tmp_path, path)
+    return len(codes)
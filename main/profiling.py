@@ -0,0 +1,121 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+def _label(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+def collapse(frame, stop=None):
+    # 呼び出し元から順に ";" でつなぐ (flamegraph.pl などの collapsed 形式)
+    labels = []
+    while frame is not None and frame is not stop:
+        labels.append(_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """別スレッドから一定間隔で対象スレッドのスタックを記録する。
+
+    sys.setprofile と違って関数呼び出しごとのフックがないので、
+    計測対象のリクエストもほとんど遅くならない。
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.targets = {}  # スレッド ID -> (止めるフレーム, Counter)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self, thread_id, stop=None):
+        with self.lock:
+            self.targets[thread_id] = (stop, Counter())
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="request-profiler", daemon=True
+                )
+                self.thread.start()
+        self.wakeup.set()
+
+    def stop(self, thread_id):
+        with self.lock:
+            _, samples = self.targets.pop(thread_id)
+        return samples
+
+    def run(self):
+        while True:
+            if not self.targets:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, (stop, samples) in self.targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[collapse(frame, stop)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+_write_lock = threading.Lock()
+
+
+def write_samples(directory, url_name, samples):
+    # URL 名とプロセスごとのファイルに追記する。集計は merge_profiles で行う
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{url_name.replace(':', '.')}.{os.getpid()}.collapsed"
+    with _write_lock, open(path, "a", encoding="utf-8") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in samples.items() if stack)
+
+
+class SamplingProfilerMiddleware:
+    """PROFILER_SAMPLE_RATE の割合のリクエストと、
+    PROFILER_HEADER に PROFILER_TOKEN を付けたリクエストをサンプリングで計測する。
+
+    リクエストを処理しているスレッドを記録するので、非同期ビューの中までは追えない。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = settings.PROFILER_SAMPLE_RATE
+        self.token = settings.PROFILER_TOKEN
+        if self.rate <= 0 and not self.token:
+            raise MiddlewareNotUsed
+        self.header = "HTTP_" + settings.PROFILER_HEADER.upper().replace("-", "_")
+        self.directory = settings.PROFILER_DIR
+        self.sampler = Sampler(settings.PROFILER_INTERVAL)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        thread_id = threading.get_ident()
+        # このミドルウェアより外側のフレームは記録しない
+        self.sampler.start(thread_id, stop=sys._getframe())
+        try:
+            response = self.get_response(request)
+        finally:
+            samples = self.sampler.stop(thread_id)
+            match = request.resolver_match
+            url_name = match.view_name if match and match.view_name else "unresolved"
+            write_samples(self.directory, url_name, samples)
+        return response
+
+    def should_profile(self, request):
+        if self.token:
+            given = request.META.get(self.header, "")
+            if given and hmac.compare_digest(given, self.token):
+                return True
+        return self.rate > 0 and random.random() < self.rate
@@ -0,0 +1,146 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    # "30/m" を (回数, 秒数) に変換する
+    count, period = rate.split("/")
+    return int(count), PERIODS[period]
+
+
+def _cache():
+    return caches[settings.RATE_LIMIT_CACHE]
+
+
+def client_ip(request):
+    """クライアントの IP。RATE_LIMIT_PROXY_COUNT 段のプロキシの後ろでは転送ヘッダーから取る。
+
+    ヘッダーの右から数えて、信頼できるプロキシが付け足した分だけを使う。
+    クライアントが自分で書いた左側の値は信用しない。
+    """
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = request.META.get(settings.RATE_LIMIT_FORWARDED_HEADER, "")
+        addresses = [
+            address.strip() for address in forwarded.split(",") if address.strip()
+        ]
+        if len(addresses) >= proxies:
+            return addresses[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _identities(request):
+    # ログイン中はユーザーだけで数える。NAT やプロキシの後ろのユーザーが同じ回数を共有しない
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return [f"user:{user.pk}"]
+    return [f"ip:{client_ip(request)}"]
+
+
+def _increment(cache, key, timeout):
+    # add と incr はどちらもキャッシュ側で1回の操作なので、複数プロセスから同時に数えても取りこぼさない
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # add と incr の間に追い出されたとき
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def consume(scope, identities, rate, now=None):
+    """スライディングウィンドウで1回分を数える。
+
+    直前の区間の回数を経過した割合だけ減らして今の区間の回数に足し、
+    identities のどれかが rate を超えたら数えたぶんを戻して、
+    超えなくなるまでの秒数を返す。数えられたら 0 を返す。
+    """
+    count, period = parse_rate(rate)
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    window = int(window)
+    remaining = 1 - elapsed / period
+    cache = _cache()
+    counted = []
+    wait = 0.0
+    for identity in identities:
+        key = f"rl:{scope}:{identity}:{window}"
+        # 次の区間でも直前の回数として読むので2区間ぶん残す
+        current = _increment(cache, key, period * 2)
+        counted.append(key)
+        previous = cache.get(f"rl:{scope}:{identity}:{window - 1}", 0)
+        if current > count:
+            wait = max(wait, remaining * period)
+        elif previous * remaining + current > count:
+            # 直前の区間の重みが (count - current) / previous まで下がるのを待つ
+            wait = max(wait, (remaining - (count - current) / previous) * period)
+    if wait:
+        for key in counted:
+            try:
+                cache.decr(key)
+            except ValueError:
+                pass
+    return wait
+
+
+def too_many_requests(wait):
+    response = HttpResponse(
+        "リクエストが多すぎます。しばらくしてから再度お試しください。",
+        status=429,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
+
+def rate_limit(scope, rate, methods=None):
+    # 関数ビュー用のデコレーター。クラスビューには method_decorator で使う
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = consume(scope, _identities(request), rate)
+                if wait:
+                    return too_many_requests(wait)
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class RateLimitMiddleware:
+    """settings.RATE_LIMITS に URL 名ごとの制限を書くと、その URL に適用する。
+
+    例: {"main:like": {"rate": "30/m", "methods": ["POST"]},
+         "main:home": {"rate": "60/m", "param": "keyword"}}
+    param を指定すると、そのクエリパラメータがあるリクエストだけを数える。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = getattr(settings, "RATE_LIMITS", {})
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        limit = self.limits.get(match.view_name) if match else None
+        if limit is None:
+            return None
+        if "methods" in limit and request.method not in limit["methods"]:
+            return None
+        if "param" in limit and not request.GET.get(limit["param"]):
+            return None
+        wait = consume(match.view_name, _identities(request), limit["rate"])
+        if wait:
+            return too_many_requests(wait)
+        return None
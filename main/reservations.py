@@ -0,0 +1,63 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Reservation
+
+
+def reserve(product, user):
+    """商品を RESERVATION_TTL 秒だけ仮押さえする。取れたら True を返す。
+
+    自分の仮押さえと期限切れの仮押さえは取り直せる。
+    他のユーザーが手続き中なら False を返す。
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.RESERVATION_TTL)
+    # 行を読まずに条件付きで更新するので、同時に来ても1人しか取れない
+    if Reservation.objects.filter(
+        Q(user=user) | Q(expires_at__lte=now), product=product
+    ).update(user=user, expires_at=expires_at):
+        return True
+    try:
+        with transaction.atomic():
+            Reservation.objects.create(
+                product=product, user=user, expires_at=expires_at
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def renew(product, user):
+    """自分の仮押さえの期限を延ばす。仮押さえがなければ False を返す。
+
+    期限が切れていても、他のユーザーに取られていなければ延ばせる。
+    """
+    expires_at = timezone.now() + timedelta(seconds=settings.RESERVATION_TTL)
+    return bool(
+        Reservation.objects.filter(product=product, user=user).update(
+            expires_at=expires_at
+        )
+    )
+
+
+def release(product, user):
+    Reservation.objects.filter(product=product, user=user).delete()
+
+
+def sweep(batch_size=1000):
+    """期限切れの仮押さえをまとめて削除し、削除した件数を返す。"""
+    now = timezone.now()
+    total = 0
+    while True:
+        pks = list(
+            Reservation.objects.filter(expires_at__lte=now).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not pks:
+            return total
+        total += Reservation.objects.filter(pk__in=pks, expires_at__lte=now).delete()[0]
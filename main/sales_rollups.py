@@ -0,0 +1,139 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import counters
+from .models import DailySalesRollup, Order
+
+
+def _bucket(order):
+    return {
+        "seller_id": order.product.exhibitor_id,
+        "day": timezone.localdate(order.order_time),
+        "genre_id": order.product.genre_id,
+        "prefecture": order.address.prefecture,
+    }
+
+
+def order_created(order):
+    counters.add(
+        DailySalesRollup,
+        _bucket(order),
+        order_count=1,
+        revenue=order.product.value,
+    )
+
+
+def orders_status_changed(orders, delivery_status):
+    # orders は product と address を select_related しておくこと
+    field = {"shipped": "shipped_count", "delivered": "delivered_count"}.get(
+        delivery_status
+    )
+    if field is None:
+        return
+    # 取り消された注文は集計から除いてあるので数えない
+    buckets = Counter(
+        tuple(sorted(_bucket(order).items()))
+        for order in orders
+        if order.canceled_at is None
+    )
+    for bucket, count in buckets.items():
+        counters.add(DailySalesRollup, dict(bucket), **{field: count})
+
+
+def orders_canceled(orders):
+    # 全額返金やチャージバックで取り消された注文を集計から除く
+    # orders は product と address を select_related しておくこと
+    buckets = {}
+    for order in orders:
+        deltas = buckets.setdefault(
+            tuple(sorted(_bucket(order).items())), Counter()
+        )
+        deltas["order_count"] -= 1
+        deltas["revenue"] -= order.product.value
+        if order.delivery_status in ("shipped", "delivered"):
+            deltas["shipped_count"] -= 1
+        if order.delivery_status == "delivered":
+            deltas["delivered_count"] -= 1
+    for bucket, deltas in buckets.items():
+        counters.add(DailySalesRollup, dict(bucket), **deltas)
+
+
+def rebuild(since=None):
+    # 注文テーブルを日付・ジャンル・都道府県ごとに集計し直す (取り消された注文は除く)
+    orders = Order.objects.filter(canceled_at__isnull=True)
+    rollups = DailySalesRollup.objects.all()
+    if since is not None:
+        orders = orders.filter(order_time__date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+    rows = (
+        orders.annotate(
+            day=TruncDate("order_time", tzinfo=timezone.get_current_timezone())
+        )
+        .values(
+            "day",
+            "product__exhibitor_id",
+            "product__genre_id",
+            "address__prefecture",
+        )
+        .annotate(
+            order_count=Count("pk"),
+            revenue=Sum("product__value"),
+            shipped_count=Count(
+                "pk", filter=Q(delivery_status__in=["shipped", "delivered"])
+            ),
+            delivered_count=Count("pk", filter=Q(delivery_status="delivered")),
+        )
+        .order_by()
+    )
+    objs = [
+        DailySalesRollup(
+            seller_id=row["product__exhibitor_id"],
+            day=row["day"],
+            genre_id=row["product__genre_id"],
+            prefecture=row["address__prefecture"],
+            order_count=row["order_count"],
+            revenue=row["revenue"],
+            shipped_count=row["shipped_count"],
+            delivered_count=row["delivered_count"],
+        )
+        for row in rows.iterator()
+    ]
+    with transaction.atomic():
+        rollups.delete()
+        DailySalesRollup.objects.bulk_create(objs, batch_size=500)
+    return len(objs)
+
+
+def dashboard(seller, since):
+    rollups = DailySalesRollup.objects.filter(seller=seller, day__gte=since)
+    totals = rollups.aggregate(
+        order_count=Sum("order_count", default=0),
+        revenue=Sum("revenue", default=0),
+        shipped_count=Sum("shipped_count", default=0),
+        delivered_count=Sum("delivered_count", default=0),
+    )
+    by_day = (
+        rollups.values("day")
+        .annotate(order_count=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("-day")
+    )
+    by_genre = (
+        rollups.values("genre__name")
+        .annotate(order_count=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("-revenue")
+    )
+    by_prefecture = (
+        rollups.values("prefecture")
+        .annotate(order_count=Sum("order_count"), revenue=Sum("revenue"))
+        .order_by("-revenue")
+    )
+    return {
+        "totals": totals,
+        "by_day": list(by_day),
+        "by_genre": list(by_genre),
+        "by_prefecture": list(by_prefecture),
+    }
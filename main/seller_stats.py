@@ -0,0 +1,100 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from . import counters
+from .models import Order, Product, SellerStats
+
+
+def _apply(user_id, **deltas):
+    counters.add(SellerStats, {"user_id": user_id}, **deltas)
+
+
+def product_listed(exhibitor_id, count=1):
+    _apply(exhibitor_id, listing_count=count, on_display_count=count)
+
+
+def product_sold(product):
+    _apply(
+        product.exhibitor_id,
+        on_display_count=-1,
+        sold_count=1,
+        total_sales=product.value,
+    )
+
+
+def orders_canceled(orders):
+    # 全額返金やチャージバックで取り消された注文は売上から除く (商品は売り切れのまま)
+    # orders は product を select_related しておくこと
+    totals = Counter()
+    for order in orders:
+        totals[order.product.exhibitor_id] += order.product.value
+    for exhibitor_id, total in totals.items():
+        _apply(exhibitor_id, total_sales=-total)
+
+
+def product_removed(product):
+    # 取り消された注文の分は orders_canceled で売上から除いてある
+    # product は orders_received を select_related しておくこと
+    if product.sales_status == "sold":
+        _apply(
+            product.exhibitor_id,
+            listing_count=-1,
+            sold_count=-1,
+            total_sales=0 if _is_canceled(product) else -product.value,
+        )
+    else:
+        _apply(product.exhibitor_id, listing_count=-1, on_display_count=-1)
+
+
+def _is_canceled(product):
+    try:
+        return product.orders_received.canceled_at is not None
+    except Order.DoesNotExist:
+        return False
+
+
+def get_stats(user):
+    try:
+        return user.seller_stats
+    except SellerStats.DoesNotExist:
+        return SellerStats(user=user)
+
+
+def rebuild(user_ids=None):
+    # 集計し直した値でテーブルを作り直す
+    queryset = Product.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(exhibitor_id__in=user_ids)
+    rows = (
+        queryset.values("exhibitor_id")
+        .annotate(
+            listing_count=Count("pk"),
+            on_display_count=Count("pk", filter=Q(sales_status="on_display")),
+            sold_count=Count("pk", filter=Q(sales_status="sold")),
+            total_sales=Sum(
+                "value",
+                filter=Q(sales_status="sold", orders_received__canceled_at__isnull=True),
+                default=0,
+            ),
+        )
+        .order_by()
+    )
+    stats = [
+        SellerStats(
+            user_id=row["exhibitor_id"],
+            listing_count=row["listing_count"],
+            on_display_count=row["on_display_count"],
+            sold_count=row["sold_count"],
+            total_sales=row["total_sales"],
+        )
+        for row in rows
+    ]
+    with transaction.atomic():
+        stale = SellerStats.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        SellerStats.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
@@ -0,0 +1,29 @@
+function fillAddress(){
+    const form = document.querySelector(".address-form");
+    if (!form) {
+        return;
+    }
+    const postalCode = form.querySelector("[name=postal_code]");
+    postalCode.addEventListener("input", function(){
+        const code = postalCode.value;
+        if (!/^[0-9]{7}$/.test(code)) {
+            return;
+        }
+        const xhr = new XMLHttpRequest();
+        xhr.open("GET", form.dataset.postalCodeUrl + "?code=" + code);
+        xhr.responseType = "json";
+        xhr.send();
+        xhr.onload = function() {
+            if(xhr.status == 200 && postalCode.value == code) {
+                const res = xhr.response;
+                const address = form.querySelector("[name=address]");
+                form.querySelector("[name=prefecture]").value = res.prefecture;
+                // 入力済みの住所は上書きしない
+                if (!address.value) {
+                    address.value = res.city + res.town;
+                }
+            }
+        }
+    });
+}
+fillAddress();
\ No newline at end of file
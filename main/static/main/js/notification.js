@@ -9,7 +9,7 @@ function sendRequest(){
             activeTab.classList.add("active");
             const isAction = ev.target.dataset.isAction;
             const queryString = new URLSearchParams({"isAction":isAction}).toString();
-            const requestPath = window.location + "?" + queryString;
+            const requestPath = window.location.pathname + "?" + queryString;
             xhr.open("GET", requestPath);
             xhr.responseType = "document";
             xhr.send();
@@ -27,6 +27,9 @@ function sendRequest(){
                             productList.appendChild(element);
                         });
                     }
+                    // ページ送りのリンクも選んだタブのものに差し替える
+                    document.querySelector(".pagination-container").innerHTML =
+                        res.querySelector(".pagination-container").innerHTML;
                 } else {
                     window.alert("通信に失敗しました。");
                 }
@@ -0,0 +1,32 @@
+function toggleLike(){
+    const likeButton = document.querySelector(".product-like-button");
+    if (!likeButton) {
+        return;
+    }
+    likeButton.addEventListener("submit", function(ev){
+        ev.preventDefault();
+        const form = ev.target;
+        const csrfToken = form.querySelector("[name=csrfmiddlewaretoken]").value;
+        const xhr = new XMLHttpRequest();
+        xhr.open("POST", likeButton.dataset.toggleUrl);
+        xhr.setRequestHeader("X-CSRFToken", csrfToken);
+        xhr.responseType = "json";
+        xhr.send();
+        xhr.onload = function() {
+            if(xhr.status == 200) {
+                const res = xhr.response;
+                const button = form.querySelector("button");
+                const icon = form.querySelector("i");
+                const count = form.querySelector("p");
+                button.className = res.liked ? "product-unlike-btn" : "product-like-btn";
+                icon.className = res.liked ? "fa-solid fa-heart" : "fa-regular fa-heart";
+                icon.style.color = res.liked ? "#2B8F38" : "";
+                count.className = res.liked ? "like-count-liked" : "like-count";
+                count.textContent = res.likes_count;
+            } else {
+                window.alert("通信に失敗しました。");
+            }
+        }
+    });
+}
+toggleLike();
\ No newline at end of file
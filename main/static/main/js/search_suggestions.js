@@ -0,0 +1,35 @@
+function suggestSearch(){
+    const form = document.querySelector("[data-suggest-url]");
+    if (!form) {
+        return;
+    }
+    const input = form.querySelector("[name=keyword]");
+    const list = document.getElementById("search-suggestions");
+    let timer = null;
+    input.addEventListener("input", function(){
+        clearTimeout(timer);
+        // 入力が止まってから問い合わせる
+        timer = setTimeout(function(){
+            const q = input.value;
+            if (!q.trim()) {
+                list.innerHTML = "";
+                return;
+            }
+            const xhr = new XMLHttpRequest();
+            xhr.open("GET", form.dataset.suggestUrl + "?q=" + encodeURIComponent(q));
+            xhr.responseType = "json";
+            xhr.send();
+            xhr.onload = function() {
+                if(xhr.status == 200 && input.value == q) {
+                    list.innerHTML = "";
+                    for (const suggestion of xhr.response.suggestions) {
+                        const option = document.createElement("option");
+                        option.value = suggestion;
+                        list.appendChild(option);
+                    }
+                }
+            }
+        }, 150);
+    });
+}
+suggestSearch();
\ No newline at end of file
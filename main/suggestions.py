@@ -0,0 +1,271 @@
+import heapq
+import logging
+import os
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import counters
+from .background import Periodic
+from .models import Genre, Product, SearchQuery
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = 100
+
+
+def normalize(text):
+    # 全角・半角と大文字・小文字の違いを無視する
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+class PrefixIndex:
+    """並べたキーを二分探索して、前方一致する候補を重みの大きい順に返す。
+
+    接頭辞ごとに上位 size 件を覚えておき、キーが変わったときはその接頭辞の分だけ直す。
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.keys = []  # 昇順
+        self.terms = {}  # キー -> [表示する文字列, 重み]
+        self.memo = {}  # 接頭辞 -> 上位のキー
+        self.lock = threading.Lock()
+
+    def _rank(self, key):
+        return (-self.terms[key][1], key)
+
+    def add(self, text, weight=1):
+        key = normalize(text)
+        if not key:
+            return
+        with self.lock:
+            term = self.terms.get(key)
+            if term is None:
+                self.terms[key] = [text, weight]
+                insort(self.keys, key)
+            else:
+                term[1] += weight
+            removed = self.terms[key][1] <= 0
+            if removed:
+                del self.terms[key]
+                del self.keys[bisect_left(self.keys, key)]
+            self._update_memo(key, removed or weight < 0)
+
+    def remove(self, text, weight=1):
+        key = normalize(text)
+        if key in self.terms:
+            self.add(text, -weight)
+
+    def bump(self, text, weight=1):
+        # すでに候補にあるときだけ重みを足す
+        key = normalize(text)
+        if key in self.terms:
+            self.add(text, weight)
+
+    def _update_memo(self, key, decreased):
+        for i in range(1, len(key) + 1):
+            prefix = key[:i]
+            top = self.memo.get(prefix)
+            if top is None:
+                continue
+            if key in top:
+                if decreased:
+                    # 上位から外れるかもしれないので次に使うときに数え直す
+                    del self.memo[prefix]
+                else:
+                    top.sort(key=self._rank)
+            elif not decreased and (
+                len(top) < self.size or self._rank(key) < self._rank(top[-1])
+            ):
+                top.append(key)
+                top.sort(key=self._rank)
+                del top[self.size :]
+
+    def _top(self, prefix):
+        top = self.memo.get(prefix)
+        if top is None:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + "\uffff", start)
+            top = heapq.nsmallest(self.size, self.keys[start:end], key=self._rank)
+            if len(self.memo) >= settings.SUGGESTION_MEMO_SIZE:
+                self.memo.clear()
+            self.memo[prefix] = top
+        return top
+
+    def warm(self):
+        # 範囲の広い1文字の接頭辞は先に数えておく
+        with self.lock:
+            for prefix in {key[0] for key in self.keys}:
+                self._top(prefix)
+
+    def complete(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            return [self.terms[key][0] for key in self._top(prefix)[:limit]]
+
+
+_index = None
+_next_build_at = 0.0  # time.monotonic() がこれを過ぎたら作り直す
+_building = False
+_changes = None  # 作り直している間に届いた変更。でき上がった索引にも反映する
+_query_counts = Counter()  # まだ書き込んでいない検索回数
+_lock = threading.Lock()
+
+RETRY_DELAY = 10  # 作り直しに失敗したときに再試行するまでの秒数
+
+
+def build():
+    """出品中の商品名、ジャンル名、よく検索されたキーワードから索引を作る。"""
+    index = PrefixIndex(settings.SUGGESTION_LIMIT)
+    names = Product.objects.filter(
+        sales_status="on_display", exhibitor__is_active=True
+    ).values_list("name", flat=True)
+    for name in names.iterator():
+        index.add(name)
+    for name in Genre.objects.values_list("name", flat=True):
+        index.add(name, settings.SUGGESTION_GENRE_WEIGHT)
+    queries = SearchQuery.objects.filter(
+        count__gte=settings.SUGGESTION_MIN_QUERY_COUNT
+    ).order_by("-count")[: settings.SUGGESTION_QUERY_LIMIT]
+    for query, count in queries.values_list("query", "count"):
+        index.add(query, count)
+    index.warm()
+    return index
+
+
+def rebuild():
+    """索引を作って差し替える。作っている間に届いた変更も反映してから差し替える。"""
+    global _index, _next_build_at, _changes
+    with _lock:
+        _changes = []
+    try:
+        index = build()
+        with _lock:
+            for method, text in _changes:
+                getattr(index, method)(text)
+            _index = index
+            _next_build_at = time.monotonic() + settings.SUGGESTION_REBUILD_INTERVAL
+    finally:
+        with _lock:
+            _changes = None
+
+
+def _rebuild_in_background():
+    global _building, _next_build_at
+    try:
+        rebuild()
+    except Exception:
+        logger.exception("検索候補の索引を作り直せませんでした")
+        _next_build_at = time.monotonic() + RETRY_DELAY
+    finally:
+        _building = False
+        connection.close()
+
+
+def get_index():
+    """索引を返す。
+
+    他のプロセスでの変更を取り込むため、一定時間ごとに裏のスレッドで作り直す。
+    でき上がるまでは古い索引を使い、最初の索引ができるまでは空の索引を返す。
+    """
+    global _building
+    if time.monotonic() >= _next_build_at:
+        if not settings.SUGGESTION_BUILD_IN_BACKGROUND:
+            rebuild()
+        else:
+            with _lock:
+                start = not _building
+                _building = True
+            if start:
+                threading.Thread(
+                    target=_rebuild_in_background, name="suggestions", daemon=True
+                ).start()
+    return _index or PrefixIndex(settings.SUGGESTION_LIMIT)
+
+
+def reset():
+    global _index, _next_build_at
+    _index = None
+    _next_build_at = 0.0
+
+
+def suggest(prefix, limit=None):
+    return get_index().complete(prefix, limit or settings.SUGGESTION_LIMIT)
+
+
+def _change(method, text):
+    with _lock:
+        if _changes is not None:
+            _changes.append((method, text))
+        index = _index
+    if index is not None:
+        getattr(index, method)(text)
+
+
+# 以下はこのプロセスの索引をすぐに更新するためのフック
+def product_added(product):
+    _change("add", product.name)
+
+
+def product_sold(product):
+    _change("remove", product.name)
+
+
+def product_removed(product):
+    if product.sales_status == "on_display":
+        _change("remove", product.name)
+
+
+def query_searched(keyword):
+    """検索されたキーワードを数える。書き込みは flush_queries がまとめて行う。"""
+    query = normalize(keyword)
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        return
+    with _lock:
+        _query_counts[query] += 1
+    _change("bump", query)
+    _query_flusher.start()
+
+
+def flush_queries():
+    """溜まった検索回数を1つのトランザクションで SearchQuery に足し、書き込んだキーワードの数を返す。"""
+    global _query_counts
+    with _lock:
+        pending, _query_counts = _query_counts, Counter()
+    if not pending:
+        return 0
+    try:
+        with transaction.atomic():
+            for query, count in pending.items():
+                counters.add(SearchQuery, {"query": query}, count=count)
+    except Exception:
+        # 書き込めなかった分は戻して次に回す
+        with _lock:
+            _query_counts.update(pending)
+        raise
+    return len(pending)
+
+
+_query_flusher = Periodic(
+    "search-queries", flush_queries, "SUGGESTION_QUERY_FLUSH_INTERVAL"
+)
+
+
+def _reset_after_fork():
+    # 索引は親のものを使い続け、作り直しのスレッドと未書き込みの回数は引き継がない
+    global _lock, _building, _changes, _query_counts
+    _lock = threading.Lock()
+    _building = False
+    _changes = None
+    _query_counts = Counter()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,117 @@
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.core.cache import caches
+from django.db import transaction
+from django.test import override_settings
+
+# 計測に影響しないように、レート制限とプロファイラを外し、裏で書き込むスレッドは起こさない
+PERFORMANCE_SETTINGS = override_settings(
+    RATE_LIMITS={},
+    PROFILER_SAMPLE_RATE=0,
+    VIEW_TRACKING_FLUSH_INTERVAL=None,
+    SUGGESTION_BUILD_IN_BACKGROUND=False,
+    SUGGESTION_QUERY_FLUSH_INTERVAL=None,
+)
+
+# 基準値の何倍まで遅くなってよいか。短いビューはばらつきが大きいので秒数でも余裕を持たせる
+TIMING_TOLERANCE = 3.0
+TIMING_SLACK = 0.02
+
+
+@dataclass
+class Case:
+    name: str
+    url: str
+    queries: int
+    method: str = "GET"
+    data: object = None
+    status: int = 200
+    extra: dict = field(default_factory=dict)  # content_type や HTTP_ で始まるヘッダー
+
+
+class ViewPerformanceMixin:
+    """ビューごとのクエリ数と応答時間を確かめるテストの共通処理。
+
+    cases() は Case のリストを返す。
+    クエリ数はデータの件数を grow() で増やしても変わらないことを確かめる。
+    応答時間は環境によってばらつくので、CHECK_PERF_TIMINGS=1 のときだけ GET のものを
+    計測して baseline_file の値と比べる。UPDATE_PERF_BASELINES=1 のときは計測した値で
+    baseline_file を書き直す。それ以外でファイルを書き換えることはない。
+    """
+
+    baseline_file = None
+    timing_runs = 5
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+
+    def cases(self):
+        raise NotImplementedError
+
+    def grow(self):
+        raise NotImplementedError
+
+    def request(self, case):
+        return getattr(self.client, case.method.lower())(case.url, case.data, **case.extra)
+
+    def assert_budgets(self):
+        for case in self.cases():
+            with self.subTest(view=case.name):
+                # 1回目はキャッシュやテンプレートの読み込みを含むので数えない
+                with transaction.atomic():
+                    self.request(case)
+                    transaction.set_rollback(True)
+                with transaction.atomic():
+                    with self.assertNumQueries(case.queries):
+                        response = self.request(case)
+                    transaction.set_rollback(True)
+                self.assertEqual(response.status_code, case.status)
+
+    def test_query_budgets(self):
+        self.assert_budgets()
+        # 行数が増えてもクエリ数は同じでなければならない
+        self.grow()
+        self.assert_budgets()
+
+    def test_timings(self):
+        update = os.environ.get("UPDATE_PERF_BASELINES") == "1"
+        if not update and os.environ.get("CHECK_PERF_TIMINGS") != "1":
+            self.skipTest("CHECK_PERF_TIMINGS=1 のときだけ応答時間を確かめる")
+        path = Path(self.baseline_file)
+        baselines = json.loads(path.read_text()) if path.exists() else {}
+        measured = {}
+        for case in self.cases():
+            if case.method != "GET":
+                continue
+            self.request(case)
+            timings = []
+            for _ in range(self.timing_runs):
+                started = time.perf_counter()
+                self.request(case)
+                timings.append(time.perf_counter() - started)
+            measured[case.name] = statistics.median(timings)
+        if update:
+            for name, elapsed in measured.items():
+                baselines[name] = round(elapsed, 4)
+            path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        for name, elapsed in measured.items():
+            with self.subTest(view=name):
+                self.assertIn(
+                    name,
+                    baselines,
+                    f"{name} の基準値がありません。UPDATE_PERF_BASELINES=1 で記録してください",
+                )
+                limit = baselines[name] * TIMING_TOLERANCE + TIMING_SLACK
+                self.assertLessEqual(
+                    elapsed,
+                    limit,
+                    f"{name} が {elapsed * 1000:.1f} ms かかりました "
+                    f"(基準値 {baselines[name] * 1000:.1f} ms)",
+                )
@@ -1,3 +1,1731 @@
-from django.test import TestCase
+import csv
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import os
+import smtplib
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    async_views,
+    bulk_import,
+    counters,
+    like_buffer,
+    load_shedding,
+    payments,
+    points,
+    postal_codes,
+    ratelimit,
+    reservations,
+    sales_rollups,
+    seller_stats,
+    suggestions,
+    view_tracking,
+    views,
+    webhooks,
+)
+from .forms import AddressForm
+from .hyperloglog import HyperLogLog
+from .mail import Sender
+from .models import (
+    Address,
+    DailySalesRollup,
+    Genre,
+    Like,
+    Notification,
+    Order,
+    OutgoingEmail,
+    Payment,
+    PendingLike,
+    PointSnapshot,
+    PointTransaction,
+    Product,
+    ProductImage,
+    ProductViewStats,
+    Reservation,
+    SearchQuery,
+    SellerStats,
+    WebhookEvent,
+)
+from .testing import PERFORMANCE_SETTINGS, Case, ViewPerformanceMixin
+
+User = get_user_model()
+
+WEBHOOK_SECRET = "whsec_test"
+STATUS_TOKEN = "status-token"
+
+
+def sign(payload, secret=WEBHOOK_SECRET, timestamp=None):
+    # Stripe と同じ形式の署名ヘッダーを作る
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(
+        secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def charge_refunded(event_id, charge_id, amount_refunded, refunded, created):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": "charge.refunded",
+        "created": created,
+        "data": {
+            "object": {
+                "id": charge_id,
+                "object": "charge",
+                "amount_refunded": amount_refunded,
+                "refunded": refunded,
+            }
+        },
+    }
+
+
+def dispute_event(event_id, event_type, charge_id, status, created):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "created": created,
+        "data": {
+            "object": {
+                "id": f"dp_{event_id}",
+                "object": "dispute",
+                "charge": charge_id,
+                "status": status,
+            }
+        },
+    }
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        self.seller = seller
+        self.buyer = buyer
+        genre = Genre.objects.create(name="本")
+        self.orders = {}
+        for charge_id in ("ch_1", "ch_2"):
+            product = Product.objects.create(
+                exhibitor=seller,
+                name=charge_id,
+                explanation="",
+                genre=genre,
+                product_status="new",
+                sales_status="sold",
+                value=1000,
+            )
+            address = Address.objects.create(
+                first_name="太郎",
+                last_name="山田",
+                first_name_kana="タロウ",
+                last_name_kana="ヤマダ",
+                postal_code="1000001",
+                prefecture="東京都",
+                address="千代田1-1",
+                tel="0312345678",
+            )
+            payment = Payment.objects.create(user=buyer, stripe_charge_id=charge_id)
+            self.orders[charge_id] = Order.objects.create(
+                product=product,
+                price=1000,
+                purchaser=buyer,
+                delivery_status="before_shipping",
+                address=address,
+                payment=payment,
+            )
+
+    def post(self, event, header=None):
+        payload = json.dumps(event).encode()
+        return self.client.post(
+            reverse("main:stripe_webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=sign(payload) if header is None else header,
+        )
+
+    def payment(self, charge_id):
+        return Payment.objects.get(stripe_charge_id=charge_id)
+
+    def test_valid_event_is_stored_without_processing(self):
+        response = self.post(charge_refunded("evt_1", "ch_1", 1000, True, 100))
+        self.assertEqual(response.status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.event_id, "evt_1")
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(self.payment("ch_1").status, "succeeded")
+
+    def test_rejects_bad_signatures(self):
+        event = charge_refunded("evt_1", "ch_1", 1000, True, 100)
+        payload = json.dumps(event).encode()
+        for header in (
+            sign(payload, secret="whsec_other"),
+            sign(payload, timestamp=int(time.time()) - 3600),
+            "t=abc,v1=def",
+            "",
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(self.post(event, header=header).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_refund_updates_payment_and_cancels_order(self):
+        self.post(charge_refunded("evt_1", "ch_1", 300, False, 100))
+        self.post(charge_refunded("evt_2", "ch_2", 1000, True, 100))
+        self.assertEqual(webhooks.process_batch(), 2)
+
+        partial = self.payment("ch_1")
+        self.assertEqual(partial.status, "partially_refunded")
+        self.assertEqual(partial.amount_refunded, 300)
+        self.orders["ch_1"].refresh_from_db()
+        self.assertIsNone(self.orders["ch_1"].canceled_at)
+
+        full = self.payment("ch_2")
+        self.assertEqual(full.status, "refunded")
+        self.orders["ch_2"].refresh_from_db()
+        self.assertIsNotNone(self.orders["ch_2"].canceled_at)
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_duplicate_events_are_applied_once(self):
+        event = dispute_event("evt_1", "charge.dispute.closed", "ch_1", "lost", 200)
+        self.post(event)
+        self.post(event)
+        self.assertEqual(webhooks.process_batch(), 2)
+        self.assertEqual(self.payment("ch_1").status, "dispute_lost")
+
+        # 再送されたイベントは処理済みとして扱い、その後の状態を上書きしない
+        Payment.objects.filter(stripe_charge_id="ch_1").update(status="succeeded")
+        self.post(event)
+        self.assertEqual(webhooks.process_batch(), 1)
+        self.assertEqual(self.payment("ch_1").status, "succeeded")
+
+    def test_events_are_applied_in_created_order(self):
+        self.post(dispute_event("evt_2", "charge.dispute.closed", "ch_1", "won", 300))
+        self.post(dispute_event("evt_1", "charge.dispute.created", "ch_1", "needs_response", 200))
+        webhooks.process_batch()
+        self.assertEqual(self.payment("ch_1").status, "succeeded")
+
+        # 反映済みのものより古いイベントは無視する
+        self.post(dispute_event("evt_0", "charge.dispute.created", "ch_1", "needs_response", 100))
+        webhooks.process_batch()
+        self.assertEqual(self.payment("ch_1").status, "succeeded")
+
+    def test_rejects_payloads_that_are_not_events(self):
+        valid = charge_refunded("evt_1", "ch_1", 1000, True, 100)
+        for event in (
+            [],
+            {"type": "charge.refunded"},
+            {"id": 1},
+            {key: value for key, value in valid.items() if key != "created"},
+            {**valid, "data": {}},
+            {**valid, "data": {"object": {"object": "dispute", "charge": {"id": "ch_1"}}}},
+        ):
+            with self.subTest(event=event):
+                self.assertEqual(self.post(event).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_events_for_unknown_payments_are_retried(self):
+        self.post(charge_refunded("evt_1", "ch_new", 1000, True, 100))
+        self.assertEqual(webhooks.process_batch(), 1)
+        event = WebhookEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertIsNotNone(event.retry_at)
+        # 再試行の時刻までは取り出さない
+        self.assertEqual(webhooks.process_batch(), 0)
+
+        # 決済が保存されたあとに処理し直すと反映される
+        Payment.objects.create(user=self.buyer, stripe_charge_id="ch_new")
+        WebhookEvent.objects.update(retry_at=timezone.now())
+        self.assertEqual(webhooks.process_batch(), 1)
+        self.assertEqual(self.payment("ch_new").status, "refunded")
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_old_events_for_unknown_payments_are_dropped(self):
+        self.post(charge_refunded("evt_1", "ch_new", 1000, True, 100))
+        WebhookEvent.objects.update(received_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(webhooks.process_batch(), 1)
+        self.assertIsNotNone(WebhookEvent.objects.get().processed_at)
+
+    def test_malformed_events_do_not_block_later_events(self):
+        # 検証を入れる前に保存されたイベントなど
+        WebhookEvent.objects.create(event_id="evt_0", event_type="charge.refunded", payload="{}")
+        WebhookEvent.objects.create(
+            event_id="evt_1",
+            event_type="charge.refunded",
+            payload=json.dumps(charge_refunded("evt_1", "ch_1", "300", False, 100)),
+        )
+        self.post(charge_refunded("evt_2", "ch_2", 1000, True, 100))
+        with self.assertLogs("main.webhooks", "WARNING") as logs:
+            self.assertEqual(webhooks.process_batch(), 3)
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(self.payment("ch_1").status, "succeeded")
+        self.assertEqual(self.payment("ch_2").status, "refunded")
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_canceled_orders_are_removed_from_sales(self):
+        seller_stats.rebuild()
+        sales_rollups.rebuild()
+        self.orders["ch_1"].delivery_status = "shipped"
+        self.orders["ch_1"].save()
+        sales_rollups.orders_status_changed([self.orders["ch_1"]], "shipped")
+        self.post(dispute_event("evt_1", "charge.dispute.closed", "ch_1", "lost", 100))
+        self.post(charge_refunded("evt_2", "ch_2", 300, False, 100))
+        webhooks.process_batch()
+
+        stats = SellerStats.objects.get(user=self.seller)
+        self.assertEqual((stats.sold_count, stats.total_sales), (2, 1000))
+        rollup = DailySalesRollup.objects.get(seller=self.seller)
+        self.assertEqual(
+            (rollup.order_count, rollup.revenue, rollup.shipped_count), (1, 1000, 0)
+        )
+        # 取り消した注文を発送済みにしても数えない
+        order = self.orders["ch_1"]
+        order.refresh_from_db()
+        order.delivery_status = "delivered"
+        sales_rollups.orders_status_changed([order], "delivered")
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.delivered_count, 0)
+
+        # 作り直しても同じ値になる
+        seller_stats.rebuild()
+        sales_rollups.rebuild()
+        self.assertEqual(SellerStats.objects.get(user=self.seller).total_sales, 1000)
+        self.assertEqual(DailySalesRollup.objects.get(seller=self.seller).revenue, 1000)
+
+        # 取り消された注文の商品を削除しても、売上を二重に引かない
+        self.client.force_login(self.seller)
+        self.client.post(reverse("main:delete_product", args=[order.product_id]))
+        stats = SellerStats.objects.get(user=self.seller)
+        self.assertEqual((stats.listing_count, stats.total_sales), (1, 1000))
+
+    def test_batches_use_a_fixed_number_of_queries(self):
+        for i in range(20):
+            self.post(charge_refunded(f"evt_{i}", f"ch_{i % 2 + 1}", i, False, i))
+        with self.assertNumQueries(7):
+            self.assertEqual(webhooks.process_batch(), 20)
+        self.assertEqual(self.payment("ch_2").amount_refunded, 19)
+
+
+class PostalCodeTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "postal_codes.bin"
+        rows = [
+            ["13101", "", "1000001", "", "", "", "東京都", "千代田区", "千代田"],
+            ["13101", "", "1000005", "", "", "", "東京都", "千代田区", "丸の内（次のビルを除く）"],
+            ["01101", "", "0600000", "", "", "", "北海道", "札幌市中央区", "以下に掲載がない場合"],
+            ["47201", "", "9071801", "", "", "", "沖縄県", "与那国町", "与那国"],
+            ["47201", "", "9071801", "", "", "", "沖縄県", "与那国町", "比川"],
+            ["99999", "", "１０００００２", "", "", "", "東京都", "全角", ""],
+        ]
+        csv_path = Path(self.tmp.name) / "KEN_ALL.CSV"
+        with open(csv_path, "w", encoding="cp932", newline="") as f:
+            csv.writer(f).writerows(rows)
+        call_command("compile_postal_codes", str(csv_path), output=str(self.path), stdout=io.StringIO())
+        self.user = User.objects.create_user("buyer", password="pw-xyz-123")
+        self.client.force_login(self.user)
+
+    def test_table_lookup(self):
+        table = postal_codes.PostalCodeTable(self.path)
+        self.assertEqual(table.count, 4)
+        self.assertEqual(
+            table.lookup("0600000"),
+            {"postal_code": "0600000", "prefecture": "北海道", "city": "札幌市中央区", "town": ""},
+        )
+        self.assertEqual(table.lookup("1000005")["town"], "丸の内")
+        # 町域が複数ある郵便番号は市区町村までにする
+        self.assertEqual(table.lookup("9071801")["town"], "")
+        self.assertIsNone(table.lookup("1000002"))
+        self.assertIsNone(table.lookup("0000000"))
+        self.assertIsNone(table.lookup("9999999"))
+
+    def test_lookup_view_and_form(self):
+        url = reverse("main:postal_code_lookup")
+        with override_settings(POSTAL_CODE_FILE=self.path):
+            response = self.client.get(url, {"code": "1000001"})
+            self.assertEqual(response.json()["city"], "千代田区")
+            for code in ("1000002", "²²²²²²²", "100-0001"):
+                with self.subTest(code=code):
+                    self.assertEqual(self.client.get(url, {"code": code}).status_code, 404)
+                    form = AddressForm(data={"postal_code": code})
+                    self.assertIn("postal_code", form.errors)
+            self.assertNotIn("postal_code", AddressForm(data={"postal_code": "1000001"}).errors)
+
+    def test_missing_file_skips_the_existence_check(self):
+        with override_settings(POSTAL_CODE_FILE=Path(self.tmp.name) / "missing.bin"):
+            self.assertFalse(postal_codes.available())
+            response = self.client.get(reverse("main:postal_code_lookup"), {"code": "1000001"})
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn("postal_code", AddressForm(data={"postal_code": "1000002"}).errors)
+            self.assertIn("postal_code", AddressForm(data={"postal_code": "²²²²²²²"}).errors)
+
+
+def png_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=self.media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        Genre.objects.create(name="本")
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as f:
+            f.writestr("a.png", png_bytes("red"))
+            f.writestr("b.png", png_bytes("blue"))
+            f.writestr("broken.png", b"not an image")
+        self.archive = archive.getvalue()
+
+    def run_import(self, rows, **kwargs):
+        text = io.StringIO()
+        writer = csv.writer(text)
+        writer.writerow(bulk_import.COLUMNS)
+        writer.writerows(rows)
+        return bulk_import.import_listings(
+            self.seller,
+            io.BytesIO(text.getvalue().encode("utf-8")),
+            io.BytesIO(self.archive),
+            **kwargs,
+        )
+
+    def stored_images(self):
+        root = Path(self.media.name)
+        return sorted(p.name for p in root.rglob("*") if p.is_file())
+
+    def test_valid_rows_are_listed(self):
+        result = self.run_import(
+            [
+                ["本1", "説明", "本", "new", "1000", "a.png;b.png"],
+                ["本2", "説明", "本", "bad", "300", "b.png"],
+            ]
+        )
+        self.assertEqual((result.created, result.errors), (2, []))
+        products = Product.objects.filter(exhibitor=self.seller).order_by("name")
+        self.assertEqual(
+            [(p.name, p.sales_status, p.product_images.count()) for p in products],
+            [("本1", "on_display", 2), ("本2", "on_display", 1)],
+        )
+        self.assertEqual(SellerStats.objects.get(user=self.seller).listing_count, 2)
+        self.assertEqual(len(self.stored_images()), 3)
+
+    def test_row_errors_are_reported_and_skipped(self):
+        result = self.run_import(
+            [
+                ["本1", "説明", "家電", "new", "1000", "a.png"],
+                ["本2", "説明", "本", "new", "100", "a.png"],
+                ["本3", "説明", "本", "new", "千円", "a.png"],
+                ["本4", "説明", "本", "new", "1000", "missing.png"],
+                ["本5", "説明", "本", "new", "1000", "broken.png"],
+                ["本6", "説明", "本", "new", "1000", ""],
+                ["本7", "説明", "本", "new", "1000", "a.png"],
+            ]
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4, 5, 6, 7])
+        self.assertTrue(result.errors[0][1][0].startswith("genre:"))
+        self.assertTrue(result.errors[1][1][0].startswith("value:"))
+        self.assertTrue(result.errors[2][1][0].startswith("value:"))
+        self.assertEqual(result.errors[3][1], ["missing.png が ZIP の中にありません。"])
+        self.assertEqual(result.errors[4][1], ["broken.png は画像として読み込めません。"])
+        self.assertEqual(
+            list(Product.objects.values_list("name", flat=True)), ["本7"]
+        )
+        # エラーの行の画像は保存しない
+        self.assertEqual(len(self.stored_images()), 1)
+
+    def test_a_failed_batch_leaves_nothing_behind(self):
+        rows = [[f"本{i}", "説明", "本", "new", "1000", "a.png"] for i in range(3)]
+        with mock.patch.object(
+            ProductImage.objects, "bulk_create", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.run_import(rows, batch_size=2)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(SellerStats.objects.exists())
+        self.assertEqual(self.stored_images(), [])
+
+    def test_bad_files_are_reported_for_the_whole_import(self):
+        self.archive = b"not a zip"
+        result = self.run_import([["本1", "説明", "本", "new", "1000", "a.png"]])
+        self.assertEqual(result.errors, [(None, ["画像の ZIP を読み込めません。"])])
+        self.assertFalse(Product.objects.exists())
+
+
+class MailSpoolTests(TestCase):
+    def test_only_production_spools_mail(self):
+        production = importlib.import_module("flea_market_app.settings.production")
+        common = importlib.import_module("flea_market_app.settings.common")
+        self.assertEqual(production.EMAIL_BACKEND, "main.mail.SpooledEmailBackend")
+        self.assertEqual(
+            common.EMAIL_BACKEND, "django.core.mail.backends.console.EmailBackend"
+        )
+
+    def spool(self):
+        with override_settings(EMAIL_BACKEND="main.mail.SpooledEmailBackend"):
+            message = EmailMultiAlternatives(
+                "件名", "本文", "from@example.com", ["to@example.com"]
+            )
+            message.attach_alternative("<p>本文</p>", "text/html")
+            message.attach("a.txt", "添付", "text/plain")
+            self.assertEqual(message.send(), 1)
+        self.assertEqual(mail.outbox, [])
+        return OutgoingEmail.objects.get()
+
+    def test_sender_delivers_and_deletes_spooled_mail(self):
+        self.spool()
+        sender = Sender("django.core.mail.backends.locmem.EmailBackend")
+        self.assertEqual(sender.send_batch(), 1)
+        self.assertFalse(OutgoingEmail.objects.exists())
+        [sent] = mail.outbox
+        self.assertEqual((sent.subject, sent.to), ("件名", ["to@example.com"]))
+        self.assertEqual(sent.alternatives, [("<p>本文</p>", "text/html")])
+        self.assertEqual(sent.attachments, [("a.txt", "添付", "text/plain")])
+
+    def test_failed_sends_are_retried(self):
+        row = self.spool()
+        sender = Sender("django.core.mail.backends.locmem.EmailBackend")
+        error = smtplib.SMTPRecipientsRefused({})
+        with mock.patch.object(sender.connection, "send_messages", side_effect=error):
+            self.assertEqual(sender.send_batch(), 1)
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 1)
+        self.assertIn("SMTPRecipientsRefused", row.last_error)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        # 再試行の時刻までは送らない
+        self.assertEqual(sender.send_batch(), 0)
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(sender.send_batch(), 1)
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_SPOOL_MAX_ATTEMPTS=2)
+    def test_mail_is_kept_after_the_last_attempt(self):
+        self.spool()
+        sender = Sender("django.core.mail.backends.locmem.EmailBackend")
+        with mock.patch.object(sender.connection, "send_messages", side_effect=OSError):
+            for _ in range(2):
+                sender.send_batch()
+                OutgoingEmail.objects.filter(next_attempt_at__isnull=False).update(
+                    next_attempt_at=timezone.now()
+                )
+        row = OutgoingEmail.objects.get()
+        self.assertEqual(row.attempts, 2)
+        self.assertIsNone(row.next_attempt_at)
+        self.assertEqual(sender.send_batch(), 0)
+
+
+class GcMediaTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=self.media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        seller = User.objects.create_user(
+            "seller", password="pw-xyz-123", icon="user_icon/me.png"
+        )
+        Genre.objects.create(name="本", image="genre_image/book.png")
+        product = Product.objects.create(
+            exhibitor=seller,
+            name="本",
+            explanation="",
+            product_status="new",
+            sales_status="on_display",
+            value=1000,
+        )
+        ProductImage.objects.create(product=product, image="product_image/used.png")
+        old = time.time() - 48 * 3600
+        self.files = {
+            "product_image/used.png": old,
+            "genre_image/book.png": old,
+            "user_icon/me.png": old,
+            "product_image/orphan.png": old,
+            "product_image/2024/nested.png": old,
+            "user_icon/uploading.png": time.time(),
+            "other/untouched.png": old,
+        }
+        for name, mtime in self.files.items():
+            path = Path(self.media.name) / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x")
+            os.utime(path, (mtime, mtime))
+
+    def gc(self, **options):
+        out = io.StringIO()
+        call_command("gc_media", stdout=out, **options)
+        return out.getvalue()
+
+    def remaining(self, root=None):
+        root = Path(root or self.media.name)
+        return sorted(
+            str(p.relative_to(root)) for p in root.rglob("*") if p.is_file()
+        )
+
+    def test_dry_run_only_lists_orphans(self):
+        out = self.gc(dry_run=True)
+        self.assertIn("product_image/orphan.png\n", out)
+        self.assertIn("product_image/2024/nested.png\n", out)
+        self.assertIn("対象 2 件", out)
+        self.assertEqual(self.remaining(), sorted(self.files))
+
+    def test_orphans_are_deleted_and_referenced_files_kept(self):
+        for chunk_size in (1, 100000):
+            with self.subTest(chunk_size=chunk_size):
+                self.gc(chunk_size=chunk_size)
+                self.assertEqual(
+                    self.remaining(),
+                    sorted(
+                        [
+                            "genre_image/book.png",
+                            "other/untouched.png",
+                            "product_image/used.png",
+                            "user_icon/me.png",
+                            "user_icon/uploading.png",
+                        ]
+                    ),
+                )
+
+    def test_quarantine_moves_orphans(self):
+        self.assertIn("隔離 2 件", self.gc(quarantine=True))
+        self.assertEqual(
+            self.remaining(Path(self.media.name) / ".quarantine"),
+            ["product_image/2024/nested.png", "product_image/orphan.png"],
+        )
+        self.assertNotIn("product_image/orphan.png", self.remaining())
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = Path(self.tmp.name)
+
+    def test_sampled_requests_are_written_per_url_name(self):
+        user = User.objects.create_user("buyer", password="pw-xyz-123")
+        self.client.force_login(user)
+
+        def slow_suggest(prefix):
+            time.sleep(0.05)
+            return []
+
+        with override_settings(
+            PROFILER_SAMPLE_RATE=1, PROFILER_DIR=self.directory, PROFILER_INTERVAL=0.001
+        ), mock.patch.object(suggestions, "suggest", slow_suggest):
+            self.client.get(reverse("main:search_suggestions"), {"q": "本"})
+        [path] = self.directory.iterdir()
+        self.assertEqual(path.name, f"main.search_suggestions.{os.getpid()}.collapsed")
+        stacks = path.read_text(encoding="utf-8").splitlines()
+        self.assertTrue(stacks)
+        expected = "main.views:search_suggestions;main.tests:slow_suggest"
+        self.assertTrue(any(expected in stack for stack in stacks))
+
+    def test_merge_profiles_combines_processes(self):
+        files = {
+            "main.product_detail.100.collapsed": "a;b 2\na;c 1\n",
+            "main.product_detail.200.collapsed": "a;b 3\n",
+            "main.list.v2.100.collapsed": "a;d 4\n",
+            "account_login.200.collapsed": "a;e 1\n",
+        }
+        for name, text in files.items():
+            (self.directory / name).write_text(text, encoding="utf-8")
+        output = self.directory / "merged.txt"
+        out = io.StringIO()
+        call_command(
+            "merge_profiles", dir=str(self.directory), output=str(output), stdout=out
+        )
+        self.assertEqual(
+            output.read_text(encoding="utf-8").splitlines(),
+            [
+                "account_login;a;e 1",
+                "main:list.v2;a;d 4",
+                "main:product_detail;a;b 5",
+                "main:product_detail;a;c 1",
+            ],
+        )
+        self.assertIn("       6  main:product_detail", out.getvalue())
+
+        call_command(
+            "merge_profiles",
+            dir=str(self.directory),
+            url_name=["main:product_detail"],
+            delete=True,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(
+            sorted(path.name for path in self.directory.glob("*.collapsed")),
+            ["account_login.200.collapsed", "main.list.v2.100.collapsed"],
+        )
+
+
+@override_settings(
+    LOAD_SHEDDING={
+        "max_in_flight": 3,
+        "low_priority_max_in_flight": 1,
+        "latency_threshold": 1.0,
+        "latency_window": 10,
+        "samples": 50,
+        "retry_after": 7,
+    }
+)
+class LoadSheddingTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        shedder = mock.patch.object(load_shedding, "_shedder", None)
+        shedder.start()
+        self.addCleanup(shedder.stop)
+        self.client.force_login(User.objects.create_user("buyer", password="pw-xyz-123"))
+        # 最初のリクエストでミドルウェアが作られる
+        self.get("main:product_list")
+        self.shedder = load_shedding._shedder
+
+    def get(self, name):
+        return self.client.get(reverse(name), {"code": "1000001"})
+
+    def occupy(self, count):
+        for _ in range(count):
+            self.assertIsNone(self.shedder.admit("main:home"))
+
+    def test_low_priority_requests_are_shed_first(self):
+        self.occupy(1)
+        response = self.get("main:product_list")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(self.get("main:home").status_code, 200)
+
+        self.occupy(2)
+        self.assertEqual(self.get("main:home").status_code, 503)
+        # 決済などの URL は混雑していても受ける
+        self.assertNotEqual(self.get("main:postal_code_lookup").status_code, 503)
+        self.assertEqual(self.shedder.in_flight, 3)
+
+    def test_slow_responses_shed_low_priority_requests(self):
+        for _ in range(10):
+            self.shedder.admit("main:sales_dashboard")
+            self.shedder.finish("main:sales_dashboard", 2.0)
+        self.shedder._p95_at = 0
+        self.assertEqual(self.get("main:product_list").status_code, 503)
+        self.assertEqual(self.get("main:home").status_code, 200)
+
+    def test_in_flight_is_released_when_the_view_raises(self):
+        with mock.patch.object(
+            views.ProductListView, "get_queryset", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.get("main:product_list")
+        self.assertEqual(self.shedder.in_flight, 0)
+        route = self.shedder.routes["main:product_list"]
+        self.assertEqual((route.in_flight, route.admitted), (0, 2))
+
+
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genre = Genre.objects.create(name="本")
+        self.products = [
+            Product.objects.create(
+                exhibitor=self.seller,
+                name=f"本{i}",
+                explanation="",
+                genre=genre,
+                product_status="new",
+                sales_status="on_display",
+                value=1000,
+            )
+            for i in range(2)
+        ]
+        self.client.force_login(self.buyer)
+
+    def toggle(self, product):
+        return self.client.post(reverse("main:like_toggle", args=[product.pk])).json()
+
+    def test_toggles_are_coalesced_on_flush(self):
+        product = self.products[0]
+        self.assertEqual(self.toggle(product), {"liked": True, "likes_count": 1})
+        self.assertEqual(self.toggle(product), {"liked": False, "likes_count": 0})
+        self.assertEqual(self.toggle(product), {"liked": True, "likes_count": 1})
+        self.assertFalse(Like.objects.exists())
+        # 反映前でも詳細ページには自分の切り替えが見える
+        response = self.client.get(reverse("main:product_detail", args=[product.pk]))
+        self.assertTrue(response.context["item"].is_liked)
+
+        self.assertEqual(like_buffer.flush(), 1)
+        self.assertTrue(Like.objects.filter(user=self.buyer, product=product).exists())
+        self.assertEqual(counters.get_counter(self.buyer).liked_count, 1)
+        self.assertFalse(PendingLike.objects.exists())
+
+    def test_flush_in_batches_keeps_order(self):
+        for liked in (True, False, True, False):
+            like_buffer.set_state(self.buyer.pk, self.products[0].pk, liked)
+        like_buffer.set_state(self.buyer.pk, self.products[1].pk, True)
+        with self.settings(LIKE_BUFFER_BATCH_SIZE=2):
+            self.assertEqual(like_buffer.flush(max_entries=3), 2)
+            self.assertEqual(PendingLike.objects.count(), 2)
+            like_buffer.flush()
+        self.assertEqual(
+            list(Like.objects.values_list("product_id", flat=True)),
+            [self.products[1].pk],
+        )
+        self.assertEqual(counters.get_counter(self.buyer).liked_count, 1)
+
+    def test_deleted_products_are_skipped(self):
+        like_buffer.set_state(self.buyer.pk, self.products[0].pk, True)
+        self.products[0].delete()
+        like_buffer.flush()
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(PendingLike.objects.exists())
+
+
+@override_settings(SUGGESTION_QUERY_FLUSH_INTERVAL=None)
+class LikeCounterTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        self.products = [
+            Product.objects.create(
+                exhibitor=self.seller,
+                name=f"本{i}",
+                explanation="",
+                product_status="new",
+                sales_status="on_display",
+                value=1000,
+            )
+            for i in range(3)
+        ]
+        self.client.force_login(self.buyer)
+
+    def post(self, name, product):
+        self.client.post(reverse(f"main:{name}", args=[product.pk]))
+
+    def assertCounterInStep(self, expected):
+        like_buffer.flush()
+        count = Like.objects.filter(user=self.buyer).count()
+        self.assertEqual(count, expected)
+        buyer = User.objects.get(pk=self.buyer.pk)
+        self.assertEqual(counters.get_counter(buyer).liked_count, count)
+
+    def test_like_and_unlike_keep_the_counter_in_step(self):
+        first, second, third = self.products
+        self.post("like", first)
+        self.post("like", first)
+        self.post("like", second)
+        self.assertCounterInStep(2)
+
+        # 反映済みのいいねを二重に付けたり外したりしても数がずれない
+        self.post("like", first)
+        self.post("unlike", second)
+        self.post("unlike", second)
+        self.post("unlike", third)
+        self.assertCounterInStep(1)
+
+        self.post("like_toggle", third)
+        self.post("like_toggle", first)
+        self.assertCounterInStep(1)
+        self.assertEqual(
+            list(Like.objects.values_list("product_id", flat=True)), [third.pk]
+        )
+
+    def test_counter_never_goes_negative(self):
+        product = self.products[0]
+        self.post("unlike", product)
+        self.assertCounterInStep(0)
+        self.post("like", product)
+        self.assertCounterInStep(1)
+        # 反映前に商品が削除されても、削除されたいいねの分だけ減らす
+        self.post("unlike", product)
+        self.client.force_login(self.seller)
+        self.client.post(reverse("main:delete_product", args=[product.pk]))
+        self.assertCounterInStep(0)
+        self.assertFalse(PendingLike.objects.exists())
+
+    def test_liked_list_uses_the_counter(self):
+        for product in self.products:
+            self.post("like", product)
+        like_buffer.flush()
+        response = self.client.get(reverse("main:liked_list"))
+        self.assertEqual(response.context["liked_count"], 3)
+        self.assertEqual(
+            [like.product_id for like in response.context["likes"]],
+            [product.pk for product in reversed(self.products)],
+        )
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        suggestions.reset()
+        suggestions._query_counts.clear()
+        self.addCleanup(suggestions.reset)
+        Genre.objects.create(name="本")
+
+    def test_changes_during_rebuild_are_kept(self):
+        build = suggestions.build
+
+        def build_and_add():
+            index = build()
+            suggestions.product_added(Product(name="途中で出品"))
+            return index
+
+        with mock.patch.object(suggestions, "build", build_and_add):
+            suggestions.rebuild()
+        self.assertEqual(suggestions.suggest("途中"), ["途中で出品"])
+
+    @override_settings(SUGGESTION_BUILD_IN_BACKGROUND=True)
+    def test_stale_index_is_served_while_rebuilding(self):
+        stale = suggestions.PrefixIndex(8)
+        stale.add("古い")
+        fresh = suggestions.PrefixIndex(8)
+        fresh.add("新しい")
+        suggestions._index = stale
+        ready = threading.Event()
+
+        def build():
+            ready.wait(5)
+            return fresh
+
+        with mock.patch.object(suggestions, "build", build):
+            self.assertEqual(suggestions.suggest("古"), ["古い"])
+            ready.set()
+            for _ in range(100):
+                if suggestions._index is fresh:
+                    break
+                time.sleep(0.05)
+        self.assertEqual(suggestions.suggest("新"), ["新しい"])
+
+    def test_searched_queries_are_written_in_one_flush(self):
+        for keyword in ("本", "ＢＯＯＫ", "book", "本"):
+            suggestions.query_searched(keyword)
+        self.assertFalse(SearchQuery.objects.exists())
+        self.assertEqual(suggestions.flush_queries(), 2)
+        self.assertEqual(
+            dict(SearchQuery.objects.values_list("query", "count")),
+            {"本": 2, "book": 2},
+        )
+        self.assertEqual(suggestions.flush_queries(), 0)
+
+
+class PointLedgerTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(f"user{i}", password="pw-xyz-123") for i in range(3)
+        ]
+
+    def earn(self, *amounts):
+        points.record(
+            *(
+                (user.pk, amount, "adjustment", None)
+                for user, amount in zip(self.users, amounts)
+            )
+        )
+
+    def test_spend_only_within_balance(self):
+        user = self.users[0]
+        self.earn(500)
+        spent = points.spend(user.pk, 300)
+        self.assertEqual(points.balance(user.pk), 200)
+        self.assertIsNone(points.spend(user.pk, 300))
+        points.cancel(spent)
+        self.assertEqual(points.balance(user.pk), 500)
+
+    def test_snapshots_resume_after_a_partial_run(self):
+        self.earn(100, 200, 300)
+        self.earn(10, 20, 30)
+        save = points._save_snapshots
+        saved = []
+
+        def save_once(user_ids, high_water):
+            # 2つ目の区切りで止まったことにする
+            if saved:
+                raise RuntimeError
+            saved.append(high_water)
+            return save(user_ids, high_water)
+
+        with mock.patch.object(points, "_save_snapshots", save_once):
+            with self.assertRaises(RuntimeError):
+                points.take_snapshots(settle_seconds=-1, batch_size=3)
+        self.assertEqual(points.take_snapshots(settle_seconds=-1, batch_size=3), 3)
+        # 重なって動いても同じ取引は二重に足さない
+        self.assertEqual(save({user.pk for user in self.users}, saved[0] + 3), 0)
+        self.assertEqual(
+            sorted(PointSnapshot.objects.values_list("balance", flat=True)),
+            [110, 220, 330],
+        )
+        self.assertEqual(
+            [points.balance(user.pk) for user in self.users], [110, 220, 330]
+        )
+        self.assertFalse(points.mismatched_snapshots().exists())
+
+
+@override_settings(RATE_LIMITS={"main:product_list": {"rate": "2/m"}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.users = [
+            User.objects.create_user(f"user{i}", password="pw-xyz-123") for i in range(2)
+        ]
+
+    def test_users_behind_one_address_are_counted_separately(self):
+        url = reverse("main:product_list")
+        for user in self.users:
+            self.client.force_login(user)
+            statuses = [self.client.get(url).status_code for _ in range(3)]
+            self.assertEqual(statuses, [200, 200, 429])
+
+    def test_concurrent_requests_are_all_counted(self):
+        now = 6000.0
+        results = []
+        barrier = threading.Barrier(20)
+
+        def request():
+            barrier.wait()
+            results.append(ratelimit.consume("scope", ["user:1"], "5/m", now=now))
+
+        set_many = LocMemCache.set_many
+
+        def slow_set_many(cache, *args, **kwargs):
+            # 読んでから書くまでの間に他のスレッドが割り込めるようにする
+            time.sleep(0.01)
+            return set_many(cache, *args, **kwargs)
+
+        threads = [threading.Thread(target=request) for _ in range(20)]
+        with mock.patch.object(LocMemCache, "set_many", slow_set_many):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(0.0), 5)
+
+    def test_previous_window_counts_while_it_slides_out(self):
+        for _ in range(4):
+            self.assertEqual(ratelimit.consume("scope", ["ip:1"], "4/m", now=6030.0), 0)
+        self.assertAlmostEqual(
+            ratelimit.consume("scope", ["ip:1"], "4/m", now=6059.0), 1.0
+        )
+        # 次の区間に入って15秒後は、直前の4回が3回分として残る
+        self.assertEqual(ratelimit.consume("scope", ["ip:1"], "4/m", now=6075.0), 0)
+        self.assertAlmostEqual(
+            ratelimit.consume("scope", ["ip:1"], "4/m", now=6075.0), 15.0
+        )
+        self.assertEqual(ratelimit.consume("scope", ["ip:1"], "4/m", now=6090.0), 0)
+
+    @override_settings(RATE_LIMIT_PROXY_COUNT=1)
+    def test_client_address_comes_from_the_trusted_proxy(self):
+        request = RequestFactory().get(
+            "/", HTTP_X_FORWARDED_FOR="10.0.0.1, 203.0.113.5", REMOTE_ADDR="192.168.0.1"
+        )
+        self.assertEqual(ratelimit.client_ip(request), "203.0.113.5")
+        request = RequestFactory().get("/", REMOTE_ADDR="192.168.0.1")
+        self.assertEqual(ratelimit.client_ip(request), "192.168.0.1")
+        with self.settings(RATE_LIMIT_PROXY_COUNT=0):
+            request = RequestFactory().get(
+                "/", HTTP_X_FORWARDED_FOR="203.0.113.5", REMOTE_ADDR="192.168.0.1"
+            )
+            self.assertEqual(ratelimit.client_ip(request), "192.168.0.1")
+
+
+class HyperLogLogTests(TestCase):
+    def test_count_is_close_to_distinct_values(self):
+        sketch = HyperLogLog(10)
+        for _ in range(2):
+            for i in range(10000):
+                sketch.add(i)
+        self.assertAlmostEqual(sketch.count(), 10000, delta=10000 * 0.1)
+
+    def test_small_counts_are_exact_enough(self):
+        sketch = HyperLogLog(10)
+        for i in range(20):
+            sketch.add(f"user-{i}")
+        self.assertEqual(sketch.count(), 20)
+
+    def test_merge_counts_union(self):
+        a, b = HyperLogLog(10), HyperLogLog(10)
+        for i in range(3000):
+            a.add(i)
+        for i in range(2000, 5000):
+            b.add(i)
+        a.merge(HyperLogLog.from_bytes(b.to_bytes()))
+        self.assertAlmostEqual(a.count(), 5000, delta=5000 * 0.1)
+
+
+@override_settings(VIEW_TRACKING_FLUSH_INTERVAL=None)
+class ViewTrackingTests(TestCase):
+    def setUp(self):
+        # 他のテストで溜まった閲覧やキャッシュしたユーザーを捨てる
+        view_tracking._pending.clear()
+        for cache in caches.all():
+            cache.clear()
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyers = [
+            User.objects.create_user(f"buyer{i}", password="pw-xyz-123") for i in range(2)
+        ]
+        genre = Genre.objects.create(name="本")
+        self.product = Product.objects.create(
+            exhibitor=self.seller,
+            name="本",
+            explanation="",
+            genre=genre,
+            product_status="new",
+            sales_status="on_display",
+            value=1000,
+        )
+        self.url = reverse("main:product_detail", args=[self.product.pk])
+
+    def view(self, user, times=1):
+        self.client.force_login(user)
+        for _ in range(times):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_views_are_written_only_on_flush(self):
+        self.view(self.buyers[0], 3)
+        self.view(self.buyers[1])
+        # 出品者自身の閲覧は数えない
+        self.view(self.seller)
+        self.assertFalse(ProductViewStats.objects.exists())
+        self.assertEqual(view_tracking.flush(), 1)
+        stats = ProductViewStats.objects.get(product=self.product)
+        self.assertEqual((stats.hits, stats.unique_viewers), (4, 2))
+
+        # 前回のスケッチとまとめるので、同じユーザーは数え直さない
+        self.view(self.buyers[0], 2)
+        view_tracking.flush()
+        stats.refresh_from_db()
+        self.assertEqual((stats.hits, stats.unique_viewers), (6, 2))
+        self.assertEqual(view_tracking.flush(), 0)
+
+    def test_exhibitor_sees_view_counts(self):
+        self.view(self.buyers[0], 2)
+        view_tracking.flush()
+        self.view(self.seller)
+        self.assertContains(self.client.get(self.url), "閲覧 1人 (2回)")
+
+    def test_deleted_products_are_skipped(self):
+        self.view(self.buyers[0])
+        self.product.delete()
+        self.assertEqual(view_tracking.flush(), 0)
+        self.assertFalse(ProductViewStats.objects.exists())
+
+
+def add_listings(seller, buyer, genre, size):
+    """出品中と売却済みの商品を size 件ずつ、関連する行と一緒に作る。"""
+    products = Product.objects.bulk_create(
+        Product(
+            exhibitor=seller,
+            name=f"商品{i}",
+            explanation="説明",
+            genre=genre,
+            product_status="new",
+            sales_status="on_display" if i % 2 else "sold",
+            value=1000,
+        )
+        for i in range(size * 2)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f"product_image/{product.pk}-{i}.png")
+        for product in products
+        for i in range(2)
+    )
+    on_display = [product for product in products if product.sales_status == "on_display"]
+    sold = [product for product in products if product.sales_status == "sold"]
+    Like.objects.bulk_create(Like(user=buyer, product=product) for product in on_display)
+    addresses = Address.objects.bulk_create(
+        Address(
+            first_name="太郎",
+            last_name="山田",
+            first_name_kana="タロウ",
+            last_name_kana="ヤマダ",
+            postal_code="1000001",
+            prefecture="東京都",
+            address="千代田1-1",
+            tel="0312345678",
+        )
+        for _ in sold
+    )
+    payments = Payment.objects.bulk_create(
+        Payment(user=buyer, stripe_charge_id=f"ch_{product.pk}") for product in sold
+    )
+    orders = Order.objects.bulk_create(
+        Order(
+            product=product,
+            price=product.value,
+            purchaser=buyer,
+            delivery_status="before_shipping" if i % 2 else "shipped",
+            address=address,
+            payment=payment,
+        )
+        for i, (product, address, payment) in enumerate(zip(sold, addresses, payments))
+    )
+    Notification.objects.bulk_create(
+        notification
+        for order in orders
+        for notification in (
+            Notification(user=seller, order=order, is_action=True),
+            Notification(user=buyer, order=order, is_action=False),
+        )
+    )
+    PointTransaction.objects.bulk_create(
+        transaction
+        for order in orders
+        for transaction in (
+            PointTransaction(user=buyer, amount=-100, reason="purchase", order=order),
+            PointTransaction(user=seller, amount=900, reason="sale", order=order),
+        )
+    )
+    # 集計テーブルは作り直す
+    seller_stats.rebuild()
+    counters.rebuild()
+    sales_rollups.rebuild()
+    return on_display, orders
+
+
+class DeactivatedSellerTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genre = Genre.objects.create(name="本")
+        self.product = add_listings(seller, self.buyer, genre, 1)[0][0]
+        seller.is_active = False
+        seller.save(update_fields=["is_active"])
+        self.client.force_login(self.buyer)
+
+    def test_items_cannot_be_opened_or_bought(self):
+        pk = self.product.pk
+        for name in ("main:product_detail", "main:async_product_detail"):
+            with self.subTest(name):
+                response = self.client.get(reverse(name, args=[pk]))
+                self.assertEqual(response.status_code, 404)
+        url = reverse("main:purchase_confirmation", args=[pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        session = self.client.session
+        session["item_pk_info"] = pk
+        session["purchase_info"] = {"point": 0, "total_amount": self.product.value}
+        session["address_info"] = {"postal_code": "1000001"}
+        session["card_info"] = "tok_visa"
+        session.save()
+        url = reverse("main:final_confirmation")
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertFalse(Order.objects.filter(product=self.product).exists())
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        suggestions._query_counts.clear()
+        self.addCleanup(suggestions._query_counts.clear)
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genres = [
+            Genre.objects.create(name=name, image=f"genre_image/{name}.png")
+            for name in ("本", "服")
+        ]
+        self.products = [
+            Product.objects.create(
+                exhibitor=seller,
+                name=f"{genres[i % 2].name}{i}",
+                explanation="",
+                genre=genres[i % 2],
+                product_status="new",
+                sales_status="on_display",
+                value=1000,
+            )
+            for i in range(10)
+        ]
+        add_listings(seller, self.buyer, genres[0], 2)
+        Like.objects.create(user=self.buyer, product=self.products[0])
+        self.client.force_login(self.buyer)
+
+    def pks(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item.pk for item in response.context["items"]]
+
+    def test_async_views_match_sync_views(self):
+        for name in ("home", "product_list"):
+            for params in ({}, {"genre": "服"}, {"keyword": "本 1"}, {"keyword": "服"}):
+                with self.subTest(name=name, params=params):
+                    expected = self.pks(self.client.get(reverse(f"main:{name}"), params))
+                    actual = self.pks(self.client.get(reverse(f"main:async_{name}"), params))
+                    self.assertEqual(actual, expected)
+        # どちらのビューも検索されたキーワードを数える
+        self.assertEqual(suggestions._query_counts, {"本 1": 4, "服": 4})
+
+        product = self.products[0]
+        sync = self.client.get(reverse("main:product_detail", args=[product.pk]))
+        response = self.client.get(reverse("main:async_product_detail", args=[product.pk]))
+        for field in ("pk", "likes_count", "is_liked"):
+            self.assertEqual(
+                getattr(response.context["item"], field),
+                getattr(sync.context["item"], field),
+            )
+
+        for params in ({}, {"isAction": "false"}):
+            sync = self.client.get(reverse("main:notification"), params)
+            response = self.client.get(reverse("main:async_notification"), params)
+            self.assertEqual(
+                [n.pk for n in response.context["notifications"]],
+                [n.pk for n in sync.context["notifications"]],
+            )
+
+    def test_anonymous_users_are_redirected_to_login(self):
+        self.client.logout()
+        for url in (
+            reverse("main:async_home"),
+            reverse("main:async_product_list") + "?keyword=book",
+            reverse("main:async_product_detail", args=[self.products[0].pk]),
+            reverse("main:async_notification"),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertRedirects(
+                    response,
+                    f"{reverse('account_login')}?next={quote(url)}",
+                    fetch_redirect_response=False,
+                )
+        self.assertEqual(async_views.home.__name__, "home")
+
+
+class BulkShipOrdersTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        other_seller = User.objects.create_user("other", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genre = Genre.objects.create(name="本")
+        orders = add_listings(self.seller, self.buyer, genre, 4)[1]
+        self.pending = [o for o in orders if o.delivery_status == "before_shipping"]
+        self.shipped = [o for o in orders if o.delivery_status == "shipped"]
+        self.others = add_listings(other_seller, self.buyer, genre, 2)[1]
+        self.client.force_login(self.seller)
+
+    def ship(self, orders):
+        return self.client.post(
+            reverse("main:bulk_ship_orders"), {"order_ids": [o.pk for o in orders]}
+        )
+
+    def buyer_notifications(self):
+        return Notification.objects.filter(user=self.buyer, is_action=False).count()
+
+    def statuses(self):
+        return dict(Order.objects.values_list("pk", "delivery_status"))
+
+    def test_pending_orders_are_shipped_and_notified_once(self):
+        before = self.buyer_notifications()
+        self.assertEqual(self.ship(self.pending).status_code, 302)
+        self.assertTrue(all(self.statuses()[o.pk] == "shipped" for o in self.pending))
+        self.assertEqual(self.buyer_notifications(), before + len(self.pending))
+        rollup = DailySalesRollup.objects.get(seller=self.seller)
+        self.assertEqual(rollup.shipped_count, len(self.pending) + len(self.shipped))
+
+        # 同じ注文をもう一度送っても通知しない
+        self.assertEqual(self.ship(self.pending).status_code, 404)
+        self.assertEqual(self.buyer_notifications(), before + len(self.pending))
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.shipped_count, len(self.pending) + len(self.shipped))
+
+    def test_orders_of_other_sellers_or_already_shipped_are_refused(self):
+        before = (self.statuses(), self.buyer_notifications())
+        for orders in (self.pending + self.others[:1], self.pending + self.shipped[:1]):
+            with self.subTest(orders=[o.pk for o in orders]):
+                self.assertEqual(self.ship(orders).status_code, 404)
+                self.assertEqual((self.statuses(), self.buyer_notifications()), before)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", password="pw-xyz-123")
+        buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        self.genre = Genre.objects.create(name="本")
+        add_listings(self.seller, buyer, self.genre, 2)
+        self.orders = add_listings(self.seller, buyer, None, 2)[1]
+
+    def test_orders_without_genre_share_one_row(self):
+        rollup = DailySalesRollup.objects.get(seller=self.seller, genre__isnull=True)
+        self.assertEqual(rollup.order_count, len(self.orders))
+        sales_rollups.order_created(self.orders[0])
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.order_count, len(self.orders) + 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailySalesRollup.objects.create(
+                seller=self.seller, day=rollup.day, prefecture=rollup.prefecture
+            )
+
+    def test_deleting_a_genre_keeps_its_rows_apart(self):
+        self.genre.delete()
+        rollups = DailySalesRollup.objects.filter(seller=self.seller)
+        self.assertEqual(rollups.count(), 2)
+        self.assertEqual(rollups.filter(genre__isnull=True).count(), 1)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyers = [
+            User.objects.create_user(f"buyer{i}", password="pw-xyz-123") for i in range(2)
+        ]
+        self.products = [
+            Product.objects.create(
+                exhibitor=seller,
+                name=f"本{i}",
+                explanation="",
+                product_status="new",
+                sales_status="on_display",
+                value=1000,
+            )
+            for i in range(3)
+        ]
+
+    def expire(self, product):
+        Reservation.objects.filter(product=product).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_only_one_buyer_holds_a_product(self):
+        first, second = self.buyers
+        product = self.products[0]
+        self.assertTrue(reservations.reserve(product, first))
+        self.assertFalse(reservations.reserve(product, second))
+        self.assertTrue(reservations.reserve(product, first))
+
+        self.client.force_login(second)
+        url = reverse("main:purchase_confirmation", args=[product.pk])
+        self.assertEqual(self.client.get(url).status_code, 409)
+
+        # 期限が切れた仮押さえは他のユーザーが取り直せる
+        self.expire(product)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(Reservation.objects.get(product=product).user, second)
+        self.assertFalse(reservations.reserve(product, first))
+        self.assertFalse(reservations.renew(product, first))
+
+    def test_renew_extends_an_expired_hold_that_was_not_taken(self):
+        buyer = self.buyers[0]
+        product = self.products[0]
+        self.assertFalse(reservations.renew(product, buyer))
+        reservations.reserve(product, buyer)
+        self.expire(product)
+        self.assertTrue(reservations.renew(product, buyer))
+        self.assertGreater(Reservation.objects.get().expires_at, timezone.now())
+
+    def test_sweep_deletes_only_expired_holds(self):
+        for product, buyer in zip(self.products, self.buyers * 2):
+            reservations.reserve(product, buyer)
+        self.expire(self.products[0])
+        self.expire(self.products[1])
+        out = io.StringIO()
+        call_command("sweep_reservations", batch_size=1, stdout=out)
+        self.assertIn("2 件", out.getvalue())
+        self.assertEqual(
+            list(Reservation.objects.values_list("product", flat=True)),
+            [self.products[2].pk],
+        )
+
+
+class CheckoutPointsTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genre = Genre.objects.create(name="本")
+        self.product = Product.objects.create(
+            exhibitor=seller,
+            name="本",
+            explanation="",
+            genre=genre,
+            product_status="new",
+            sales_status="on_display",
+            value=1000,
+        )
+        points.record((self.buyer.pk, 500, "adjustment", None))
+        self.client.force_login(self.buyer)
+        session = self.client.session
+        session["item_pk_info"] = self.product.pk
+        session["purchase_info"] = {"point": 300, "total_amount": 700}
+        session["address_info"] = {
+            "first_name": "太郎",
+            "last_name": "山田",
+            "first_name_kana": "タロウ",
+            "last_name_kana": "ヤマダ",
+            "postal_code": "1000001",
+            "prefecture": "東京都",
+            "address": "千代田1-1",
+            "tel": "0312345678",
+        }
+        session["card_info"] = "tok_visa"
+        session.save()
+        self.url = reverse("main:final_confirmation")
+        reservations.reserve(self.product, self.buyer)
+
+    def test_points_are_returned_when_the_charge_fails(self):
+        error = payments.PaymentError("カードが拒否されました。")
+        with mock.patch.object(payments, "charge", side_effect=error):
+            self.assertContains(self.client.post(self.url), "カードが拒否されました。")
+        self.assertEqual(points.balance(self.buyer.pk), 500)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_checkout_requires_a_hold(self):
+        Reservation.objects.all().delete()
+        with mock.patch.object(payments, "charge") as charge:
+            response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 409)
+        charge.assert_not_called()
+        self.assertEqual(points.balance(self.buyer.pk), 500)
+
+        # 期限が切れて他のユーザーに取られた仮押さえでも断る
+        reservations.reserve(self.product, self.buyer)
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        other = User.objects.create_user("other", password="pw-xyz-123")
+        self.assertTrue(reservations.reserve(self.product, other))
+        with mock.patch.object(payments, "charge") as charge:
+            self.assertEqual(self.client.post(self.url).status_code, 409)
+        charge.assert_not_called()
+
+    def test_points_are_spent_with_the_order(self):
+        with mock.patch.object(payments, "charge", return_value={"id": "ch_1"}):
+            response = self.client.post(self.url)
+        self.assertRedirects(
+            response,
+            reverse("main:product_detail", args=[self.product.pk]),
+            fetch_redirect_response=False,
+        )
+        order = Order.objects.get(product=self.product)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertEqual(points.balance(self.buyer.pk), 200)
+        self.assertEqual(
+            PointTransaction.objects.get(user=self.buyer, reason="purchase").order,
+            order,
+        )
+
+
+class NotificationViewTests(TestCase):
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        seller = User.objects.create_user("seller", password="pw-xyz-123")
+        self.buyer = User.objects.create_user("buyer", password="pw-xyz-123")
+        genre = Genre.objects.create(name="本")
+        add_listings(seller, self.buyer, genre, 35)
+        self.client.force_login(self.buyer)
+
+    def test_tabs_and_pages(self):
+        for url in (reverse("main:notification"), reverse("main:async_notification")):
+            with self.subTest(url=url):
+                response = self.client.get(url, {"isAction": "false"})
+                page = response.context["page_obj"]
+                self.assertEqual(page.paginator.count, 35)
+                self.assertTrue(all(not n.is_action for n in page.object_list))
+                self.assertContains(response, "?isAction=false&page=2")
+                response = self.client.get(url, {"isAction": "false", "page": 2})
+                self.assertEqual(len(response.context["notifications"]), 5)
+                # 購入者にはアクションの通知がない
+                response = self.client.get(url)
+                self.assertEqual(response.context["page_obj"].paginator.count, 0)
+
+    def test_read_requires_post(self):
+        notification = Notification.objects.filter(user=self.buyer).earliest("pk")
+        url = reverse("main:notification_read", args=[notification.pk])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertRedirects(
+            self.client.post(url),
+            reverse("main:product_detail", args=[notification.order.product_id]),
+            fetch_redirect_response=False,
+        )
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_read)
+
+
+class PerformanceData:
+    # 購入者と出品者の画面で共通のデータ
+    baseline_file = Path(__file__).resolve().parent / "perf_baselines.json"
+    size = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "pw-xyz-123")
+        cls.buyer = User.objects.create_user("buyer", "buyer@example.com", "pw-xyz-123")
+        cls.genre = Genre.objects.create(name="本", image="genre_image/book.png")
+        on_display, orders = add_listings(cls.seller, cls.buyer, cls.genre, cls.size)
+        cls.product = on_display[0]
+        cls.order = orders[1]
+
+    def grow(self):
+        add_listings(self.seller, self.buyer, self.genre, self.size * 5)
+
+
+@PERFORMANCE_SETTINGS
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET, LOAD_STATUS_TOKEN=STATUS_TOKEN)
+class BuyerViewPerformanceTests(PerformanceData, ViewPerformanceMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.buyer)
+        # 購入手続きの各画面を開けるように、途中までの入力をセッションに入れておく
+        session = self.client.session
+        session["item_pk_info"] = self.product.pk
+        session["purchase_info"] = {"point": 0, "total_amount": self.product.value}
+        session["address_info"] = {"postal_code": "1000001"}
+        session["card_info"] = "tok_visa"
+        session.save()
+
+    def cases(self):
+        pk = self.product.pk
+        event = json.dumps(charge_refunded("evt_1", "ch_1", 1000, True, 100)).encode()
+        return [
+            Case("home", reverse("main:home"), 5),
+            Case("home?keyword", reverse("main:home"), 5, data={"keyword": "商品"}),
+            Case("product_list", reverse("main:product_list"), 4),
+            Case("product_list?genre", reverse("main:product_list"), 4, data={"genre": "本"}),
+            Case("search_suggestions", reverse("main:search_suggestions"), 1, data={"q": "商"}),
+            Case("product_detail", reverse("main:product_detail", args=[pk]), 5),
+            Case("like", reverse("main:like", args=[pk]), 3, method="POST", status=302),
+            Case("unlike", reverse("main:unlike", args=[pk]), 3, method="POST", status=302),
+            Case("like_toggle", reverse("main:like_toggle", args=[pk]), 3, method="POST"),
+            Case("purchase_confirmation", reverse("main:purchase_confirmation", args=[pk]), 9),
+            Case("address", reverse("main:address"), 1),
+            # 郵便番号のファイルがない環境では見つからない扱いになる
+            Case(
+                "postal_code_lookup",
+                reverse("main:postal_code_lookup"),
+                1,
+                data={"code": "1000001"},
+                status=404,
+            ),
+            Case("payment", reverse("main:payment"), 3),
+            Case("final_confirmation", reverse("main:final_confirmation"), 3),
+            Case(
+                "stripe_webhook",
+                reverse("main:stripe_webhook"),
+                2,
+                method="POST",
+                data=event,
+                extra={"content_type": "application/json", "HTTP_STRIPE_SIGNATURE": sign(event)},
+            ),
+            Case(
+                "load_status",
+                reverse("main:load_status"),
+                1,
+                extra={"HTTP_X_STATUS_TOKEN": STATUS_TOKEN},
+            ),
+            Case("account", reverse("main:account"), 4),
+            Case("point_history", reverse("main:point_history"), 5),
+            Case("terms", reverse("main:terms"), 1),
+            Case("privacy_policy", reverse("main:privacy_policy"), 1),
+            Case("account_delete", reverse("main:account_delete"), 2),
+            Case("account_delete_done", reverse("main:account_delete_done"), 1),
+            Case("account_detail", reverse("main:account_detail", args=[self.seller.pk]), 5),
+            Case("liked_list", reverse("main:liked_list"), 4),
+            Case("purchased_list", reverse("main:purchased_list"), 4),
+            Case(
+                "purchased_list?other",
+                reverse("main:purchased_list"),
+                4,
+                data={"delivery_status": "other"},
+            ),
+            Case("account_update", reverse("main:account_update"), 3),
+            Case("async_home", reverse("main:async_home"), 5),
+            Case("async_product_list", reverse("main:async_product_list"), 4),
+            Case("async_product_detail", reverse("main:async_product_detail", args=[pk]), 4),
+        ]
+
+
+@PERFORMANCE_SETTINGS
+class SellerViewPerformanceTests(PerformanceData, ViewPerformanceMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.seller)
+
+    def cases(self):
+        notification = Notification.objects.filter(user=self.seller).earliest("pk")
+        return [
+            Case("seller:product_sell", reverse("main:product_sell"), 3),
+            Case("seller:product_bulk_import", reverse("main:product_bulk_import"), 2),
+            Case(
+                "seller:change_delivery_status",
+                reverse("main:change_delivery_status", args=[self.order.pk]),
+                6,
+                method="POST",
+                status=302,
+            ),
+            Case(
+                "seller:bulk_ship_orders",
+                reverse("main:bulk_ship_orders"),
+                8,
+                method="POST",
+                data={"order_ids": [self.order.pk]},
+                status=302,
+            ),
+            Case(
+                "seller:delete_product",
+                reverse("main:delete_product", args=[self.product.pk]),
+                11,
+                method="POST",
+                status=302,
+            ),
+            Case("seller:exhibited_list", reverse("main:exhibited_list"), 4),
+            Case(
+                "seller:exhibited_list?before_shipping",
+                reverse("main:exhibited_list"),
+                4,
+                data={"salesStatus": "before_shipping"},
+            ),
+            Case("seller:notification", reverse("main:notification"), 5),
+            Case(
+                "seller:notification_read",
+                reverse("main:notification_read", args=[notification.pk]),
+                4,
+                method="POST",
+                status=302,
+            ),
+            Case(
+                "seller:notification_read_all",
+                reverse("main:notification_read_all"),
+                3,
+                method="POST",
+                status=302,
+            ),
+            Case("seller:sales_dashboard", reverse("main:sales_dashboard"), 6),
+            Case("seller:async_notification", reverse("main:async_notification"), 5),
+        ]
@@ -1,11 +1,12 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = "main"
 urlpatterns = [
     path("home", views.HomeView.as_view(), name="home"),
     path("product_list/", views.ProductListView.as_view(), name="product_list"),
+    path("search_suggestions/", views.search_suggestions, name="search_suggestions"),
     path(
         "product_detail/<int:pk>/",
         views.ProductDetailView.as_view(),
@@ -13,7 +14,13 @@ urlpatterns = [
     ),
     path("like/<int:pk>/", views.product_like, name="like"),
     path("unlike/<int:pk>/", views.product_unlike, name="unlike"),
+    path("like/<int:pk>/toggle/", views.product_like_toggle, name="like_toggle"),
     path("product_sell/", views.product_sell, name="product_sell"),
+    path(
+        "product_sell/bulk/",
+        views.product_bulk_import,
+        name="product_bulk_import",
+    ),
     path(
         "purchase_confirmation/<int:pk>/",
         views.PurchaseConfirmationView.as_view(),
@@ -22,6 +29,11 @@ urlpatterns = [
     path(
         "purchase_procedure/address/", views.InputAddressView.as_view(), name="address"
     ),
+    path(
+        "purchase_procedure/postal_code/",
+        views.postal_code_lookup,
+        name="postal_code_lookup",
+    ),
     path(
         "purchase_procedure/payment/", views.InputPaymentView.as_view(), name="payment"
     ),
@@ -30,17 +42,21 @@ urlpatterns = [
         views.CreateCheckoutView.as_view(),
         name="final_confirmation",
     ),
+    path("stripe/webhook/", views.stripe_webhook, name="stripe_webhook"),
+    path("status/load/", views.load_status, name="load_status"),
     path(
         "change_delivery_status/<int:pk>/",
         views.change_delivery_status,
         name="change_delivery_status",
     ),
+    path("bulk_ship_orders/", views.bulk_ship_orders, name="bulk_ship_orders"),
     path("delete_product/<int:pk>/", views.delete_product, name="delete_product"),
     path(
     "account/",
     views.AccountView.as_view(),
     name="account",
     ),
+    path("point_history/", views.PointHistoryView.as_view(), name="point_history"),
     path(
         "terms/",
         views.TermsView.as_view(),
@@ -81,4 +97,28 @@ urlpatterns = [
     name="account_update",
     ),
     path("notification/", views.NotificationView.as_view(), name="notification"),
+    path(
+        "notification/<int:pk>/read/",
+        views.notification_read,
+        name="notification_read",
+    ),
+    path(
+        "notification/read_all/",
+        views.notification_read_all,
+        name="notification_read_all",
+    ),
+    path(
+        "sales_dashboard/",
+        views.SalesDashboardView.as_view(),
+        name="sales_dashboard",
+    ),
+    # ASGI 用の非同期版。同期版と同じテンプレートを返す
+    path("async/home", async_views.home, name="async_home"),
+    path("async/product_list/", async_views.product_list, name="async_product_list"),
+    path(
+        "async/product_detail/<int:pk>/",
+        async_views.product_detail,
+        name="async_product_detail",
+    ),
+    path("async/notification/", async_views.notification, name="async_notification"),
 ]
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .background import Periodic
+from .hyperloglog import HyperLogLog
+from .models import Product, ProductViewStats
+
+_lock = threading.Lock()
+_pending = {}  # 商品 ID -> [閲覧数, 閲覧したユーザーの HyperLogLog]
+
+
+def _add(product_id, hits, sketch):
+    entry = _pending.get(product_id)
+    if entry is None:
+        _pending[product_id] = [hits, sketch]
+    else:
+        entry[0] += hits
+        entry[1].merge(sketch)
+
+
+def record(product, viewer_id):
+    """商品の閲覧をプロセス内に溜める。出品者自身の閲覧は数えない。
+
+    データベースには書き込まず、反映は flush がまとめて行う。
+    """
+    if product.exhibitor_id == viewer_id:
+        return
+    with _lock:
+        entry = _pending.get(product.pk)
+        if entry is None:
+            entry = _pending[product.pk] = [
+                0,
+                HyperLogLog(settings.VIEW_TRACKING_PRECISION),
+            ]
+        entry[0] += 1
+        entry[1].add(viewer_id)
+    _flusher.start()
+
+
+def flush():
+    """溜まった閲覧を ProductViewStats にまとめて反映し、反映した商品の数を返す。
+
+    スケッチはレジスタの最大値でまとめるので、複数のプロセスが同じ商品を反映しても
+    ユニーク数は重複しない。書き込めなかった分はバッファに戻す。
+    """
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return 0
+    try:
+        return _apply(pending)
+    except Exception:
+        with _lock:
+            for product_id, (hits, sketch) in pending.items():
+                _add(product_id, hits, sketch)
+        raise
+
+
+def _apply(pending):
+    # 反映までに削除された商品は無視する
+    live = set(Product.objects.filter(pk__in=pending).values_list("pk", flat=True))
+    if not live:
+        return 0
+    now = timezone.now()
+    with transaction.atomic():
+        ProductViewStats.objects.bulk_create(
+            [ProductViewStats(product_id=pk) for pk in live],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+        rows = list(
+            ProductViewStats.objects.select_for_update().filter(product_id__in=live)
+        )
+        for row in rows:
+            hits, sketch = pending[row.product_id]
+            stored = bytes(row.sketch)
+            # precision を変えたときは古いスケッチを捨てて数え直す
+            if len(stored) == len(sketch.registers):
+                sketch.merge(HyperLogLog.from_bytes(stored))
+            row.hits += hits
+            row.sketch = sketch.to_bytes()
+            row.unique_viewers = sketch.count()
+            row.updated_at = now
+        ProductViewStats.objects.bulk_update(
+            rows, ["hits", "unique_viewers", "sketch", "updated_at"], batch_size=500
+        )
+    return len(rows)
+
+
+_flusher = Periodic("view-tracking", flush, "VIEW_TRACKING_FLUSH_INTERVAL")
+
+
+def _reset_after_fork():
+    # fork した子プロセスは親のバッファを引き継がない (親が反映する)
+    global _lock, _pending
+    _lock = threading.Lock()
+    _pending = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
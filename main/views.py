@@ -1,13 +1,17 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth import get_user_model
+from django.contrib.auth import get_user_model, logout
+from django.db import transaction
 from django.db.models import Count, Exists, OuterRef
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.urls import reverse_lazy, reverse
 from django.conf import settings
-from django.http import Http404
-import stripe
+from django.http import Http404, HttpResponse, JsonResponse
+from django.core.paginator import Paginator
+from django.utils import timezone
+from datetime import timedelta
 
 from django.views.generic import (
     ListView,
@@ -27,11 +31,30 @@ from .models import (
     Payment,
     Order,
     Notification,
+    PointTransaction,
 )
 
+from . import (
+    bulk_import,
+    counters,
+    like_buffer,
+    load_shedding,
+    notifications,
+    payments,
+    points,
+    postal_codes,
+    reservations,
+    sales_rollups,
+    seller_stats,
+    suggestions,
+    view_tracking,
+    webhooks,
+)
+from .account_deletion import request_deletion
 from .forms import (
     CustomProductImageFormSet,
     PaymentForm,
+    ProductBulkImportForm,
     ProductSearchForm,
     ProductSellForm,
     AddressForm,
@@ -50,9 +73,9 @@ class HomeView(LoginRequiredMixin, ListView):
         queryset = super().get_queryset()
         queryset = (
             queryset.exclude(exhibitor=self.request.user)
-            .filter(sales_status="on_display")
+            .filter(sales_status="on_display", exhibitor__is_active=True)
             .prefetch_related("product_images")
-            .order_by("-uploaded_at")[:6]
+            .order_by("-uploaded_at")
         )
         genre = self.request.GET.get("genre")
         if genre:
@@ -61,10 +84,12 @@ class HomeView(LoginRequiredMixin, ListView):
         if search_form.is_valid():
             keyword = search_form.cleaned_data["keyword"]
             if keyword:
+                suggestions.query_searched(keyword)
                 keywords = keyword.split()
                 for k in keywords:
                     queryset = queryset.filter(name__icontains=k)
-        return queryset
+        # 絞り込んでから件数を制限する
+        return queryset[:6]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -77,38 +102,93 @@ class ProductListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.prefetch_related("product_images").order_by("-uploaded_at")
+        queryset = (
+            queryset.filter(exhibitor__is_active=True)
+            .prefetch_related("product_images")
+            .order_by("-uploaded_at")
+        )
         genre = self.request.GET.get("genre")
         if genre:
             queryset = queryset.filter(genre__name=genre)
+        # ヘッダーの検索フォームはこのページに送信される
+        search_form = ProductSearchForm(self.request.GET)
+        if search_form.is_valid():
+            keyword = search_form.cleaned_data["keyword"]
+            if keyword:
+                suggestions.query_searched(keyword)
+                for k in keyword.split():
+                    queryset = queryset.filter(name__icontains=k)
         return queryset
 
+@login_required
+def search_suggestions(request):
+    return JsonResponse(
+        {"suggestions": suggestions.suggest(request.GET.get("q", ""))}
+    )
+
 @require_POST
 def product_like(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    Like.objects.create(user=request.user, product=product)
+    like_buffer.set_state(request.user.pk, product.pk, True)
     return redirect("main:product_detail", pk)
 
 
 @require_POST
 def product_unlike(request, pk):
     product = get_object_or_404(Product, pk=pk)
-    Like.objects.filter(user=request.user, product=product).delete()
+    like_buffer.set_state(request.user.pk, product.pk, False)
     return redirect("main:product_detail", pk)
 
+
+@login_required
+@require_POST
+def product_like_toggle(request, pk):
+    # いいねの切り替えはバッファに書き込むだけで、Like テーブルへはまとめて反映する
+    product = get_object_or_404(
+        Product.objects.annotate(
+            likes_count=Count("likes_received"),
+            is_liked=Exists(
+                Like.objects.filter(user=request.user, product=OuterRef("pk"))
+            ),
+            pending_like=like_buffer.pending_state(request.user),
+        ),
+        pk=pk,
+    )
+    liked = not like_buffer.is_liked(product.is_liked, product.pending_like)
+    like_buffer.set_state(request.user.pk, product.pk, liked)
+    likes_count = like_buffer.likes_count(product.is_liked, product.likes_count, liked)
+    return JsonResponse({"liked": liked, "likes_count": likes_count})
+
 class ProductDetailView(LoginRequiredMixin, DetailView):
     model = Product
     context_object_name = "item"
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.select_related("exhibitor", "genre").annotate(
-            likes_count=Count("likes_received"),
-            is_liked=Exists(
-                Like.objects.filter(user=self.request.user, product=OuterRef("pk"))
-            ),
+        queryset = (
+            # 退会手続き中の出品者の商品は開けない
+            queryset.filter(exhibitor__is_active=True)
+            .select_related("exhibitor", "genre", "view_stats")
+            .defer("view_stats__sketch")
+            .annotate(
+                likes_count=Count("likes_received"),
+                is_liked=Exists(
+                    Like.objects.filter(user=self.request.user, product=OuterRef("pk"))
+                ),
+                pending_like=like_buffer.pending_state(self.request.user),
+            )
         )
         return queryset
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        # まだ反映されていない自分のいいねを表示に反映する
+        obj.likes_count = like_buffer.likes_count(
+            obj.is_liked, obj.likes_count, obj.pending_like
+        )
+        obj.is_liked = like_buffer.is_liked(obj.is_liked, obj.pending_like)
+        view_tracking.record(obj, self.request.user.pk)
+        return obj
     
 @login_required
 def product_sell(request):
@@ -128,6 +208,8 @@ def product_sell(request):
             new_product.exhibitor = request.user
             new_product.sales_status = "on_display"
             new_product.save()
+            seller_stats.product_listed(request.user.pk)
+            suggestions.product_added(new_product)
             new_product_images = product_image_formset.save(commit=False)
             for new_product_image in new_product_images:
                 if new_product_image.image:
@@ -140,6 +222,36 @@ def product_sell(request):
     }
     return render(request, "main/product_sell.html", context)
 
+@login_required
+def product_bulk_import(request):
+    result = None
+    if request.method == "POST":
+        form = ProductBulkImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = bulk_import.import_listings(
+                request.user,
+                form.cleaned_data["csv_file"],
+                form.cleaned_data["image_zip"],
+                form.cleaned_data["encoding"],
+            )
+    else:
+        form = ProductBulkImportForm()
+    context = {"form": form, "result": result, "columns": bulk_import.COLUMNS}
+    return render(request, "main/product_bulk_import.html", context)
+
+def reservation_error(request, product, renew=False):
+    # 売れた商品と他のユーザーが手続き中の商品は、決済の前に断る
+    # renew のときは新しく仮押さえせず、手続きに入ったときの仮押さえがなければ断る
+    if product.sales_status != "on_display":
+        message = "この商品は売り切れました。"
+    elif renew and not reservations.renew(product, request.user):
+        message = "購入手続きの期限が切れました。もう一度購入手続きをやり直してください。"
+    elif not renew and not reservations.reserve(product, request.user):
+        message = "他の方が購入手続き中です。しばらくしてから再度お試しください。"
+    else:
+        return None
+    return render(request, "main/error.html", {"message": message}, status=409)
+
 class PurchaseConfirmationView(LoginRequiredMixin, FormView):
     template_name = "main/purchase_confirmation.html"
     form_class = PaymentForm
@@ -147,13 +259,22 @@ class PurchaseConfirmationView(LoginRequiredMixin, FormView):
 
     def dispatch(self, request, *args, **kwargs):
         self.item = get_object_or_404(
-            Product.objects.prefetch_related("product_images"), pk=self.kwargs["pk"]
+            Product.objects.filter(exhibitor__is_active=True).prefetch_related(
+                "product_images"
+            ),
+            pk=self.kwargs["pk"],
         )
+        if request.user.is_authenticated:
+            # 購入手続きに入った時点で商品を仮押さえする
+            error = reservation_error(request, self.item)
+            if error:
+                return error
         return super().dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["item"] = self.item
+        context["point_balance"] = self.point_balance
         return context
 
     def form_valid(self, form):
@@ -164,6 +285,8 @@ class PurchaseConfirmationView(LoginRequiredMixin, FormView):
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs["price"] = self.item.value
+        self.point_balance = points.balance(self.request.user.pk)
+        kwargs["point_balance"] = self.point_balance
         return kwargs
 
 class InputAddressView(LoginRequiredMixin, FormView):
@@ -180,6 +303,14 @@ class InputAddressView(LoginRequiredMixin, FormView):
         self.request.session["address_info"] = form.cleaned_data
         return super().form_valid(form)
 
+@login_required
+def postal_code_lookup(request):
+    # 住所入力フォームの自動入力用
+    result = postal_codes.lookup(request.GET.get("code", ""))
+    if result is None:
+        return JsonResponse({"error": "郵便番号が見つかりません"}, status=404)
+    return JsonResponse(result)
+
 class InputPaymentView(LoginRequiredMixin, TemplateView):
     template_name = "main/input_payment.html"
 
@@ -192,7 +323,10 @@ class InputPaymentView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         item_pk = self.request.session["item_pk_info"]
         item = get_object_or_404(
-            Product.objects.prefetch_related("product_images"), pk=item_pk
+            Product.objects.filter(exhibitor__is_active=True).prefetch_related(
+                "product_images"
+            ),
+            pk=item_pk,
         )
         context["item"] = item
         context["STRIPE_PUBLISHABLE_KEY"] = settings.STRIPE_PUBLISHABLE_KEY
@@ -224,7 +358,10 @@ class CreateCheckoutView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         item = get_object_or_404(
-            Product.objects.prefetch_related("product_images"), pk=self.item_pk
+            Product.objects.filter(exhibitor__is_active=True).prefetch_related(
+                "product_images"
+            ),
+            pk=self.item_pk,
         )
         context["item"] = item
         context["purchase"] = self.purchase_info
@@ -232,21 +369,60 @@ class CreateCheckoutView(LoginRequiredMixin, TemplateView):
         return context
 
     def post(self, request, *args, **kwargs):
-        stripe.api_key = settings.STRIPE_API_KEY
+        product = get_object_or_404(
+            Product, pk=self.item_pk, exhibitor__is_active=True
+        )
+        # 決済の直前に仮押さえを確かめて、期限を延ばす
+        error = reservation_error(request, product, renew=True)
+        if error:
+            return error
+        # 決済の前にポイントを使う。同時に手続きしても同じポイントは二重に使えない
+        spent = None
+        used_point = int(self.purchase_info["point"])
+        if used_point:
+            spent = points.spend(request.user.pk, used_point)
+            if spent is None:
+                return render(
+                    request,
+                    "main/error.html",
+                    {"message": "保有ポイントが不足しています。"},
+                )
         price = self.purchase_info["total_amount"]
         try:
-            charge = stripe.Charge.create(
-                amount=int(price),
-                currency="jpy",
-                source=self.stripe_token,
-                description="FreeMa",
+            charge = payments.charge(
+                price,
+                self.stripe_token,
+                # 二重送信や再試行で同じ手続きが二重に決済されないようにする
+                payments.idempotency_key(
+                    "checkout", request.user.pk, product.pk, self.stripe_token
+                ),
             )
-        except stripe.error.CardError:
+        except payments.PaymentError as e:
+            points.cancel(spent)
+            # 決済をやり直すときは購入手続きから仮押さえを取り直す
+            reservations.release(product, request.user)
             return render(
                 request,
                 "main/error.html",
-                {"message": "決済に失敗しました。"},
+                {"message": e.message},
+                status=503 if e.retryable else 200,
             )
+        try:
+            with transaction.atomic():
+                order = self.save_order(product, price, charge, spent)
+        except Exception:
+            points.cancel(spent)
+            raise
+        reservations.release(product, request.user)
+        suggestions.product_sold(product)
+        # セッションの削除
+        del self.request.session["item_pk_info"]
+        del self.request.session["purchase_info"]
+        del self.request.session["address_info"]
+        del self.request.session["card_info"]
+        return redirect("main:product_detail", self.item_pk)
+
+    def save_order(self, product, price, charge, spent):
         # データベースの保存
         # Aderess
         address = Address.objects.create(
@@ -261,15 +437,14 @@ class CreateCheckoutView(LoginRequiredMixin, TemplateView):
         )
         # Payment
         payment = Payment.objects.create(
-            user=request.user, stripe_charge_id=charge["id"]
+            user=self.request.user, stripe_charge_id=charge["id"]
         )
         # Order
         # 商品履歴の作成
-        product = get_object_or_404(Product, pk=self.item_pk)
         order = Order.objects.create(
             product=product,
             price=price,
-            purchaser=request.user,
+            purchaser=self.request.user,
             delivery_status="before_shipping",
             address=address,
             payment=payment,
@@ -277,42 +452,93 @@ class CreateCheckoutView(LoginRequiredMixin, TemplateView):
         # 購入済みにする
         product.sales_status = "sold"
         product.save()
+        seller_stats.product_sold(product)
+        sales_rollups.order_created(order)
         # ポイントの付与と削除
-        # 購入者のポイントを削除
-        request.user.point -= int(self.request.session["purchase_info"]["point"])
-        request.user.save()
-        # 出品者にポイントを付与
-        exhibitor = product.exhibitor
+        # ユーザーの行は更新せず、台帳に出品者の獲得を追記し、購入者の利用を注文に結びつける
+        if spent is not None:
+            PointTransaction.objects.filter(pk=spent.pk).update(order=order)
         point = product.value - int(product.value * 0.1)
-        exhibitor.point += point
-        exhibitor.save()
+        points.record((product.exhibitor_id, point, "sale", order))
         # 出品者に対する通知の生成
-        Notification.objects.create(user=exhibitor, order=order, is_action=True)
-        # セッションの削除
-        del self.request.session["item_pk_info"]
-        del self.request.session["purchase_info"]
-        del self.request.session["address_info"]
-        del self.request.session["card_info"]
-        return redirect("main:product_detail", self.item_pk)
+        notifications.notify(product.exhibitor_id, order, is_action=True)
+        return order
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    # 署名を確かめて受信箱に追記するだけにする。反映は process_webhooks で行う
+    payload = request.body
+    try:
+        webhooks.verify_signature(
+            payload,
+            request.META.get("HTTP_STRIPE_SIGNATURE"),
+            settings.STRIPE_WEBHOOK_SECRET,
+            settings.STRIPE_WEBHOOK_TOLERANCE,
+        )
+        webhooks.receive(payload)
+    except (webhooks.SignatureError, ValueError, KeyError):
+        return HttpResponse(status=400)
+    return HttpResponse(status=200)
 
 @require_POST
 def change_delivery_status(request, pk):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related("product", "address"), pk=pk)
     if order.delivery_status == "before_shipping":
         order.delivery_status = "shipped"
         order.save()
+        sales_rollups.orders_status_changed([order], "shipped")
         # 購入者に対する通知の作成
-        purchaser = order.purchaser
-        Notification.objects.create(user=purchaser, order=order, is_action=False)
+        notifications.notify(order.purchaser_id, order, is_action=False)
     elif order.delivery_status == "shipped":
         order.delivery_status = "delivered"
         order.save()
+        sales_rollups.orders_status_changed([order], "delivered")
     return redirect("main:product_detail", order.product.pk)
 
+@login_required
+@require_POST
+def bulk_ship_orders(request):
+    order_ids = request.POST.getlist("order_ids")
+    if not order_ids or not all(order_id.isdigit() for order_id in order_ids):
+        return redirect("main:exhibited_list")
+    order_ids = {int(order_id) for order_id in order_ids}
+    with transaction.atomic():
+        # 自分の商品の発送待ちの注文だけを1回のクエリで取得して確認する
+        orders = list(
+            Order.objects.select_for_update()
+            .select_related("product", "address")
+            .filter(
+                pk__in=order_ids,
+                product__exhibitor=request.user,
+                delivery_status="before_shipping",
+            )
+        )
+        if len(orders) != len(order_ids):
+            raise Http404
+        for order in orders:
+            order.delivery_status = "shipped"
+        Order.objects.bulk_update(orders, ["delivery_status"], batch_size=500)
+        # 購入者に対する通知の作成
+        notifications.notify_many(
+            [
+                Notification(user_id=order.purchaser_id, order=order, is_action=False)
+                for order in orders
+            ]
+        )
+        sales_rollups.orders_status_changed(orders, "shipped")
+    return redirect(reverse("main:exhibited_list") + "?salesStatus=before_shipping")
+
 @require_POST
 def delete_product(request, pk):
-    product = get_object_or_404(Product, pk=pk, exhibitor=request.user)
+    product = get_object_or_404(
+        Product.objects.select_related("orders_received"), pk=pk, exhibitor=request.user
+    )
+    like_counts = counters.like_counts(Like.objects.filter(product=product))
     product.delete()
+    counters.likes_removed(like_counts)
+    seller_stats.product_removed(product)
+    suggestions.product_removed(product)
     return redirect("main:home")
 
 class AccountView(LoginRequiredMixin, DetailView):
@@ -322,6 +548,30 @@ class AccountView(LoginRequiredMixin, DetailView):
     def get_object(self):
         return self.request.user
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["point_balance"] = points.balance(self.request.user.pk)
+        return context
+
+class PointHistoryView(LoginRequiredMixin, TemplateView):
+    template_name = "main/point_history.html"
+    paginate_by = 30
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        before = self.request.GET.get("before")
+        if before is not None:
+            if not before.isdigit():
+                raise Http404
+            before = int(before)
+        transactions, next_before = points.history(
+            self.request.user.pk, before=before, limit=self.paginate_by
+        )
+        context["transactions"] = transactions
+        context["next_before"] = next_before
+        context["point_balance"] = points.balance(self.request.user.pk)
+        return context
+
 class TermsView(TemplateView):
     template_name = "main/terms.html"
 
@@ -336,32 +586,70 @@ class AccountDeleteView(LoginRequiredMixin, DeleteView):
     def get_object(self):
         return self.request.user
 
+    def form_valid(self, form):
+        # 関連データの削除はバックグラウンドのワーカーで行う
+        request_deletion(self.object)
+        logout(self.request)
+        return redirect(self.get_success_url())
+
 class AccountDeleteDoneView(TemplateView):
     template_name = "main/account_delete_done.html"
 
 class AccountDetailView(LoginRequiredMixin, DetailView):
     template_name = "main/account_detail.html"
     model = User
+    paginate_by = 30
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.prefetch_related(
-            "products_exhibited__product_images"
-        ).annotate(products_count=Count("products_exhibited"))
+        queryset = queryset.filter(is_active=True).select_related("seller_stats")
         return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # ヘッダーの件数は集計テーブルから表示し、商品一覧はページごとに取得する
+        products = (
+            Product.objects.filter(exhibitor=self.object)
+            .prefetch_related("product_images")
+            .order_by("-uploaded_at", "-pk")
+        )
+        stats = seller_stats.get_stats(self.object)
+        paginator = Paginator(products, self.paginate_by)
+        # 件数は COUNT(*) ではなく集計テーブルから取る
+        paginator.count = stats.listing_count
+        page_obj = paginator.get_page(self.request.GET.get("page"))
+        context["seller_stats"] = stats
+        context["page_obj"] = page_obj
+        context["products"] = page_obj.object_list
+        return context
     
 class ProductLikedListView(LoginRequiredMixin, ListView):
     template_name = "main/product_liked_list.html"
-    model = Product
-    context_object_name = "liked_products"
+    model = Like
+    context_object_name = "likes"
+    paginate_by = 30
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(
-            likes_received__user=self.request.user
-        ).prefetch_related("product_images")
+        queryset = (
+            queryset.filter(user=self.request.user)
+            .select_related("product")
+            .prefetch_related("product__product_images")
+            .order_by("-created_at", "-pk")
+        )
         return queryset
 
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # 件数は COUNT(*) ではなくカウンターから取る
+        paginator = super().get_paginator(queryset, per_page, **kwargs)
+        paginator.count = counters.get_counter(self.request.user).liked_count
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["liked_count"] = context["paginator"].count
+        return context
+
 class ProductExibitListView(LoginRequiredMixin, ListView):
     template_name = "main/product_exhibited_list.html"
     model = Product
@@ -369,7 +657,7 @@ class ProductExibitListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        queryset = queryset.filter(exhibitor=self.request.user).prefetch_related("product_images").order_by("-uploaded_at")
+        queryset = queryset.filter(exhibitor=self.request.user).select_related("orders_received").prefetch_related("product_images").order_by("-uploaded_at")
         if "salesStatus" in self.request.GET:
             sales_status = self.request.GET["salesStatus"]
             if sales_status:
@@ -379,6 +667,10 @@ class ProductExibitListView(LoginRequiredMixin, ListView):
                     queryset = queryset.filter(sales_status="on_display")
                 elif sales_status == "sold":
                     queryset = queryset.filter(sales_status="sold")
+                elif sales_status == "before_shipping":
+                    queryset = queryset.filter(
+                        orders_received__delivery_status="before_shipping"
+                    )
                 else:
                     raise Http404
         return queryset
@@ -425,29 +717,68 @@ class AccountUpdateView(LoginRequiredMixin, UpdateView):
     def get_object(self):
         return self.request.user
 
+class SalesDashboardView(LoginRequiredMixin, TemplateView):
+    template_name = "main/sales_dashboard.html"
+    PERIODS = [7, 30, 90, 365]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            days = int(self.request.GET.get("days", 30))
+        except ValueError:
+            raise Http404
+        if days not in self.PERIODS:
+            raise Http404
+        # 注文テーブルは集計せず、日次の集計テーブルだけを読む
+        since = timezone.localdate() - timedelta(days=days - 1)
+        context.update(sales_rollups.dashboard(self.request.user, since))
+        context["days"] = days
+        context["periods"] = self.PERIODS
+        return context
+
 class NotificationView(LoginRequiredMixin, ListView):
     template_name = "main/notification.html"
     model = Notification
     context_object_name = "notifications"
+    paginate_by = 30
 
     def get_queryset(self):
+        is_action = self.request.GET.get("isAction", "true")
+        if is_action not in ("true", "false"):
+            raise Http404
         queryset = super().get_queryset()
         queryset = (
-            queryset.filter(user=self.request.user, is_action=True)
+            queryset.filter(user=self.request.user, is_action=is_action == "true")
             .select_related("order__product")
             .prefetch_related("order__product__product_images")
             .order_by("-created_at")
         )
-        is_action = self.request.GET.get("isAction")
-        if is_action:
-            if is_action == "true":
-                queryset = queryset.filter(is_action=True)
-            elif is_action == "false":
-                queryset = queryset.filter(is_action=False)
-            else:
-                return Http404
-        else:
-            queryset = queryset.filter(is_action=True)
-        print(queryset)
         return queryset
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["is_action"] = self.request.GET.get("isAction", "true")
+        return context
+
+@login_required
+@require_POST
+def notification_read(request, pk):
+    # 通知を既読にしてから対象の商品ページへ移動する
+    notification = get_object_or_404(
+        Notification.objects.select_related("order"), pk=pk, user=request.user
+    )
+    notifications.mark_read(request.user.pk, notification.pk)
+    return redirect("main:product_detail", notification.order.product_id)
+
+@login_required
+@require_POST
+def notification_read_all(request):
+    notifications.mark_all_read(request.user.pk)
+    return redirect("main:notification")
+
+
+def load_status(request):
+    # 過負荷対策の状態。監視からはトークン、画面からはスタッフのログインで見る
+    if not load_shedding.can_view_status(request):
+        raise Http404
+    return JsonResponse(load_shedding.status())
@@ -0,0 +1,201 @@
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sales_rollups, seller_stats
+from .models import Order, Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+class SignatureError(Exception):
+    pass
+
+
+def verify_signature(payload, header, secret, tolerance, now=None):
+    """Stripe-Signature ヘッダー ("t=...,v1=...") を検証する。
+
+    stripe ライブラリは読み込みが重いので、受信時は hmac だけで検証する。
+    """
+    if not secret:
+        raise SignatureError("シークレットが設定されていません")
+    timestamp = None
+    signatures = []
+    for item in (header or "").split(","):
+        key, _, value = item.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    if timestamp is None or not timestamp.isdigit() or not signatures:
+        raise SignatureError("署名ヘッダーの形式が正しくありません")
+    expected = hmac.new(
+        secret.encode(), timestamp.encode() + b"." + payload, hashlib.sha256
+    ).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise SignatureError("署名が一致しません")
+    now = time.time() if now is None else now
+    if tolerance and abs(now - int(timestamp)) > tolerance:
+        raise SignatureError("署名の時刻が古すぎます")
+
+
+def receive(payload):
+    # 受信時は1行追記するだけにして、すぐに応答を返す
+    # 署名が正しくても形の違う本文は ValueError にする (ビューで 400 を返す)
+    event = _parse(payload)
+    return WebhookEvent.objects.create(
+        event_id=event["id"],
+        event_type=event["type"],
+        payload=payload.decode("utf-8"),
+    )
+
+
+def _parse(payload):
+    """イベントを読み込み、process_batch が使う項目がそろっていなければ ValueError にする。"""
+    event = json.loads(payload)
+    if not (
+        isinstance(event, dict)
+        and isinstance(event.get("id"), str)
+        and isinstance(event.get("type"), str)
+        and isinstance(event.get("created"), int)
+        and isinstance(event.get("data"), dict)
+        and isinstance(event["data"].get("object"), dict)
+    ):
+        raise ValueError("イベントの形式が正しくありません")
+    charge_id = _charge_id(event)
+    if charge_id is not None and not isinstance(charge_id, str):
+        raise ValueError("イベントの Charge ID が正しくありません")
+    return event
+
+
+def _charge_id(event):
+    obj = event["data"]["object"]
+    # 返金のイベントは Charge、チャージバックのイベントは Dispute が入っている
+    return obj.get("id") if obj.get("object") == "charge" else obj.get("charge")
+
+
+def _apply(payment, event):
+    """イベントを Payment に反映する。状態が変わったら True を返す。"""
+    obj = event["data"]["object"]
+    event_type = event["type"]
+    if event_type == "charge.refunded":
+        payment.amount_refunded = max(payment.amount_refunded, obj["amount_refunded"])
+        payment.status = "refunded" if obj.get("refunded") else "partially_refunded"
+    elif event_type == "charge.dispute.created":
+        payment.status = "disputed"
+    elif event_type == "charge.dispute.closed":
+        if obj.get("status") == "lost":
+            payment.status = "dispute_lost"
+        elif payment.amount_refunded:
+            payment.status = "partially_refunded"
+        else:
+            payment.status = "succeeded"
+    else:
+        return False
+    payment.last_event_at = event["created"]
+    return True
+
+
+def process_batch(batch_size=500):
+    """未処理のイベントを古い順に batch_size 件処理し、処理した件数を返す。
+
+    同じイベント ID は最初の1回だけ反映し、Payment と Order はまとめて更新する。
+    対応する Payment がまだ無いイベント (決済の保存より先に届いたもの) は処理済みにせず、
+    STRIPE_WEBHOOK_RETRY_DELAY 秒後に処理し直す。STRIPE_WEBHOOK_RETRY_MAX_AGE 秒たっても
+    Payment が無いものは捨てる。
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            # 複数のワーカーで動かしても同じ行を取り合わない
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .filter(Q(retry_at__isnull=True) | Q(retry_at__lte=now))
+            .order_by("id")[:batch_size]
+        )
+        if not rows:
+            return 0
+        already = set(
+            WebhookEvent.objects.filter(
+                event_id__in={row.event_id for row in rows},
+                processed_at__isnull=False,
+            ).values_list("event_id", flat=True)
+        )
+        events = {}
+        for row in rows:
+            if row.event_id in already or row.event_id in events:
+                continue
+            try:
+                events[row.event_id] = _parse(row.payload)
+            except ValueError:
+                # 壊れたイベントは処理済みにして、後のイベントを止めない
+                logger.warning("Webhook イベント %s を読み込めません", row.event_id)
+        # 作成時刻の順に反映する
+        events = sorted(
+            (event for event in events.values() if _charge_id(event)),
+            key=lambda event: event["created"],
+        )
+        payments = {
+            payment.stripe_charge_id: payment
+            for payment in Payment.objects.filter(
+                stripe_charge_id__in={_charge_id(event) for event in events}
+            )
+        }
+        received = {}
+        for row in rows:
+            received.setdefault(row.event_id, row.received_at)
+        expired = now - timedelta(seconds=settings.STRIPE_WEBHOOK_RETRY_MAX_AGE)
+        deferred = set()
+        changed = {}
+        for event in events:
+            payment = payments.get(_charge_id(event))
+            if payment is None:
+                if received[event["id"]] > expired:
+                    deferred.add(event["id"])
+                continue
+            if event["created"] < payment.last_event_at:
+                continue
+            try:
+                applied = _apply(payment, event)
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Webhook イベント %s を反映できません", event["id"])
+                continue
+            if applied:
+                changed[payment.pk] = payment
+        if changed:
+            Payment.objects.bulk_update(
+                changed.values(), ["status", "amount_refunded", "last_event_at"]
+            )
+            canceled = [
+                pk
+                for pk, payment in changed.items()
+                if payment.status in ("refunded", "dispute_lost")
+            ]
+            if canceled:
+                orders = list(
+                    Order.objects.select_related("product", "address").filter(
+                        payment_id__in=canceled, canceled_at__isnull=True
+                    )
+                )
+                Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+                    canceled_at=now
+                )
+                # 取り消した注文は売上の集計から除く
+                seller_stats.orders_canceled(orders)
+                sales_rollups.orders_canceled(orders)
+        if deferred:
+            WebhookEvent.objects.filter(
+                pk__in=[row.pk for row in rows if row.event_id in deferred]
+            ).update(retry_at=now + timedelta(seconds=settings.STRIPE_WEBHOOK_RETRY_DELAY))
+        WebhookEvent.objects.filter(
+            pk__in=[row.pk for row in rows if row.event_id not in deferred]
+        ).update(processed_at=now)
+    return len(rows)